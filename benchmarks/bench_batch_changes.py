@@ -0,0 +1,147 @@
+"""
+Agent round trips and tokens for multi-target combat, with and without apply_changes.
+Each round the scripted model damages every monster, hurts the player and hands out
+gold and loot, driven through NerdMasterAgent.invoke against the offline fakes in
+src/mocks.py (parameterized tool mode, so one tool can target any entity).
+
+Strategies:
+    sequential  one tool call per model reply, as the agent usually plays it
+    parallel    every tool call in one model reply (OpenAI parallel tool calls)
+    batched     one apply_changes call
+
+Tokens are counted over every model call of the round (messages plus tool schemas),
+since each call resends the whole prompt. apply_changes is only offered in the batched
+run, so its schema cost is counted there and nowhere else. The final world state must
+be the same for every strategy.
+
+Usage:
+    python benchmarks/bench_batch_changes.py --rounds 5 --monsters 3
+    python benchmarks/bench_batch_changes.py --profile realistic
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.agent import NerdMasterAgent
+from src.cache import ResponseCache
+from src.game import PARAMETERIZED_TOOLS
+from src.image_cache import ImageCache
+from src.mocks import mock_agent_kwargs, LATENCY_PROFILES
+from src.utils import count_tokens
+
+STRATEGIES = ("sequential", "parallel", "batched")
+
+
+class CallCounter(BaseCallbackHandler):
+    """Counts model calls, and the prompt and tool schema tokens sent with them."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.tool_tokens = 0
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.calls += 1
+        self.prompt_tokens += count_tokens("\n".join(str(m.content) for batch in messages for m in batch))
+        self.tool_tokens += count_tokens(json.dumps(kwargs.get("invocation_params", {}).get("tools", [])))
+
+
+def round_changes(round:int, monsters:list):
+    """The state changes of one combat round, as apply_changes operations."""
+    changes = [{"entity": name, "op": "modify_health", "amount": -(10 + 5 * i)} for i, name in enumerate(monsters)]
+    changes += [
+        {"entity": "Bob", "op": "modify_health", "amount": -4},
+        {"entity": "Bob", "op": "modify_gold", "amount": 3 * len(monsters)},
+        {"entity": "Bob", "op": "add_item", "item": "goblin ear", "amount": len(monsters)},
+    ]
+    if round % 2:
+        changes.append({"entity": "Bob", "op": "add_item", "item": f"rusty key {round}", "amount": 1})
+    return changes
+
+
+def as_tool_call(change:dict) -> dict:
+    # the same change made with the single-purpose entity tools
+    if change["op"] == "modify_health":
+        return {"name": "modify_entity_health", "args": {"entity": change["entity"], "amount": change["amount"]}}
+    if change["op"] == "modify_gold":
+        return {"name": "modify_entity_gold", "args": {"entity": change["entity"], "amount": change["amount"]}}
+    return {"name": "add_to_entity_inventory",
+            "args": {"entity": change["entity"], "item": change["item"], "quantity": change["amount"]}}
+
+
+def build_script(strategy:str, rounds:int, monsters:list):
+    script = []
+    for round in range(rounds):
+        changes = round_changes(round, monsters)
+        if strategy == "sequential":
+            script += [{"tool_calls": [as_tool_call(change)]} for change in changes]
+        elif strategy == "parallel":
+            script.append({"tool_calls": [as_tool_call(change) for change in changes]})
+        else:
+            script.append({"tool_calls": [{"name": "apply_changes", "args": {"changes": changes}}]})
+        script.append(f"Round {round + 1}: steel rings as you cut through the goblin line, and they strike back.")
+    return script
+
+
+def run(strategy:str, args, directory:str):
+    monsters = [f"Goblin{i}" for i in range(args.monsters)]
+    counter = CallCounter()
+    agent = NerdMasterAgent(
+        **mock_agent_kwargs(args.profile, seed=args.seed, script=build_script(strategy, args.rounds, monsters)),
+        tool_mode=PARAMETERIZED_TOOLS,
+        seed=args.seed,
+        response_cache=ResponseCache(),
+        image_cache=ImageCache(os.path.join(directory, strategy)),
+        callbacks=[counter],
+    )
+    nerdmaster = agent.nerdmaster
+    nerdmaster.setup_player("Bob")
+    for name in monsters:
+        nerdmaster.create_monster(name, ["club"])
+    if strategy != "batched":
+        nerdmaster._remove_tool(["game_management"], nerdmaster.apply_changes.__name__)
+    start = time.perf_counter()
+    for round in range(args.rounds):
+        agent.invoke(f"I attack every goblin, round {round + 1}.", background=True, refresh_image=False)
+    elapsed = time.perf_counter() - start
+    agent.wait_for_artifacts()
+    agent.close()
+    return {
+        "strategy": strategy,
+        "llm_calls": counter.calls,
+        "prompt_tokens": counter.prompt_tokens,
+        "tool_tokens": counter.tool_tokens,
+        "seconds": elapsed,
+        "world": nerdmaster.to_state(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--monsters", type=int, default=3)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="instant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run(strategy, args, directory) for strategy in STRATEGIES]
+
+    worlds = [result.pop("world") for result in results]
+    assert all(world == worlds[0] for world in worlds), "strategies ended in different world states"
+    print(f"{args.rounds} rounds against {args.monsters} monsters, same final world state for every strategy\n")
+    print(f"{'strategy':<11} {'llm calls':>10} {'prompt tokens':>14} {'tool tokens':>12} {'total tokens':>13} {'seconds':>8}")
+    for result in results:
+        total = result["prompt_tokens"] + result["tool_tokens"]
+        print(f"{result['strategy']:<11} {result['llm_calls']:>10} {result['prompt_tokens']:>14} "
+              f"{result['tool_tokens']:>12} {total:>13} {result['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Wall-clock time to set up a game against the offline fakes in src/mocks.py.
+
+serial:    the old setup page sequence, constructor (narrative tags), opening turn
+           with its scene image, then a second world image.
+bootstrap: bootstrap_game, tags / world image / opening turn run concurrently and
+           the redundant scene image is skipped.
+
+Usage:
+    python benchmarks/bench_bootstrap.py --chat 1.5 --gpt 0.8 --image 4.0 --tts 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.agent import NerdMasterAgent
+from src.bootstrap import bootstrap_game, OPENING_MESSAGE
+from src.cache import ResponseCache
+from src.image_cache import ImageCache
+from src.mocks import mock_agent_kwargs
+
+LATENCY = {"chat": 1.5, "gpt": 0.8, "image": 4.0, "tts": 0.5}
+
+
+def agent_kwargs(directory:str):
+    profile = {name: dict(mean=seconds, distribution="constant") for name, seconds in LATENCY.items()}
+    return dict(
+        **mock_agent_kwargs(profile, audio_dir=os.path.join(directory, "audio")),
+        response_cache=ResponseCache(),
+        image_cache=ImageCache(directory, similarity_threshold=2.0),
+    )
+
+
+def serial_setup(directory:str):
+    start = time.perf_counter()
+    agent = NerdMasterAgent(**agent_kwargs(directory))
+    try:
+        agent.narrative_tags
+        agent.invoke(OPENING_MESSAGE.format(player_name="Bob"), background=False)
+        narrative = time.perf_counter() - start
+        agent.image = agent.generate_world_image()
+        return narrative, time.perf_counter() - start
+    finally:
+        agent.close()
+
+
+def bootstrap_setup(directory:str):
+    start = time.perf_counter()
+    agent = bootstrap_game("Bob", **agent_kwargs(directory))
+    try:
+        narrative = time.perf_counter() - start
+        agent.wait_for_image()
+        agent.wait_for_artifact("speech")
+        return narrative, time.perf_counter() - start
+    finally:
+        agent.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    for name, value in LATENCY.items():
+        parser.add_argument(f"--{name}", type=float, default=value, help=f"seconds per {name} call")
+    args = parser.parse_args()
+    for name in LATENCY:
+        LATENCY[name] = getattr(args, name)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, setup in (("serial", serial_setup), ("bootstrap", bootstrap_setup)):
+            narrative, total = setup(os.path.join(directory, label))
+            print(f"{label:>10}: narrative ready after {narrative:6.2f}s, everything ready after {total:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
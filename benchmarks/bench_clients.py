@@ -0,0 +1,115 @@
+"""
+Exercises the shared ClientProvider against a local stub of the OpenAI API that
+answers the first requests with 429 + Retry-After and the rest slowly.
+Reports wall-clock time, the highest concurrency the server saw and the
+provider's per-endpoint counters.
+
+Usage:
+    python benchmarks/bench_clients.py --requests 24 --throttle 6 --latency 0.2 --concurrency 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.clients import ClientProvider, RetryPolicy, DEFAULT_CONCURRENCY
+from src.gpt import StandardGPT
+
+
+class StubState:
+
+    def __init__(self, throttle:int, latency:float, retry_after:float):
+        self.throttle = throttle
+        self.latency = latency
+        self.retry_after = retry_after
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state:StubState):
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status:int, body:dict, headers:dict=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state.lock:
+                state.requests += 1
+                throttled = state.requests <= state.throttle
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                if throttled:
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                               {"Retry-After": str(state.retry_after)})
+                    return
+                time.sleep(state.latency)
+                self._send(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": "gpt-3.5-turbo",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "fantasy, medieval"}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+                })
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--throttle", type=int, default=6, help="number of initial requests answered with 429")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=float, default=0.25)
+    parser.add_argument("--concurrency", type=int, default=4, help="chat concurrency limit in the provider")
+    args = parser.parse_args()
+
+    state = StubState(args.throttle, args.latency, args.retry_after)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    provider = ClientProvider(
+        api_key="sk-stub",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        concurrency={**DEFAULT_CONCURRENCY, "chat": args.concurrency},
+        rate_limits={name: (1000.0, 1000) for name in DEFAULT_CONCURRENCY},
+        retry=RetryPolicy(max_retries=8, base_delay=0.05),
+    )
+    gpt = StandardGPT(client_provider=provider)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.requests) as pool:
+        results = list(pool.map(lambda i: gpt.generate(f"narrative {i}", max_tokens=10, system_prompt="image_tags"),
+                                range(args.requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"completed {len(results)} requests in {elapsed:.2f}s")
+    print(f"server saw {state.requests} requests, max {state.max_in_flight} in flight (limit {args.concurrency})")
+    print(json.dumps(provider.stats()["chat"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
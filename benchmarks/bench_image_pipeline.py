@@ -0,0 +1,89 @@
+"""
+Decode + resize + encode time and bytes sent to the browser per turn, for the old
+image path and the rendition pipeline.
+
+before: download the PNG, decode it, scale_image(0.6) with the default filter,
+        then Streamlit re-encodes the PIL image as PNG on every rerun.
+after:  decode the b64 payload once, encode WebP/JPEG renditions in one pass,
+        Streamlit sends the display rendition bytes as they are.
+
+Usage:
+    python benchmarks/bench_image_pipeline.py --rounds 10 --reruns 3
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.image_generator import render_image
+
+
+def make_png(width:int=1792, height:int=1024, seed:int=0):
+    # a smooth scene with some texture, closer to DALL-E output than pure noise
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    zeros = np.zeros((height, width, 1))
+    base = np.concatenate([x * 200 + 30 + zeros, y * 180 + 40 + zeros, (1 - x) * 150 + y * 60], axis=2)
+    texture = rng.normal(0, 12, size=(height, width, 3))
+    pixels = np.clip(base + texture, 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def before(png:bytes, reruns:int):
+    start = time.perf_counter()
+    img = Image.open(BytesIO(png))
+    width, height = img.size
+    img = img.resize((int(width * 0.6), int(height * 0.6)))
+    sent = 0
+    for _ in range(reruns):
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
+        sent += len(buffer.getvalue())
+    return time.perf_counter() - start, sent
+
+
+def after(payload:str, reruns:int):
+    start = time.perf_counter()
+    renditions = render_image(base64.b64decode(payload))
+    sent = len(renditions.display) * reruns
+    return time.perf_counter() - start, sent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--reruns", type=int, default=3, help="page reruns per turn that redraw the image")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    png = make_png()
+    payload = base64.b64encode(png).decode()
+    results = {}
+    for label, run, source in (("before", before, png), ("after", after, payload)):
+        timings, sent = [], 0
+        for _ in range(args.rounds):
+            seconds, sent = run(source, args.reruns)
+            timings.append(seconds)
+        timings.sort()
+        results[label] = {"median_ms": timings[len(timings) // 2] * 1000, "bytes_sent_per_turn": sent}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"source PNG: {len(png)/1024:.0f} KiB, {args.reruns} reruns per turn")
+    for label, result in results.items():
+        print(f"{label:>7}: {result['median_ms']:8.1f} ms decode+resize+encode, "
+              f"{result['bytes_sent_per_turn']/1024:8.0f} KiB sent per turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+How often ImageRefreshPolicy repaints, on labelled pairs of consecutive turns.
+
+Each pair is (previous turn, current turn, tools fired, expected) where expected is
+"keep" for turns that stay in the same scene (talk, combat, lookups) and "refresh"
+for turns that move somewhere new or bring someone in. Prints every decision with
+its scores and the refresh rate per label, and exits with 1 if a same-scene turn
+would repaint, so it can gate changes to the weights or the threshold.
+
+Usage:
+    python benchmarks/bench_image_policy.py
+    python benchmarks/bench_image_policy.py --threshold 0.5 --text-weight 0.7
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.scene import ImageRefreshPolicy
+
+TURNS = {
+    "tavern": "Human: I walk into the tavern and look around.\n"
+              "AI: The Prancing Pony is warm and noisy. A bard plays by the fire while the barkeep polishes mugs behind the long oak bar.",
+    "rumours": "Human: I ask the barkeep about rumours.\n"
+               "AI: The barkeep leans over the oak bar and whispers about goblins in the northern woods. Behind you the bard keeps playing by the fire.",
+    "ale": "Human: I order an ale and sit by the fire.\n"
+           "AI: The barkeep slides a frothy ale across the bar. You settle by the crackling fire as the bard starts a new song about dragons.",
+    "gold": "Human: check my gold\nAI: You have 5 gold coins in your purse.",
+    "inventory": "Human: What am I carrying?\n"
+                 "AI: You rummage through your pack and find a coil of rope, a dented lantern, three days of rations and the map the old hermit gave you.",
+    "woods": "Human: I leave and head into the northern woods.\n"
+             "AI: The forest is dark and cold. Twisted pines close in around the narrow trail, and somewhere ahead a wolf howls.",
+    "trail": "Human: I follow the trail deeper.\n"
+             "AI: The narrow trail winds between the twisted pines. The howling grows closer and fresh wolf tracks mark the mud.",
+    "castle": "Human: I travel to the castle.\n"
+              "AI: After a day on the road you reach the castle gates. Guards in silver armour watch from the battlements as the drawbridge lowers.",
+    "attack": "Human: I attack the goblin.\n"
+              "AI: You swing your sword at the goblin. It shrieks as the blade bites into its shoulder and staggers back.",
+    "again": "Human: I attack again.\n"
+             "AI: The goblin ducks your swing and jabs at you with its rusty spear, grazing your arm. It snarls and circles.",
+    "ambush": "Human: I keep walking.\n"
+              "AI: A goblin leaps out from behind a mossy boulder, waving a rusty spear and screeching a war cry.",
+}
+
+PAIRS = [
+    ("tavern", "rumours", [], "keep"),
+    ("rumours", "ale", [], "keep"),
+    ("tavern", "gold", [], "keep"),
+    ("ale", "gold", ["get_gold"], "keep"),
+    ("ale", "inventory", ["get_inventory"], "keep"),
+    ("ale", "inventory", ["get_entity_inventory", "get_entity_gold"], "keep"),
+    ("woods", "trail", [], "keep"),
+    ("attack", "again", ["modify_health"], "keep"),
+    ("attack", "again", ["roll_dice", "modify_entity_health"], "keep"),
+    ("ambush", "attack", ["roll_checks", "apply_changes"], "keep"),
+    ("ale", "woods", [], "refresh"),
+    ("trail", "castle", [], "refresh"),
+    ("tavern", "castle", [], "refresh"),
+    ("again", "castle", [], "refresh"),
+    ("trail", "ambush", ["create_monster"], "refresh"),
+    ("rumours", "ale", ["create_npc"], "refresh"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--text-weight", type=float, default=None)
+    args = parser.parse_args()
+    overrides = {k: v for k, v in {"threshold": args.threshold, "text_weight": args.text_weight}.items() if v is not None}
+    policy = ImageRefreshPolicy(**overrides)
+
+    counts = {"keep": [0, 0], "refresh": [0, 0]}
+    wrong_keeps = []
+    print(f"{'previous':>9} {'current':>10} {'tools':<40} {'tool':>5} {'text':>5} {'expected':>8} {'decision':>8}")
+    for previous, current, tools, expected in PAIRS:
+        score, tool_score, text_score = policy.score(tools, TURNS[previous], TURNS[current])
+        refresh = policy.should_refresh(tools, TURNS[previous], TURNS[current])
+        counts[expected][0] += refresh
+        counts[expected][1] += 1
+        if expected == "keep" and refresh:
+            wrong_keeps.append(f"{previous}->{current}")
+        print(f"{previous:>9} {current:>10} {','.join(tools) or '-':<40} {tool_score:>5.2f} {text_score:>5.2f} "
+              f"{expected:>8} {'refresh' if refresh else 'keep':>8}")
+
+    for label, (refreshed, total) in counts.items():
+        print(f"\n{label}: {refreshed}/{total} turns repainted", end="")
+    print()
+    if wrong_keeps:
+        print(f"same-scene turns repainted: {', '.join(wrong_keeps)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
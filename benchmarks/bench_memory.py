@@ -0,0 +1,54 @@
+"""
+Prompt history size over a long session, with and without ConversationMemory.
+Uses a local summarizer that keeps the summary at a fixed size, so only our
+own bookkeeping is measured.
+
+Usage:
+    python benchmarks/bench_memory.py --turns 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.memory import ConversationMemory
+from src.utils import count_tokens
+
+
+def local_summarizer(summary:str, turns:list):
+    text = (summary + " " + " ".join(turns)).split()
+    return " ".join(text[-150:])
+
+
+def make_turn(i:int):
+    return (f"Human: I swing my sword at goblin number {i} and search its pockets.\n"
+            f"AI: The goblin {i} falls, you find {i % 7} gold coins and a rusty key. "
+            f"A door creaks open to the north as torchlight flickers across the walls.\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=2000)
+    parser.add_argument("--keep-last", type=int, default=6)
+    args = parser.parse_args()
+
+    memory = ConversationMemory(local_summarizer, token_budget=args.budget, keep_last=args.keep_last)
+    history = []
+    print(f"{'turn':>5} {'full tokens':>12} {'memory tokens':>14} {'saved':>8} {'add+context us':>15}")
+    for i in range(1, args.turns + 1):
+        turn = make_turn(i)
+        history.append(turn)
+        start = time.perf_counter()
+        memory.add(turn)
+        context = memory.get_context()
+        elapsed = (time.perf_counter() - start) * 1e6
+        if i in (1, 10, 50, 100, 150, 200) or i == args.turns:
+            full = count_tokens("".join(history))
+            bounded = count_tokens("".join(context))
+            print(f"{i:>5} {full:>12} {bounded:>14} {memory.last_tokens_saved:>8} {elapsed:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Save cost per turn and resume time for a long game.
+Bytes and time per save are what the turn pays, compactions into a new snapshot
+run on a background thread and are counted separately.
+Turns are applied straight to the world and the agent's history (no LLM), with a
+monster added every few turns so the world keeps growing, and GameSave journals
+each turn. Resume rebuilds the agent from disk against backends that refuse every
+call, so any API call during resume fails the run.
+
+Usage:
+    python benchmarks/bench_persistence.py --turns 500 --monster-every 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.agent import NerdMasterAgent
+from src.cache import ResponseCache
+from src.image_cache import ImageCache
+from src.mocks import mock_agent_kwargs
+from src.persistence import GameSave
+
+
+def play(agent:NerdMasterAgent, turns:int, monster_every:int, report_every:int):
+    nerdmaster = agent.nerdmaster
+    nerdmaster.setup_player("Bob")
+    save = agent.game_save
+    print(f"{'turn':>5} {'entities':>9} {'bytes this save':>16} {'save us':>8} {'snapshot bytes':>15}")
+    for turn in range(turns):
+        if turn % monster_every == 0:
+            nerdmaster.create_monster(f"Goblin{turn}", ["club", "sack"])
+        nerdmaster.player.modify_health(-1)
+        nerdmaster.player.add_to_inventory(f"trinket {turn}")
+        before = save.stats["journal_bytes"]
+        snapshots = save.stats["snapshots"]
+        start = time.perf_counter()
+        agent._finish_turn(f"I press on, step {turn}.",
+                           f"You trade blows with Goblin{turn - turn % monster_every} and find trinket {turn}.",
+                           refresh_image=False)
+        elapsed = time.perf_counter() - start
+        written = save.stats["journal_bytes"] - before
+        if save.stats["snapshots"] != snapshots:
+            written = save.stats["snapshot_bytes"]
+        if turn % report_every == 0 or turn == turns - 1:
+            print(f"{turn:>5} {len(nerdmaster.registry):>9} {written:>16} {elapsed * 1e6:>8.0f} {save.stats['snapshot_bytes']:>15}")
+
+
+class RefusingProvider:
+    """Stands in for the client provider during resume, any API call is an error."""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"resume made an API call ({name})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--monster-every", type=int, default=5)
+    parser.add_argument("--compact-every", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        audio_dir = os.path.join(directory, "audio")
+        kwargs = dict(response_cache=ResponseCache(), image_cache=ImageCache(os.path.join(directory, "images")))
+        agent = NerdMasterAgent(**mock_agent_kwargs(audio_dir=audio_dir), **kwargs,
+                                game_save=GameSave(os.path.join(directory, "save"), compact_every=args.compact_every))
+        try:
+            play(agent, args.turns, args.monster_every, report_every=max(1, args.turns // 10))
+            # let the last background summary land, then journal it
+            agent._artifact_executor.shutdown(wait=True)
+            agent.save()
+            save = agent.game_save
+            save.wait_for_compaction()
+            print(f"\n{save.stats['snapshots']} snapshots on the turn path, {save.stats['compactions']} background compactions, "
+                  f"{save.stats['records']} journal records, "
+                  f"{save.stats['journal_bytes'] / max(1, save.stats['records']):.0f} bytes per record on average")
+            resume(agent, directory, audio_dir, kwargs)
+        finally:
+            agent.close()
+
+
+def resume(agent:NerdMasterAgent, directory:str, audio_dir:str, kwargs:dict):
+    resume_kwargs = mock_agent_kwargs(audio_dir=audio_dir)
+    start = time.perf_counter()
+    resumed = NerdMasterAgent.restore(GameSave(os.path.join(directory, "save")), **resume_kwargs, **kwargs,
+                                      client_provider=RefusingProvider())
+    elapsed = time.perf_counter() - start
+    try:
+        fakes = [resume_kwargs["llm"].latency] + [resume_kwargs[name].keywords["latency"]
+                                                  for name in ("art_gpt", "image_generator", "narrator")]
+        assert sum(fake.stats["calls"] for fake in fakes) == 0, "resume called a backend"
+        assert resumed.history == agent.history
+        assert resumed.nerdmaster.to_state() == agent.nerdmaster.to_state()
+        assert resumed.memory.get_context() == agent.memory.get_context()
+        assert len(resumed.nerdmaster.get_tools()) == len(agent.nerdmaster.get_tools())
+        print(f"resumed {len(resumed.history)} turns and {len(resumed.nerdmaster.registry)} entities "
+              f"in {elapsed * 1000:.1f} ms with no API calls")
+    finally:
+        resumed.close()
+
+if __name__ == "__main__":
+    main()
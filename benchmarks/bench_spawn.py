@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of entity spawn rate in NerdMaster.
+
+"cold" clears the compiled tool-schema cache before every spawn, which is what
+create_tool used to cost (docstring parsing + a new pydantic model per method).
+"warm" is the cached path used in play.
+
+Usage:
+    python benchmarks/bench_spawn.py --monsters 50 --rounds 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.game import NerdMaster
+from src.utils import clear_tool_schema_cache
+
+
+def spawn_wave(monsters:int, cold:bool):
+    nerdmaster = NerdMaster()
+    nerdmaster.setup_player("Bob")
+    start = time.perf_counter()
+    for i in range(monsters):
+        if cold:
+            clear_tool_schema_cache()
+        nerdmaster.create_monster(f"Goblin {i}", ["club"])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--monsters", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for label, cold in (("cold (before)", True), ("warm (after)", False)):
+        timings = sorted(spawn_wave(args.monsters, cold) for _ in range(args.rounds))
+        best = timings[0]
+        median = timings[len(timings) // 2]
+        results[label] = median
+        print(f"{label:>14}: median {median*1000:8.2f} ms / wave, "
+              f"best {best*1000:8.2f} ms, {args.monsters/median:10.0f} spawns/s")
+    speedup = results["cold (before)"] / results["warm (after)"]
+    print(f"speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
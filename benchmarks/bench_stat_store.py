@@ -0,0 +1,77 @@
+"""
+Spawn cost, memory and group effects for large hordes, with stats in the StatStore.
+
+For each horde size: the mean cost of a spawn over the first and last tenth of the
+horde (flat means adding entities doesn't slow down as the game grows), the Python
+heap allocated per entity (tracemalloc), and the time to damage the whole horde
+with one modify_group_health call against one modify_health call per monster, which
+is what a horde cost before group tools.
+
+Runs in parameterized tool mode, so spawning doesn't add tools per monster.
+
+Usage:
+    python benchmarks/bench_stat_store.py --sizes 100 1000 10000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.game import NerdMaster, PARAMETERIZED_TOOLS
+
+
+def spawn_horde(size:int):
+    nerdmaster = NerdMaster(tool_mode=PARAMETERIZED_TOOLS)
+    nerdmaster.setup_player("Bob")
+    timings = []
+    for i in range(size):
+        start = time.perf_counter()
+        nerdmaster.create_monster(f"Goblin {i}", ["club"], group="horde")
+        timings.append(time.perf_counter() - start)
+    return nerdmaster, timings
+
+
+def horde_memory(size:int) -> int:
+    # a separate run, tracemalloc would slow down the timed spawns
+    nerdmaster = NerdMaster(tool_mode=PARAMETERIZED_TOOLS)
+    nerdmaster.setup_player("Bob")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(size):
+        nerdmaster.create_monster(f"Goblin {i}", ["club"], group="horde")
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return allocated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'horde':>7} {'first 10% us':>13} {'last 10% us':>12} {'bytes/entity':>13} {'store bytes':>12} "
+          f"{'group op ms':>12} {'per-entity ms':>14}")
+    for size in args.sizes:
+        nerdmaster, timings = spawn_horde(size)
+        allocated = horde_memory(size)
+        tenth = max(1, size // 10)
+        first = sum(timings[:tenth]) / tenth * 1e6
+        last = sum(timings[-tenth:]) / tenth * 1e6
+
+        start = time.perf_counter()
+        nerdmaster.modify_group_health("horde", -1)
+        group_op = time.perf_counter() - start
+        start = time.perf_counter()
+        for monster in nerdmaster.monsters:
+            monster.modify_health(-1)
+        per_entity = time.perf_counter() - start
+        assert all(monster.health == 98 for monster in nerdmaster.monsters)
+
+        print(f"{size:>7} {first:>13.1f} {last:>12.1f} {allocated / size:>13.0f} {nerdmaster.registry.stats.nbytes:>12} "
+              f"{group_op * 1000:>12.2f} {per_entity * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
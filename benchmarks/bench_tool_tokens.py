@@ -0,0 +1,51 @@
+"""
+Reports the size of the tool schema payload sent to the LLM on every turn,
+for both NerdMaster tool modes, as the number of live entities grows.
+
+Usage:
+    python benchmarks/bench_tool_tokens.py --entities 1 10 100
+"""
+import argparse
+import json
+import os
+import sys
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.game import NerdMaster, TOOL_MODES
+from src.utils import count_tokens
+
+
+def build_world(tool_mode:str, entities:int):
+    nerdmaster = NerdMaster(tool_mode=tool_mode)
+    nerdmaster.setup_player("Bob")
+    # the player counts as the first live entity
+    for i in range(entities - 1):
+        if i % 2 == 0:
+            nerdmaster.create_monster(f"Goblin {i}", ["club"])
+        else:
+            nerdmaster.create_npc(f"Merchant {i}", ["rope", "lantern"])
+    return nerdmaster
+
+
+def schema_tokens(nerdmaster:NerdMaster, encoding:str):
+    schemas = [convert_to_openai_tool(tool) for tool in nerdmaster.get_tools()]
+    return len(schemas), count_tokens(json.dumps(schemas), encoding)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--encoding", type=str, default="cl100k_base")
+    args = parser.parse_args()
+
+    print(f"{'mode':>14} {'entities':>9} {'tools':>6} {'prompt tokens':>14}")
+    for tool_mode in TOOL_MODES:
+        for entities in args.entities:
+            tools, tokens = schema_tokens(build_world(tool_mode, entities), args.encoding)
+            print(f"{tool_mode:>14} {entities:>9} {tools:>6} {tokens:>14}")
+
+
+if __name__ == "__main__":
+    main()
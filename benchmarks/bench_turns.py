@@ -0,0 +1,322 @@
+"""
+End-to-end turn latency, broken down by stage, over scripted multi-turn sessions
+driven through NerdMasterAgent.invoke against the offline fakes in src/mocks.py.
+
+Stages (p50/p95/p99 in ms):
+    setup           NerdMasterAgent construction
+    prepare         tool sync, history, episodic search before the LLM is called
+    llm             each chat model call (an agent turn makes one per tool round)
+    tool:<name>     each tool execution
+    agent           the whole AgentExecutor run
+    gpt:<prompt>    StandardGPT.generate per system prompt (art prompt, tags, summaries)
+    image           image generation + download (ImageGenerator._generate)
+    resize          PIL decode / resize / encode of the renditions (render_image)
+    tts_chunk       one sentence chunk of speech synthesis
+    tts_first_audio from the start of narration until the first chunk can be played
+    narrative       invoke() until the narrative text is returned
+    turn            invoke() until the image and speech are ready too
+
+Also records the prompt tokens of each turn's first LLM call as the history and the
+number of entities grow. With the default instant profile this measures only our own
+overhead, --profile realistic adds backend latencies. Results are written as JSON,
+--compare flags stages whose p50/p95 regressed against an earlier run.
+
+Usage:
+    python benchmarks/bench_turns.py --sessions 3 --turns 30 --out turns.json
+    python benchmarks/bench_turns.py --out new.json --compare turns.json --threshold 1.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import src.image_generator
+from src.agent import NerdMasterAgent
+from src.cache import ResponseCache
+from src.game import TOOL_MODES, PER_ENTITY_TOOLS
+from src.image_cache import ImageCache
+from src.mocks import mock_agent_kwargs, LATENCY_PROFILES
+from src.utils import count_tokens
+
+PERCENTILES = (50, 95, 99)
+
+
+class StageRecorder:
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage:str, seconds:float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, func):
+        """stage is a name, or a callable taking the call's arguments and returning one."""
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                name = stage(*args, **kwargs) if callable(stage) else stage
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def patch(self, obj, attr:str, stage):
+        setattr(obj, attr, self.wrap(stage, getattr(obj, attr)))
+
+    def summary(self):
+        result = {}
+        for stage, samples in sorted(self.samples.items()):
+            ms = np.array(samples) * 1000
+            result[stage] = {
+                "count": len(samples),
+                "mean_ms": round(float(ms.mean()), 3),
+                **{f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES},
+                "total_ms": round(float(ms.sum()), 3),
+            }
+        return result
+
+
+class StageCallbackHandler(BaseCallbackHandler):
+    """Times the executor run, LLM calls and tool runs, and counts the tokens sent with the first LLM call of a turn."""
+
+    def __init__(self, recorder:StageRecorder):
+        self.recorder = recorder
+        self.started = {}
+        self.first_call_tokens = None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self.started[run_id] = ("agent", time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = ("llm", time.perf_counter())
+        if self.first_call_tokens is None:
+            text = "\n".join(str(m.content) for batch in messages for m in batch)
+            tools = kwargs.get("invocation_params", {}).get("tools", [])
+            self.first_call_tokens = {"prompt_tokens": count_tokens(text),
+                                      "tool_schema_tokens": count_tokens(json.dumps(tools))}
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.started[run_id] = (f"tool:{serialized.get('name')}", time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def _finish(self, run_id):
+        stage, start = self.started.pop(run_id, (None, None))
+        if stage is not None:
+            self.recorder.record(stage, time.perf_counter() - start)
+
+
+def build_script(turns:int, monster_every:int, tool_mode:str=PER_ENTITY_TOOLS):
+    """
+    Scripted model replies for a session, one list entry per model call.
+    The first turn sets up the player, then monsters keep arriving so the entity
+    count (and with it the tool list) grows, the other turns fight or loot.
+    Calls use the tool names and arguments of tool_mode.
+    """
+    if tool_mode == PER_ENTITY_TOOLS:
+        loot = lambda item: {"name": "add_to_inventory", "args": {"item": item}}
+        # every monster has its own modify_health tool under the same name, the executor would
+        # pick the last monster's, so the player is hit through apply_changes
+        hit = {"name": "apply_changes", "args": {"changes": [{"entity": "Bob", "op": "modify_health", "amount": -1}]}}
+    else:
+        loot = lambda item: {"name": "add_to_entity_inventory", "args": {"entity": "Bob", "item": item}}
+        hit = {"name": "modify_entity_health", "args": {"entity": "Bob", "amount": -1}}
+    script = [
+        {"tool_calls": [{"name": "setup_player", "args": {"name": "Bob"}}]},
+        "Welcome Bob, your adventure begins at the gates of Eldermere.",
+    ]
+    for turn in range(1, turns):
+        if turn % monster_every == 0:
+            name = f"Goblin{turn}"
+            script += [
+                {"tool_calls": [{"name": "create_monster", "args": {"name": name, "equipment": ["club"]}}]},
+                f"{name} leaps out of the undergrowth, swinging a crude club at you!",
+            ]
+        elif turn % 3 == 0:
+            script += [
+                {"tool_calls": [loot(f"trinket {turn}")]},
+                f"You search the area and pocket a curious trinket. The path winds on past turn {turn}.",
+            ]
+        else:
+            script += [
+                {"tool_calls": [hit]},
+                "You trade blows in the gloom. A glancing strike stings your arm. The fight goes on.",
+            ]
+    return script
+
+
+def instrument(agent:NerdMasterAgent, recorder:StageRecorder):
+    recorder.patch(agent, "_prepare_turn", "prepare")
+    recorder.patch(agent.art_gpt, "generate", lambda prompt, *args, **kwargs: f"gpt:{kwargs.get('system_prompt', 'art_system_prompt')}")
+    recorder.patch(agent.image_generator, "_generate", "image")
+    recorder.patch(agent.narrator, "_synthesize", "tts_chunk")
+
+    generate_speech = agent.narrator.generate_speech
+
+    def timed_speech(text):
+        start = time.perf_counter()
+        speech = generate_speech(text)
+        if speech.chunks:
+            speech.chunks[0].add_done_callback(lambda _: recorder.record("tts_first_audio", time.perf_counter() - start))
+        return speech
+
+    agent.narrator.generate_speech = timed_speech
+
+
+def run_session(session:int, args, recorder:StageRecorder, directory:str):
+    script = build_script(args.turns, args.monster_every, args.tool_mode)
+    handler = StageCallbackHandler(recorder)
+    start = time.perf_counter()
+    agent = NerdMasterAgent(
+        **mock_agent_kwargs(args.profile, seed=args.seed + session, script=script, audio_dir=os.path.join(directory, "audio")),
+        tool_mode=args.tool_mode,
+        response_cache=ResponseCache(),
+        image_cache=ImageCache(os.path.join(directory, f"session-{session}"), similarity_threshold=2.0),
+        callbacks=[handler],
+    )
+    recorder.record("setup", time.perf_counter() - start)
+    try:
+        return play_session(agent, session, args, recorder, handler)
+    finally:
+        agent.close()
+
+
+def play_session(agent:NerdMasterAgent, session:int, args, recorder:StageRecorder, handler:StageCallbackHandler):
+    instrument(agent, recorder)
+    turns = []
+    for turn in range(args.turns):
+        handler.first_call_tokens = None
+        start = time.perf_counter()
+        agent.invoke(f"I press on, step {turn}.", background=True)
+        narrative = time.perf_counter() - start
+        for name in list(agent.artifacts):
+            agent.wait_for_artifact(name)
+        total = time.perf_counter() - start
+        recorder.record("narrative", narrative)
+        recorder.record("turn", total)
+        turns.append({
+            "session": session,
+            "turn": turn,
+            "entities": len(agent.nerdmaster.registry),
+            "history_turns": len(agent.history),
+            "tools": len(agent.tools),
+            **(handler.first_call_tokens or {}),
+            "narrative_ms": round(narrative * 1000, 3),
+            "turn_ms": round(total * 1000, 3),
+        })
+    return turns
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current:dict, baseline:dict, threshold:float):
+    """Print per-stage changes against a baseline run, returns the regressed stages."""
+    regressions = []
+    print(f"\n{'stage':<28} {'p50 base':>10} {'p50 now':>10} {'p95 base':>10} {'p95 now':>10}")
+    for stage, now in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            print(f"{stage:<28} {'-':>10} {now['p50_ms']:>10.2f} {'-':>10} {now['p95_ms']:>10.2f}  new")
+            continue
+        flag = ""
+        for key in ("p50_ms", "p95_ms"):
+            # ignore sub-millisecond noise
+            if now[key] > max(base[key] * threshold, base[key] + 1.0):
+                flag = "REGRESSED"
+        if flag:
+            regressions.append(stage)
+        print(f"{stage:<28} {base['p50_ms']:>10.2f} {now['p50_ms']:>10.2f} {base['p95_ms']:>10.2f} {now['p95_ms']:>10.2f}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--monster-every", type=int, default=4, help="add a monster every n turns")
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="instant")
+    parser.add_argument("--tool-mode", choices=TOOL_MODES, default=PER_ENTITY_TOOLS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio above the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    recorder = StageRecorder()
+    # render_image is a module level function, the generator looks it up at call time
+    src.image_generator.render_image = recorder.wrap("resize", src.image_generator.render_image)
+
+    turns = []
+    with tempfile.TemporaryDirectory() as directory:
+        for session in range(args.sessions):
+            turns += run_session(session, args, recorder, directory)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "stages": recorder.summary(),
+        "turns": turns,
+    }
+
+    print(f"{'stage':<28} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<28} {stats['count']:>6} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['p99_ms']:>10.2f}")
+    print(f"\n{'turn':>5} {'entities':>9} {'history':>8} {'prompt tokens':>14} {'tool tokens':>12}")
+    for row in turns:
+        if row["session"] == 0 and (row["turn"] % 5 == 0 or row["turn"] == args.turns - 1):
+            print(f"{row['turn']:>5} {row['entities']:>9} {row['history_turns']:>8} "
+                  f"{row.get('prompt_tokens', 0):>14} {row.get('tool_schema_tokens', 0):>12}")
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"\nregressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Replay a recorded session (see src/cassette.py) through NerdMasterAgent with no network.
+Every API response comes from the cassette, at full speed by default so only our own
+code is timed, or with the recorded latencies with --realtime. The player's turns are
+played again in order, set up the same way as the recording (narrative, tool mode,
+dice seed, caches), and each turn's tool calls and results are checked against the
+recorded ones. Stages are timed as in bench_turns.py and written in the same JSON format, so
+--compare flags regressions against a replay on an earlier commit.
+
+Record sessions by running the game with NERDMASTER_CASSETTE_DIR set.
+
+Usage:
+    python benchmarks/replay_session.py cassettes/<session>.cassette --out replay.json
+    python benchmarks/replay_session.py cassettes/<session>.cassette --compare replay.json
+    python benchmarks/replay_session.py cassettes/<session>.cassette --realtime
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import src.image_generator
+from bench_turns import StageRecorder, StageCallbackHandler, instrument, compare, git_commit
+from src.agent import NerdMasterAgent, DEFAULT_NARRATIVE
+from src.cassette import Cassette, replay_client_provider
+from src.game import PER_ENTITY_TOOLS
+
+
+class ToolCollector(BaseCallbackHandler):
+    """The tool calls and results of the current turn, in the cassette's event format."""
+
+    def __init__(self):
+        self.events = []
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.events.append({"kind": "tool_call", "name": serialized.get("name"), "input": input_str})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.events.append({"kind": "tool_result", "output": str(output)})
+
+
+def same_tools(recorded:list, replayed:list) -> bool:
+    strip = lambda events: [{k: v for k, v in event.items() if k != "t"} for event in events]
+    return strip(recorded) == strip(replayed)
+
+
+def play_turn(agent:NerdMasterAgent, user_input:str, streamed:bool, refresh_image:bool):
+    if streamed:
+        for _ in agent.stream(user_input, background=True, refresh_image=refresh_image):
+            pass
+    else:
+        agent.invoke(user_input, background=True, refresh_image=refresh_image)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cassette")
+    parser.add_argument("--realtime", action="store_true", help="wait out the recorded latencies")
+    parser.add_argument("--strict", action="store_true", help="fail on any request that differs from the recording")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier replay to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="ratio above the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.cassette)
+    meta = cassette.meta
+    # cassettes from before caching was recorded came from sessions with the shared caches on
+    if meta.get("caching", True):
+        sys.exit(f"{args.cassette} was recorded with the response and image caches on, requests they answered "
+                 "are not in it and the replay would pair later requests with the wrong responses")
+    inputs, recorded_tools = cassette.turns(), cassette.tool_calls()
+    recorder = StageRecorder()
+    src.image_generator.render_image = recorder.wrap("resize", src.image_generator.render_image)
+    handler, tools = StageCallbackHandler(recorder), ToolCollector()
+
+    turns = []
+    diverged = []
+    start = time.perf_counter()
+    agent = NerdMasterAgent(
+        game_world_narrative=meta.get("narrative", DEFAULT_NARRATIVE),
+        tool_mode=meta.get("tool_mode", PER_ENTITY_TOOLS),
+        seed=meta.get("seed"),
+        client_provider=replay_client_provider(cassette, realtime=args.realtime, strict=args.strict),
+        # no caches, as when recording (checked above), so every recorded request is made again
+        caching=False,
+        callbacks=[handler, tools],
+    )
+    recorder.record("setup", time.perf_counter() - start)
+    instrument(agent, recorder)
+    # sessions made by bootstrap_game open with the world image instead of a scene image
+    bootstrapped = "player_name" in meta
+    if bootstrapped:
+        agent.start_world_image()
+
+    for turn, user_input in enumerate(inputs):
+        handler.first_call_tokens = None
+        tools.events = []
+        start = time.perf_counter()
+        play_turn(agent, user_input, cassette.streamed, refresh_image=not (bootstrapped and turn == 0))
+        narrative = time.perf_counter() - start
+        agent.wait_for_artifacts()
+        total = time.perf_counter() - start
+        recorder.record("narrative", narrative)
+        recorder.record("turn", total)
+        if turn < len(recorded_tools) and not same_tools(recorded_tools[turn], tools.events):
+            diverged.append(turn)
+        turns.append({
+            "session": 0,
+            "turn": turn,
+            "entities": len(agent.nerdmaster.registry),
+            "history_turns": len(agent.history),
+            "tools": len(agent.tools),
+            **(handler.first_call_tokens or {}),
+            "narrative_ms": round(narrative * 1000, 3),
+            "turn_ms": round(total * 1000, 3),
+        })
+    agent.close()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cassette": os.path.basename(args.cassette),
+            "args": {"realtime": args.realtime, "strict": args.strict},
+            "replay": {**cassette.stats, "turns": len(inputs), "diverged_turns": diverged},
+        },
+        "stages": recorder.summary(),
+        "turns": turns,
+    }
+
+    print(f"{'stage':<28} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<28} {stats['count']:>6} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['p99_ms']:>10.2f}")
+    stats = cassette.stats
+    print(f"\n{len(inputs)} turns, {stats['played']} responses replayed, {stats['fallbacks']} matched by order only "
+          f"(the request changed since recording), {len(cassette.interactions) - stats['played']} unused")
+    if diverged:
+        print(f"tool calls or results differ from the recording in turns: {', '.join(map(str, diverged))}")
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"\nregressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
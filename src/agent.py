@@ -1,17 +1,32 @@
-from src.game import NerdMaster
+from src.game import NerdMaster, PER_ENTITY_TOOLS
 from src.gpt import StandardGPT
 from src.narrator import Narrator
+from src.memory import ConversationMemory
+from src.episodic import EpisodicMemory
+from src.cache import ResponseCache, get_default_cache
+from src.image_cache import ImageCache, get_default_image_cache
+from src.clients import ClientProvider, get_client_provider
+from src.scene import ImageRefreshPolicy
+from src.tracing import TracingCallbackHandler, get_tracer, submit
+from src.persistence import GameSave
 
 from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_openai import ChatOpenAI
-from langchain import hub
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.language_models.chat_models import BaseChatModel
 from src.image_generator import ImageGenerator
 
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List
+import logging
+import queue
+import threading
 import os 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 CUSTOM_SYSTEM_MESSAGE = """You are a Games Master in a text-based adventure game.
 You must create and manage the game world, including the player character, monsters, and non-player characters (NPCs).
 Use the tools provided to create and manage the game world, these will change based on the state of the game.
@@ -22,6 +37,17 @@ Make the game explorative, thrilling, and engaging for the player, including bat
 
 DEFAULT_NARRATIVE = """The game world is set in a medieval fantasy world, full of eccentric people and occasionally monsters."""
 
+def build_agent_prompt(system_message:str):
+    # local copy of the hwchase17/openai-tools-agent hub prompt, so no network pull is needed
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", system_message),
+            MessagesPlaceholder("chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ]
+    )
+
 class NerdMasterAgent:
 
     def __init__(self,
@@ -31,22 +57,100 @@ class NerdMasterAgent:
                  image_generator:ImageGenerator=ImageGenerator,
                  narrator:Narrator=Narrator,
                  art_gpt:StandardGPT=StandardGPT,
+                 tool_mode:str=PER_ENTITY_TOOLS,
+                 artifact_workers:int=3,
+                 memory_token_budget:int=2000,
+                 memory_keep_last:int=6,
+                 episodic_memory:EpisodicMemory=None,
+                 episodic_top_k:int=3,
+                 response_cache:ResponseCache=None,
+                 image_cache:ImageCache=None,
+                 caching:bool=True,
+                 client_provider:ClientProvider=None,
+                 image_policy:ImageRefreshPolicy=None,
+                 llm:BaseChatModel=None,
+                 callbacks:list=None,
+                 narrative_tags:str=None,
+                 game_save:GameSave=None,
+                 seed:int=None,
                  ):
         self.game_world_narrative = game_world_narrative
-        self.nerdmaster = nerdmaster()
-        self.image_generator = image_generator()
-        self.narrator = narrator()
-        self.art_gpt = art_gpt()
-        self.narrative_tags = self._create_narrative_tags(self.game_world_narrative)
+        self.client_provider = client_provider or get_client_provider()
+        self.nerdmaster = nerdmaster(tool_mode=tool_mode, seed=seed)
+        if caching:
+            self.image_cache = image_cache if image_cache is not None else get_default_image_cache()
+            self.response_cache = response_cache if response_cache is not None else get_default_cache()
+        else:
+            # every request goes to the API, e.g. while a session is recorded into a cassette
+            self.image_cache = self.response_cache = None
+        self.image_generator = image_generator(cache=self.image_cache, client_provider=self.client_provider)
+        self.narrator = narrator(client_provider=self.client_provider)
+        self.art_gpt = art_gpt(cache=self.response_cache, client_provider=self.client_provider)
         self.history = []
-        self._setup_llm(openai_api_key)
+        self.image = None
+        # images requested so far, a finished image is only shown if no newer one was requested since
+        self._image_requests = 0
+        self._image_lock = threading.Lock()
+        self.last_response = None
+        # image and speech for a turn are produced in the background, after the narrative is returned
+        self._artifact_executor = ThreadPoolExecutor(max_workers=artifact_workers)
+        if narrative_tags is not None:
+            # already known, e.g. when resuming a saved game
+            self._narrative_tags = Future()
+            self._narrative_tags.set_result(narrative_tags)
+        else:
+            # only images need the tags, so they don't hold up construction
+            self._narrative_tags = submit(self._artifact_executor, self._create_narrative_tags, self.game_world_narrative)
+        self.artifacts = {}
+        self.image_policy = image_policy if image_policy is not None else ImageRefreshPolicy()
+        self.memory = ConversationMemory(
+            summarizer=self._summarize_history,
+            token_budget=memory_token_budget,
+            keep_last=memory_keep_last,
+            executor=self._artifact_executor,
+        )
+        if episodic_memory is None:
+            # kept next to the game save, so resuming maps the vectors instead of embedding the history again
+            episodic_memory = EpisodicMemory(path=game_save.directory / "episodic" if game_save is not None else None)
+            if game_save is not None and not game_save.exists():
+                # a new game, whatever an earlier game left in the directory is stale
+                episodic_memory.truncate(0)
+        self.episodic_memory = episodic_memory
+        self.episodic_top_k = episodic_top_k
+        self.game_save = game_save
+        # a save (request thread or image callback) must see history and memory of the same turn
+        self._state_lock = threading.RLock()
+        # langchain callback handlers, passed down to every LLM and tool run of a turn
+        self._tracing_handler = TracingCallbackHandler()
+        self.callbacks = [self._tracing_handler] + (callbacks or [])
+        self._setup_llm(openai_api_key, llm)
+        self.prompt = build_agent_prompt(CUSTOM_SYSTEM_MESSAGE + self._prepare_narrative())
+        self._tools_version = None
         self._setup_agent()
 
-    def _setup_llm(self, openai_api_key:str):
-        self.llm = ChatOpenAI(api_key=openai_api_key)
+    def _setup_llm(self, openai_api_key:str, llm:BaseChatModel=None):
+        self.llm = llm if llm is not None else self.client_provider.chat_model(api_key=openai_api_key)
 
     def _get_history(self):
-        return self.history
+        return self.memory.get_context()
+
+    def _get_relevant_events(self, user_input:str):
+        events = self.episodic_memory.search(
+            user_input,
+            k=self.episodic_top_k,
+            exclude_last=self.memory.verbatim_turns,
+        )
+        if len(events) == 0:
+            return []
+        return ["**Relevant earlier events in the game**:\n" + "\n".join(events)]
+
+    def _summarize_history(self, summary:str, turns:List[str]):
+        prompt = f"""**Current summary**:
+{summary or "Nothing has happened yet."}
+
+**New events**:
+{''.join(turns)}"""
+        return self.art_gpt.generate(prompt, max_tokens=300, system_prompt="history_summary", use_cache=False)
     
     def _prepare_narrative(self):
         return f"""
@@ -54,66 +158,306 @@ class NerdMasterAgent:
 {self.game_world_narrative}"""
 
     def _setup_agent(self,):
-        tools, sentients = self.nerdmaster.get_tools_and_sentients()
+        tools = self.nerdmaster.get_tools()
         self.tools = tools
-        self.sentients = sentients
-        prompt = hub.pull("hwchase17/openai-tools-agent")
-        prompt.messages[0].prompt.template = CUSTOM_SYSTEM_MESSAGE + self._prepare_narrative()
-        agent = create_openai_tools_agent(self.llm, tools, prompt)
-        self.agent = AgentExecutor(agent=agent, tools=tools, verbose=True)
+        self._tools_version = self.nerdmaster.tools_version
+        agent = create_openai_tools_agent(self.llm, tools, self.prompt)
+        self.agent = AgentExecutor(agent=agent, tools=tools, 
+                                   # the chain's stdout trace is only worth its cost when debugging
+                                   verbose=logger.isEnabledFor(logging.DEBUG),
+                                   return_intermediate_steps=True)
+
+    def _sync_tools(self):
+        # only rebind the executor when the game world's tools actually changed
+        if self._tools_version != self.nerdmaster.tools_version:
+            self._setup_agent()
 
     def generate_image_prompt(
             self,
             context:str,
             system_prompt:str="art_system_prompt",
-            max_tokens:int=100
+            max_tokens:int=100,
+            use_cache:bool=True,
             ):
-        return self.art_gpt.generate(context, max_tokens=max_tokens, system_prompt=system_prompt)
+        return self.art_gpt.generate(context, max_tokens=max_tokens, system_prompt=system_prompt, use_cache=use_cache)
     
     def generate_world_image(self):
         prompt = self.generate_image_prompt(self.game_world_narrative, system_prompt="art_system_prompt")
-        return self.image_generator.generate(prompt)
+        return self.image_generator.generate(prompt, tags=self._get_narrative_tags())
+
+    def _request_image(self) -> int:
+        with self._image_lock:
+            self._image_requests += 1
+            return self._image_requests
+
+    def _show_image(self, image, request:int):
+        # image futures can finish out of order, an older image must not replace a newer one
+        with self._image_lock:
+            if request == self._image_requests:
+                self.image = image
+        return image
+
+    def _set_world_image(self, request:int):
+        return self._show_image(self.generate_world_image(), request)
+
+    def start_world_image(self) -> Future:
+        """Generate the world image in the background and show it as the current scene."""
+        self.artifacts["image"] = submit(self._artifact_executor, self._set_world_image, self._request_image())
+        return self.artifacts["image"]
     
     def _create_narrative_tags(self, narrative:str):
         return self.art_gpt.generate(narrative, max_tokens=10, system_prompt="image_tags")
     
     def _get_narrative_tags(self):
-        return self.narrative_tags
+        return self._narrative_tags.result()
+
+    @property
+    def narrative_tags(self):
+        return self._get_narrative_tags()
+
+    def ready_narrative_tags(self):
+        """The narrative tags without waiting, None while they are being made or if making them failed."""
+        future = self._narrative_tags
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
     
-    def generate_image(self):
+    def _scene_context(self):
         history = self.history[1:]
-        scenic = self._get_narrative_tags()
-        context = '\n'.join(history[-2:]
+        return '\n'.join(history[-2:]
                 ).replace("Human: ","Player: ").replace("AI: ","Narrator: ")
+
+    def _generate_scene_image(self, context:str, request:int):
+        scenic = self._get_narrative_tags()
         prompt = f"""Here are the last two events in the game world:
 {context}
 Now, create an image that reflects the events in the game world.
 Remember to include the following tags: {scenic}"""
-        prompt = self.generate_image_prompt(prompt, system_prompt="art_system_prompt", max_tokens=150)
-        self.image = self.image_generator.generate(prompt)
+        # scene prompts are unique to the turn, not worth a cache entry
+        prompt = self.generate_image_prompt(prompt, system_prompt="art_system_prompt", max_tokens=150, use_cache=False)
+        return self._show_image(self.image_generator.generate(prompt, tags=scenic), request)
+
+    def generate_image(self):
+        return self._generate_scene_image(self._scene_context(), self._request_image())
 
     def get_image(self):
         return self.image
+
+    def _start_artifacts(self, refresh_image:bool=True):
+        # the context is captured now, so later turns can't change what this turn's artifacts show
+        context = self._scene_context()
+        text = self.last_response.replace("AI: ","")
+        if refresh_image:
+            self.artifacts["image"] = submit(self._artifact_executor, self._generate_scene_image, context, self._request_image())
+            if self.game_save is not None:
+                # the new image reference goes into the journal as soon as it exists
+                self.artifacts["image"].add_done_callback(lambda _: self.save())
+        # the narrator synthesizes sentence chunks on its own pool, this returns straight away
+        self.artifacts["speech"] = self.narrator.generate_speech(text)
+
+    def get_artifact(self, name:str) -> Future:
+        return self.artifacts.get(name)
+
+    def artifact_status(self, name:str):
+        future = self.get_artifact(name)
+        if future is None:
+            return "missing"
+        if not future.done():
+            return "pending"
+        if future.exception() is not None:
+            return "failed"
+        return "ready"
+
+    def wait_for_artifact(self, name:str, timeout:float=None):
+        future = self.get_artifact(name)
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def wait_for_artifacts(self, timeout:float=None):
+        """Wait for every artifact of the last turn, failed ones included."""
+        for future in list(self.artifacts.values()):
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def close(self):
+        """Release the agent's threads, e.g. before it is evicted from memory."""
+        self.narrator.close()
+        self._artifact_executor.shutdown(wait=False, cancel_futures=True)
+        if self.game_save is not None:
+            # the next GameSave for this game must not read the files halfway through a compaction
+            self.game_save.wait_for_compaction()
+        # the tracer is shared, only its buffered spans are written out
+        get_tracer().flush()
+
+    def wait_for_image(self, timeout:float=None):
+        if self.get_artifact("image") is not None:
+            self.wait_for_artifact("image", timeout=timeout)
+        return self.image
     
-    def narrate_last_response(self):
-        self.narrator.generate_speech(self.last_response.replace("AI: ",""))
-        self.narrator.play_speech()
+    def narrate_last_response(self, block:bool=False):
+        speech = self.get_artifact("speech")
+        if speech is None:
+            speech = self.narrator.generate_speech(self.last_response.replace("AI: ",""))
+        self.narrator.play_speech(speech, block=block)
+
+    def get_speech(self, timeout:float=None):
+        return self.wait_for_artifact("speech", timeout=timeout)
 
     def get_last_response(self):
         return self.last_response
 
-    def invoke(self, user_input:str):
-        self._setup_agent()
+    def _prepare_turn(self, user_input:str):
         assert isinstance(user_input, str), "user_input must be a string"
         assert len(user_input) > 0, "user_input must not be empty"
+        self._sync_tools()
+        self.sentients = self.nerdmaster.get_sentients()
         history = self._get_history()
-        response = self.agent.invoke(
-            {
-                "input": user_input,
-                "chat_history": history+[self.sentients]
-            }
+        relevant = self._get_relevant_events(user_input)
+        return {
+            "input": user_input,
+            "chat_history": relevant+history+[self.sentients]
+        }
+
+    def _scene_changed(self, tools_fired:List[str]):
+        previous_turn = self.history[-2] if len(self.history) > 1 else ""
+        has_image = self.image is not None or self.artifact_status("image") == "pending"
+        return self.image_policy.should_refresh(tools_fired, previous_turn, self.history[-1], has_image=has_image)
+
+    def _finish_turn(self, user_input:str, output:str, background:bool=True, refresh_image:bool=True, tools_fired:List[str]=None):
+        turn = f"Human: {user_input}\nAI: {output}\n"
+        with self._state_lock:
+            self.history += [turn]
+            self.memory.add(turn)
+            self.last_response = output
+        # only repaint when the visible scene actually changed
+        refresh_image = refresh_image and self._scene_changed(tools_fired or [])
+        self.episodic_memory.add(turn)
+        self._start_artifacts(refresh_image=refresh_image)
+        self.save()
+        if not background:
+            for name in self.artifacts:
+                self.wait_for_artifact(name)
+        return self.last_response
+
+    def invoke(self, user_input:str, background:bool=True, refresh_image:bool=True):
+        with get_tracer().span("turn", turn=len(self.history)) as span:
+            inputs = self._prepare_turn(user_input)
+            self._tracing_handler._parent = span
+            response = self.agent.invoke(inputs, config={"callbacks": self.callbacks})
+            tools_fired = [action.tool for action, _ in response.get("intermediate_steps", [])]
+            span.set(tools_fired=tools_fired)
+            return self._finish_turn(user_input, response["output"], background=background,
+                                     refresh_image=refresh_image, tools_fired=tools_fired)
+
+    def save(self):
+        """Journal what changed since the last save, if the game has a GameSave."""
+        if self.game_save is not None:
+            with self._state_lock:
+                self.game_save.save(self)
+
+    def load_state(self, state:dict, image=None):
+        """Restore a game saved with GameSave onto this freshly constructed agent, no API calls are made beyond embedding turns the episodic memory missed."""
+        self.nerdmaster.load_state(state["world"])
+        # restored entities are already saved
+        self.nerdmaster.registry.drain_changes()
+        self.history = list(state["history"])
+        self.last_response = state["last_response"]
+        self.memory.load_state(state["memory"], self.history)
+        # only turns the episodic memory missed are embedded, e.g. every turn of a game saved without it
+        self.episodic_memory.sync(self.history)
+        self.image = image
+
+    @classmethod
+    def restore(cls, game_save:GameSave, **agent_kwargs):
+        """Resume the game saved in game_save, further turns keep being saved to it."""
+        state = game_save.load()
+        agent = cls(
+            game_world_narrative=state["narrative"],
+            tool_mode=state["world"]["tool_mode"],
+            # None if the game was saved before its tags were ready, they are made again
+            narrative_tags=state.get("narrative_tags"),
+            game_save=game_save,
+            **agent_kwargs,
         )
-        self.history += [f"Human: {user_input}\nAI: {response['output']}\n"]
-        self.generate_image()
-        self.last_response = response["output"]
-        return self.last_response
\ No newline at end of file
+        image = game_save.load_image(state["image"])
+        agent.load_state(state, image=image)
+        game_save.attach_image(image, state["image"])
+        return agent
+
+    def _stream_events(self, inputs:dict):
+        # runs the async event stream on the client provider's loop and hands events over to the caller's thread
+        events = queue.Queue()
+        done = object()
+
+        parent = self._tracing_handler._parent
+
+        async def consume():
+            # the task runs in the loop's context, tool spans need the turn's span made current there
+            with get_tracer().use_span(parent):
+                async for event in self.agent.astream_events(inputs, config={"callbacks": self.callbacks}, version="v1"):
+                    events.put(event)
+
+        def finished(future):
+            if future.exception() is not None:
+                events.put(future.exception())
+            events.put(done)
+
+        self.client_provider.run_async(consume()).add_done_callback(finished)
+        while True:
+            event = events.get()
+            if event is done:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def stream(self, user_input:str, background:bool=True, refresh_image:bool=True):
+        """
+        Streaming version of invoke.
+        Yields dicts as the turn progresses:
+        - {"type": "token", "content": str} for each narrative token
+        - {"type": "tool_start", "name": str, "input": ...} when a tool is called
+        - {"type": "tool_end", "name": str, "output": str} when a tool returns
+        The turn is recorded (and its image/speech started) once the stream is exhausted.
+        """
+        tracer = get_tracer()
+        # a span can't be held open across yields with a context manager, the caller's context changes in between
+        span = tracer.start_span("turn", turn=len(self.history), streaming=True)
+        try:
+            with tracer.use_span(span):
+                inputs = self._prepare_turn(user_input)
+            self._tracing_handler._parent = span
+            root_run_id = None
+            output = None
+            tools_fired = []
+            for event in self._stream_events(inputs):
+                kind = event["event"]
+                if root_run_id is None:
+                    root_run_id = event["run_id"]
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield {"type": "token", "content": content}
+                elif kind == "on_tool_start":
+                    tools_fired.append(event["name"])
+                    yield {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+                elif kind == "on_tool_end":
+                    yield {"type": "tool_end", "name": event["name"], "output": event["data"].get("output")}
+                elif kind == "on_chain_end" and event["run_id"] == root_run_id:
+                    output = event["data"]["output"]["output"]
+            span.set(tools_fired=tools_fired)
+            with tracer.use_span(span):
+                self._finish_turn(user_input, output, background=background,
+                                  refresh_image=refresh_image, tools_fired=tools_fired)
+        except BaseException as e:
+            tracer.end_span(span, e)
+            raise
+        tracer.end_span(span)
+
+    def stream_text(self, user_input:str, background:bool=True, refresh_image:bool=True):
+        for event in self.stream(user_input, background=background, refresh_image=refresh_image):
+            if event["type"] == "token":
+                yield event["content"]
@@ -0,0 +1,26 @@
+from src.agent import NerdMasterAgent, DEFAULT_NARRATIVE
+
+OPENING_MESSAGE = "Hi, my character is called {player_name} and I want to play your game."
+
+
+def bootstrap_game(
+        player_name:str,
+        game_world_narrative:str=DEFAULT_NARRATIVE,
+        agent_class:type=NerdMasterAgent,
+        **agent_kwargs,
+    ) -> NerdMasterAgent:
+    """
+    Set up a new game with its independent remote calls running concurrently.
+
+    - the narrative tags are generated in the background by the agent's constructor
+    - the world image (art prompt + image) starts straight away and becomes the first scene
+    - the opening agent turn runs on the calling thread, without its own scene image
+      since the world image already covers it
+
+    Returns as soon as the opening narrative is ready, the world image and the opening
+    narration keep going in the background (see NerdMasterAgent.artifact_status).
+    """
+    agent = agent_class(game_world_narrative=game_world_narrative, **agent_kwargs)
+    agent.start_world_image()
+    agent.invoke(OPENING_MESSAGE.format(player_name=player_name), refresh_image=False)
+    return agent
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+
+    def __init__(
+            self,
+            max_entries:int=512,
+            ttl:float=7*24*60*60,
+            path:str=None,
+            max_disk_entries:int=10000,
+    ):
+        """
+        Two tier cache for LLM responses, keyed by a hash of the request.
+        An in-process LRU sits in front of an optional SQLite file, entries older than
+        ttl seconds are ignored and each tier evicts its least recently used entries
+        once it holds more than its maximum.
+
+        Parameters:
+        max_entries (int): Maximum entries held in memory.
+        ttl (float): Seconds an entry stays valid, None to never expire.
+        path (str): SQLite file for the on-disk tier, memory only if None.
+        max_disk_entries (int): Maximum entries held on disk.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            # kept up to date by set(), so inserts don't have to count the table
+            self._disk_count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(**request) -> str:
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _expired(self, created:float, now:float):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key:str):
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                self.memory.pop(key)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+            self.stats["misses"] += 1
+            return None
+
+    def _remember(self, key:str, value:str, created:float):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def set(self, key:str, value:str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            ).rowcount
+            if inserted:
+                self._disk_count += 1
+            else:
+                self._db.execute(
+                    "UPDATE responses SET value = ?, created = ?, accessed = ? WHERE key = ?",
+                    (value, now, now, key),
+                )
+            if self._disk_count > self.max_disk_entries:
+                evicted = self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (self._disk_count - self.max_disk_entries,),
+                ).rowcount
+                self._disk_count -= evicted
+                self.stats["evictions"] += evicted
+            if self.ttl is not None:
+                self._disk_count -= self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_count = 0
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+def get_default_cache(path:str="./cache/responses.sqlite3") -> ResponseCache:
+    """Process-wide cache shared by every game, so repeated narratives skip the LLM."""
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = ResponseCache(path=path)
+        return _DEFAULT_CACHE
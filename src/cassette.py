@@ -0,0 +1,427 @@
+from base64 import b64decode, b64encode
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.clients import ClientProvider, RetryPolicy, endpoint_for, DEFAULT_CONCURRENCY, RETRY_STATUSES
+from src.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+# response headers worth keeping, the rest (dates, request ids, cookies) only make cassettes bigger
+KEPT_HEADERS = ("content-type", "content-encoding")
+
+
+class CassetteMiss(Exception):
+    """A request during replay that the cassette has no response for."""
+
+
+def request_key(request:httpx.Request) -> str:
+    return hashlib.sha1(request.method.encode() + request.url.path.encode() + request.content).hexdigest()[:20]
+
+
+def _encode_chunk(chunk:bytes):
+    try:
+        return chunk.decode()
+    except UnicodeDecodeError:
+        return {"b64": b64encode(chunk).decode()}
+
+
+def _decode_chunk(data) -> bytes:
+    return b64decode(data["b64"]) if isinstance(data, dict) else data.encode()
+
+
+class Cassette:
+
+    def __init__(self, path:str, meta:dict=None):
+        """
+        The API traffic of one session, recorded for replaying it offline.
+        Every HTTP exchange (chat completions, art prompts, images, speech) is kept with
+        its response body chunks and their timings, along with the turns the player took
+        and the tool calls and results of each turn. The file is a single zlib stream of
+        JSON lines, flushed after every record, so a crash loses at most the record being
+        written. Opening an existing cassette keeps recording after what it holds.
+
+        Parameters:
+        path (str): The cassette file.
+        meta (dict): How the session was set up (narrative, tool mode, seed, player name, caching), for replays.
+        """
+        self.path = Path(path)
+        self.meta = dict(meta or {})
+        self.interactions: List[dict] = []
+        self.events: List[dict] = []
+        self.stats = {"recorded": 0, "retried": 0, "played": 0, "fallbacks": 0, "missed": 0}
+        self._lock = threading.Lock()
+        self._file = None
+        self._compressor = None
+        self._started = time.monotonic()
+        # replay queues, request key / endpoint -> indices into interactions not played yet
+        self._by_key: Dict[str, deque] = {}
+        self._by_endpoint: Dict[str, deque] = {}
+        self._played = set()
+
+    @classmethod
+    def load(cls, path:str) -> "Cassette":
+        """Read a cassette for replay, a record cut short by a crash is dropped."""
+        cassette = cls(path)
+        cassette._read()
+        cassette._index()
+        return cassette
+
+    def _read(self):
+        if not self.path.exists():
+            return
+        data = self.path.read_bytes()
+        text = b""
+        # each recording run appends its own zlib stream
+        while data:
+            decompressor = zlib.decompressobj()
+            try:
+                text += decompressor.decompress(data)
+            except zlib.error:
+                logger.warning("%s is damaged after byte %d of its text", self.path, len(text))
+                break
+            data = decompressor.unused_data
+            if not decompressor.eof:
+                break
+        for line in text.split(b"\n"):
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            kind = record.pop("type")
+            if kind == "meta":
+                self.meta = {**record["meta"], **self.meta}
+            elif kind == "http":
+                self.interactions.append(record)
+            else:
+                self.events.append(record)
+
+    def _index(self):
+        self._by_key, self._by_endpoint, self._played = {}, {}, set()
+        for index, interaction in enumerate(self.interactions):
+            self._by_key.setdefault(interaction["key"], deque()).append(index)
+            self._by_endpoint.setdefault(interaction["endpoint"], deque()).append(index)
+
+    def _write(self, record:dict):
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._file is None:
+                # whatever was recorded before, e.g. before the session was evicted, is kept and rewritten
+                # as one fresh stream, a stream left unfinished by a crash can't be appended to
+                previous = Cassette(self.path)
+                previous._read()
+                self._file = open(self.path, "wb")
+                self._compressor = zlib.compressobj(6)
+                self._file_write({"type": "meta", "version": CASSETTE_VERSION, "meta": {**previous.meta, **self.meta}})
+                for interaction in previous.interactions:
+                    self._file_write({"type": "http", **interaction})
+                for event in previous.events:
+                    self._file_write({"type": "event", **event})
+                self.interactions[:0] = previous.interactions
+                self.events[:0] = previous.events
+            self._file.write(self._compressor.compress(line))
+            self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def _file_write(self, record:dict):
+        self._file.write(self._compressor.compress(json.dumps(record, separators=(",", ":")).encode() + b"\n"))
+
+    def record_interaction(self, request:httpx.Request, response:httpx.Response, latency:float, chunks:list):
+        if response.status_code in RETRY_STATUSES:
+            # the limiter retries these, the replay gets the response that was finally used
+            with self._lock:
+                self.stats["retried"] += 1
+            return
+        interaction = {
+            "key": request_key(request),
+            "method": request.method,
+            "path": request.url.path,
+            "endpoint": endpoint_for(request.url.path),
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            "latency": round(latency, 4),
+            "chunks": [[round(offset, 4), _encode_chunk(chunk)] for offset, chunk in chunks],
+        }
+        self._write({"type": "http", **interaction})
+        with self._lock:
+            self.interactions.append(interaction)
+            self.stats["recorded"] += 1
+        get_tracer().count("cassette_recorded_total", endpoint=interaction["endpoint"])
+
+    def record_event(self, kind:str, **data):
+        event = {"kind": kind, "t": round(time.monotonic() - self._started, 3), **data}
+        self._write({"type": "event", **event})
+        with self._lock:
+            self.events.append(event)
+
+    def turns(self) -> List[str]:
+        return [event["input"] for event in self.events if event["kind"] == "turn"]
+
+    def tool_calls(self) -> List[List[dict]]:
+        """The tool calls and results of each recorded turn."""
+        turns = []
+        for event in self.events:
+            if event["kind"] == "turn":
+                turns.append([])
+            elif turns and event["kind"] in ("tool_call", "tool_result"):
+                turns[-1].append(event)
+        return turns
+
+    @property
+    def streamed(self) -> bool:
+        """Whether the chat completions were streamed, replays must make the same kind of request."""
+        return any(interaction["headers"].get("content-type", "").startswith("text/event-stream")
+                   for interaction in self.interactions if interaction["endpoint"] == "chat")
+
+    def next_interaction(self, request:httpx.Request, strict:bool=False) -> dict:
+        """
+        The recorded response for a request: the first unplayed one for the identical request,
+        otherwise (e.g. a prompt changed since the recording) the next unplayed one for the
+        same endpoint, in recording order. strict replays only accept identical requests.
+        """
+        endpoint = endpoint_for(request.url.path)
+        with self._lock:
+            index = self._pop(self._by_key.get(request_key(request)))
+            if index is None and not strict:
+                index = self._pop(self._by_endpoint.get(endpoint))
+                if index is not None:
+                    self.stats["fallbacks"] += 1
+            if index is None:
+                self.stats["missed"] += 1
+                raise CassetteMiss(f"{self.path} has no more responses for {request.method} {request.url.path}")
+            self.stats["played"] += 1
+            return self.interactions[index]
+
+    def _pop(self, indices:Optional[deque]) -> Optional[int]:
+        # the queues share indices, skip the ones already played through the other queue
+        while indices:
+            index = indices.popleft()
+            if index not in self._played:
+                self._played.add(index)
+                return index
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(self._compressor.flush())
+                self._file.close()
+                self._file = None
+
+
+class _RecordingStream:
+
+    def __init__(self, cassette:Cassette, request:httpx.Request, response:httpx.Response, started:float, latency:float):
+        self.cassette = cassette
+        self.request = request
+        self.response = response
+        self.started = started
+        self.latency = latency
+        self.chunks = []
+        self.recorded = False
+
+    def add(self, chunk:bytes):
+        self.chunks.append((time.perf_counter() - self.started, chunk))
+
+    def finish(self):
+        if not self.recorded:
+            self.recorded = True
+            self.cassette.record_interaction(self.request, self.response, self.latency, self.chunks)
+
+
+class RecordingStream(_RecordingStream, httpx.SyncByteStream):
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.response.stream:
+            self.add(chunk)
+            yield chunk
+        self.finish()
+
+    def close(self):
+        # also record responses the caller stopped reading early
+        self.finish()
+        self.response.close()
+
+
+class AsyncRecordingStream(_RecordingStream, httpx.AsyncByteStream):
+
+    async def __aiter__(self):
+        async for chunk in self.response.stream:
+            self.add(chunk)
+            yield chunk
+        self.finish()
+
+    async def aclose(self):
+        self.finish()
+        await self.response.aclose()
+
+
+def _prepare_recording(request:httpx.Request):
+    # plain bodies compress far better in the cassette than gzip ones, and replay without decoding
+    request.headers["Accept-Encoding"] = "identity"
+
+
+class RecordingTransport(httpx.BaseTransport):
+
+    def __init__(self, cassette:Cassette, transport:httpx.BaseTransport=None):
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request:httpx.Request) -> httpx.Response:
+        _prepare_recording(request)
+        request.read()
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        stream = RecordingStream(self.cassette, request, response, started, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=response.headers, stream=stream, extensions=response.extensions)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, cassette:Cassette, transport:httpx.AsyncBaseTransport=None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request:httpx.Request) -> httpx.Response:
+        _prepare_recording(request)
+        await request.aread()
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        stream = AsyncRecordingStream(self.cassette, request, response, started, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=response.headers, stream=stream, extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ReplayStream(httpx.SyncByteStream):
+
+    def __init__(self, interaction:dict, realtime:bool, started:float):
+        self.interaction = interaction
+        self.realtime = realtime
+        self.started = started
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset, data in self.interaction["chunks"]:
+            if self.realtime:
+                time.sleep(max(0.0, self.started + offset - time.perf_counter()))
+            yield _decode_chunk(data)
+
+
+class AsyncReplayStream(httpx.AsyncByteStream):
+
+    def __init__(self, interaction:dict, realtime:bool, started:float):
+        self.interaction = interaction
+        self.realtime = realtime
+        self.started = started
+
+    async def __aiter__(self):
+        for offset, data in self.interaction["chunks"]:
+            if self.realtime:
+                await asyncio.sleep(max(0.0, self.started + offset - time.perf_counter()))
+            yield _decode_chunk(data)
+
+
+class ReplayTransport(httpx.BaseTransport):
+
+    def __init__(self, cassette:Cassette, realtime:bool=False, strict:bool=False):
+        """
+        Answers requests from a cassette instead of the network.
+        At full speed by default, with realtime the recorded time to the response
+        headers and between body chunks is waited out too.
+        """
+        self.cassette = cassette
+        self.realtime = realtime
+        self.strict = strict
+
+    def handle_request(self, request:httpx.Request) -> httpx.Response:
+        request.read()
+        started = time.perf_counter()
+        interaction = self.cassette.next_interaction(request, strict=self.strict)
+        if self.realtime:
+            time.sleep(interaction["latency"])
+        return httpx.Response(interaction["status"], headers=interaction["headers"],
+                              stream=ReplayStream(interaction, self.realtime, started))
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, cassette:Cassette, realtime:bool=False, strict:bool=False):
+        self.cassette = cassette
+        self.realtime = realtime
+        self.strict = strict
+
+    async def handle_async_request(self, request:httpx.Request) -> httpx.Response:
+        await request.aread()
+        started = time.perf_counter()
+        interaction = self.cassette.next_interaction(request, strict=self.strict)
+        if self.realtime:
+            await asyncio.sleep(interaction["latency"])
+        return httpx.Response(interaction["status"], headers=interaction["headers"],
+                              stream=AsyncReplayStream(interaction, self.realtime, started))
+
+
+class CassetteCallbackHandler(BaseCallbackHandler):
+    """Records each turn's player input and its tool calls and results into a cassette."""
+
+    def __init__(self, cassette:Cassette):
+        self.cassette = cassette
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and isinstance(inputs, dict) and "input" in inputs:
+            self.cassette.record_event("turn", input=inputs["input"])
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.cassette.record_event("tool_call", name=serialized.get("name"), input=input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.cassette.record_event("tool_result", output=str(output))
+
+
+def recording_client_provider(
+        cassette:Cassette,
+        transport:httpx.BaseTransport=None,
+        async_transport:httpx.AsyncBaseTransport=None,
+        **provider_kwargs,
+    ) -> ClientProvider:
+    """
+    A client provider that talks to the API as usual and records every exchange into cassette.
+    transport / async_transport override the network transports, e.g. with a local stub.
+    """
+    return ClientProvider(
+        transport=RecordingTransport(cassette, transport),
+        async_transport=AsyncRecordingTransport(cassette, async_transport),
+        **provider_kwargs,
+    )
+
+
+def replay_client_provider(cassette:Cassette, realtime:bool=False, strict:bool=False, **provider_kwargs) -> ClientProvider:
+    """
+    A client provider answered from cassette, with no network and no API key.
+    Rate limits are lifted and retries switched off, the recording already went through them.
+    """
+    provider_kwargs.setdefault("api_key", "replay")
+    provider_kwargs.setdefault("concurrency", {name: 1024 for name in DEFAULT_CONCURRENCY})
+    provider_kwargs.setdefault("rate_limits", {name: (1e9, 1e9) for name in DEFAULT_CONCURRENCY})
+    provider_kwargs.setdefault("retry", RetryPolicy(max_retries=0))
+    return ClientProvider(
+        transport=ReplayTransport(cassette, realtime=realtime, strict=strict),
+        async_transport=AsyncReplayTransport(cassette, realtime=realtime, strict=strict),
+        **provider_kwargs,
+    )
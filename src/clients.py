@@ -0,0 +1,343 @@
+from email.utils import parsedate_to_datetime
+from typing import Dict, Tuple
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from openai import OpenAI
+from langchain_openai import ChatOpenAI
+from src.tracing import get_tracer
+
+# response codes worth retrying, everything else is returned to the caller as is
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+DEFAULT_CONCURRENCY = {"chat": 8, "images": 2, "audio": 4, "other": 8}
+# (requests per second, burst)
+DEFAULT_RATE_LIMITS = {"chat": (8.0, 16), "images": (1.0, 2), "audio": (4.0, 8), "other": (8.0, 16)}
+
+
+def endpoint_for(path:str) -> str:
+    if path.endswith("/chat/completions"):
+        return "chat"
+    if "/images/" in path:
+        return "images"
+    if "/audio/" in path:
+        return "audio"
+    return "other"
+
+
+class TokenBucket:
+
+    def __init__(self, rate:float, capacity:float):
+        """
+        Token bucket rate limiter, refills rate tokens per second up to capacity.
+        Callers reserve a token and get back how long they must wait for it, so
+        waiting never happens while holding the lock.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RetryPolicy:
+
+    def __init__(self, max_retries:int=5, base_delay:float=0.5, max_delay:float=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _retry_after(self, headers:httpx.Headers):
+        if headers is None:
+            return None
+        if "retry-after-ms" in headers:
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt:int, headers:httpx.Headers=None) -> float:
+        # the server knows best, otherwise exponential backoff with full jitter
+        retry_after = self._retry_after(headers)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class EndpointLimiter:
+
+    def __init__(
+            self,
+            concurrency:Dict[str, int]=DEFAULT_CONCURRENCY,
+            rate_limits:Dict[str, Tuple[float, float]]=DEFAULT_RATE_LIMITS,
+            retry:RetryPolicy=None,
+    ):
+        """
+        Per-endpoint (chat, images, audio, other) concurrency semaphores, token buckets
+        and retry policy shared by every request going through the client provider.
+        """
+        self.retry = retry or RetryPolicy()
+        self.semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in concurrency.items()}
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in rate_limits.items()}
+        self.stats = {name: {"requests": 0, "retries": 0, "throttled": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+                      for name in concurrency}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint:str, key:str, amount:int=1):
+        with self._lock:
+            stats = self.stats[endpoint]
+            stats[key] += amount
+            if key == "in_flight":
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+                in_flight = stats["in_flight"]
+        tracer = get_tracer()
+        if key == "in_flight":
+            tracer.gauge("http_in_flight", in_flight, endpoint=endpoint)
+        else:
+            tracer.count(f"http_{key}_total", amount, endpoint=endpoint)
+
+
+class LimitedTransport(httpx.BaseTransport):
+
+    def __init__(self, limiter:EndpointLimiter, transport:httpx.BaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request:httpx.Request) -> httpx.Response:
+        endpoint = endpoint_for(request.url.path)
+        limiter = self.limiter
+        # make the body replayable for retries
+        request.read()
+        attempt = 0
+        while True:
+            limiter.buckets[endpoint].acquire()
+            with limiter.semaphores[endpoint]:
+                limiter.record(endpoint, "requests")
+                limiter.record(endpoint, "in_flight")
+                try:
+                    response = self.transport.handle_request(request)
+                    error = None
+                except httpx.TransportError as e:
+                    response, error = None, e
+                finally:
+                    limiter.record(endpoint, "in_flight", -1)
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt >= limiter.retry.max_retries:
+                limiter.record(endpoint, "errors")
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                if response.status_code == 429:
+                    limiter.record(endpoint, "throttled")
+                delay = limiter.retry.delay(attempt, response.headers)
+                response.close()
+            else:
+                delay = limiter.retry.delay(attempt)
+            limiter.record(endpoint, "retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncLimitedTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, limiter:EndpointLimiter, transport:httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request:httpx.Request) -> httpx.Response:
+        endpoint = endpoint_for(request.url.path)
+        limiter = self.limiter
+        await request.aread()
+        attempt = 0
+        while True:
+            await limiter.buckets[endpoint].acquire_async()
+            semaphore = limiter.semaphores[endpoint]
+            # the semaphores are shared with sync callers, poll rather than block the event loop
+            while not semaphore.acquire(blocking=False):
+                await asyncio.sleep(0.01)
+            limiter.record(endpoint, "requests")
+            limiter.record(endpoint, "in_flight")
+            try:
+                response = await self.transport.handle_async_request(request)
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            finally:
+                limiter.record(endpoint, "in_flight", -1)
+                semaphore.release()
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt >= limiter.retry.max_retries:
+                limiter.record(endpoint, "errors")
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                if response.status_code == 429:
+                    limiter.record(endpoint, "throttled")
+                delay = limiter.retry.delay(attempt, response.headers)
+                await response.aclose()
+            else:
+                delay = limiter.retry.delay(attempt)
+            limiter.record(endpoint, "retries")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ClientProvider:
+
+    def __init__(
+            self,
+            api_key:str=None,
+            base_url:str=None,
+            concurrency:Dict[str, int]=DEFAULT_CONCURRENCY,
+            rate_limits:Dict[str, Tuple[float, float]]=DEFAULT_RATE_LIMITS,
+            retry:RetryPolicy=None,
+            max_connections:int=32,
+            max_keepalive_connections:int=16,
+            timeout:float=120.0,
+            transport:httpx.BaseTransport=None,
+            async_transport:httpx.AsyncBaseTransport=None,
+    ):
+        """
+        One set of HTTP connections for every OpenAI call in the process.
+        StandardGPT, ImageGenerator, Narrator and the agent's ChatOpenAI all take their
+        clients from here, so they share a keep-alive pool, per-endpoint concurrency and
+        rate limits, and retries with jittered exponential backoff that honour Retry-After.
+        The OpenAI SDK's own retries are switched off so requests are not retried twice.
+
+        Parameters:
+        api_key (str): OpenAI API key, defaults to OPENAI_API_KEY.
+        base_url (str): API base url, e.g. a local stub server for testing.
+        concurrency (dict): Maximum requests in flight per endpoint.
+        rate_limits (dict): (requests per second, burst) per endpoint.
+        retry (RetryPolicy): Retry settings.
+        max_connections (int): Connection pool size.
+        max_keepalive_connections (int): Idle connections kept open.
+        timeout (float): Request timeout in seconds.
+        transport / async_transport: Override the underlying httpx transports.
+        """
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.limiter = EndpointLimiter(concurrency=concurrency, rate_limits=rate_limits, retry=retry)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        transport = transport or httpx.HTTPTransport(limits=limits)
+        async_transport = async_transport or httpx.AsyncHTTPTransport(limits=limits)
+        self.http_client = httpx.Client(transport=LimitedTransport(self.limiter, transport), timeout=timeout)
+        self.async_http_client = httpx.AsyncClient(transport=AsyncLimitedTransport(self.limiter, async_transport), timeout=timeout)
+        self._openai = None
+        self._openai_lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def openai(self) -> OpenAI:
+        # created on first use, so offline fakes never need an API key
+        with self._openai_lock:
+            if self._openai is None:
+                self._openai = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    http_client=self.http_client,
+                    max_retries=0,
+                )
+            return self._openai
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        # pooled async connections belong to one event loop, so all async work runs on this one
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def run_async(self, coroutine):
+        """Schedule a coroutine on the provider's event loop, returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def chat_model(self, **kwargs) -> ChatOpenAI:
+        # an explicit None (no key in the environment) falls back to the provider's key too
+        if kwargs.get("api_key") is None:
+            kwargs["api_key"] = self.api_key
+        if self.base_url is not None:
+            kwargs.setdefault("base_url", self.base_url)
+        return ChatOpenAI(
+            http_client=self.http_client,
+            http_async_client=self.async_http_client,
+            max_retries=0,
+            **kwargs,
+        )
+
+    def stats(self):
+        return self.limiter.stats
+
+    def close(self):
+        self.http_client.close()
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is None:
+            return
+        # the async pool's connections belong to the loop, close them there before stopping it
+        asyncio.run_coroutine_threadsafe(self.async_http_client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+_DEFAULT_PROVIDER = None
+_DEFAULT_PROVIDER_LOCK = threading.Lock()
+
+def get_client_provider() -> ClientProvider:
+    """The process-wide client provider, created on first use."""
+    global _DEFAULT_PROVIDER
+    with _DEFAULT_PROVIDER_LOCK:
+        if _DEFAULT_PROVIDER is None:
+            _DEFAULT_PROVIDER = ClientProvider()
+        return _DEFAULT_PROVIDER
@@ -0,0 +1,114 @@
+from functools import lru_cache
+from typing import NamedTuple, Sequence, Tuple
+import re
+
+import numpy as np
+
+DICE_PATTERN = re.compile(
+    r"^\s*(?P<count>\d*)\s*d\s*(?P<sides>\d+|%)\s*(?P<explode>!?)"
+    r"\s*(?:(?P<sign>[+-])\s*(?P<modifier>\d+))?"
+    r"\s*(?P<mode>advantage|adv|disadvantage|dis)?\s*$"
+)
+MAX_DICE = 1000
+# an exploding die rolls again at most this many times
+MAX_EXPLOSIONS = 20
+
+
+class DiceSpec(NamedTuple):
+    count: int
+    sides: int
+    modifier: int = 0
+    explode: bool = False
+    # 0 plain, 1 advantage (best of two), -1 disadvantage (worst of two)
+    mode: int = 0
+
+    def __str__(self):
+        text = f"{self.count}d{self.sides}{'!' if self.explode else ''}"
+        if self.modifier:
+            text += f"{self.modifier:+d}"
+        return text + {0: "", 1: " adv", -1: " dis"}[self.mode]
+
+
+@lru_cache(maxsize=256)
+def parse_dice(notation:str) -> DiceSpec:
+    """
+    Parse dice notation: [N]dM[!][+K|-K][ adv|dis], e.g. "3d6+2", "d20 adv", "2d6!".
+    d% is a d100, ! makes dice that show their highest face roll again and add up,
+    adv / dis roll the whole thing twice and keep the higher / lower total.
+    """
+    match = DICE_PATTERN.match(notation.lower())
+    if match is None:
+        raise ValueError(f"{notation!r} is not dice notation, e.g. 3d6+2, d20 adv or 2d6!")
+    count = int(match["count"] or 1)
+    sides = 100 if match["sides"] == "%" else int(match["sides"])
+    if not 1 <= count <= MAX_DICE:
+        raise ValueError(f"between 1 and {MAX_DICE} dice can be rolled at once, not {count}")
+    if sides < 2:
+        raise ValueError(f"dice need at least 2 sides, not {sides}")
+    modifier = int(match["modifier"] or 0) * (-1 if match["sign"] == "-" else 1)
+    mode = {None: 0, "adv": 1, "advantage": 1, "dis": -1, "disadvantage": -1}[match["mode"]]
+    return DiceSpec(count, sides, modifier, bool(match["explode"]), mode)
+
+
+class DiceEngine:
+
+    def __init__(self, seed:int=None):
+        """
+        Dice for one game, drawn from its own seeded NumPy generator so a game replays
+        the same rolls from the same seed or saved state, whatever else runs in the process.
+        Every roll of a notation is drawn in one vectorized call.
+
+        Parameters:
+        seed (int): Seed for the generator, None for a random one.
+        """
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    def roll(self, notation:str, times:int=1) -> np.ndarray:
+        """The totals of rolling notation, times times over."""
+        spec = parse_dice(notation) if isinstance(notation, str) else notation
+        rolls = 2 if spec.mode else 1
+        faces = self.rng.integers(1, spec.sides + 1, size=(rolls, times, spec.count))
+        totals = faces.sum(axis=-1)
+        if spec.explode:
+            exploding = faces == spec.sides
+            for _ in range(MAX_EXPLOSIONS):
+                if not exploding.any():
+                    break
+                extra = np.where(exploding, self.rng.integers(1, spec.sides + 1, size=faces.shape), 0)
+                totals += extra.sum(axis=-1)
+                exploding = extra == spec.sides
+        if spec.mode == 1:
+            totals = totals.max(axis=0)
+        elif spec.mode == -1:
+            totals = totals.min(axis=0)
+        else:
+            totals = totals[0]
+        return totals + spec.modifier
+
+    def check(self, notations:Sequence[str], difficulties:Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Roll every notation once and compare it with its difficulty, returns the totals and
+        whether each met its difficulty. Rolls of the same notation are drawn together.
+        """
+        notations = [parse_dice(notation) for notation in notations]
+        totals = np.empty(len(notations), dtype=np.int64)
+        by_spec = {}
+        for index, spec in enumerate(notations):
+            by_spec.setdefault(spec, []).append(index)
+        for spec, indices in by_spec.items():
+            totals[indices] = self.roll(spec, times=len(indices))
+        return totals, totals >= np.asarray(difficulties, dtype=np.int64)
+
+    def integers(self, low:int, high:int) -> int:
+        """One integer in [low, high], both included."""
+        return int(self.rng.integers(low, high + 1))
+
+    def to_state(self) -> dict:
+        return {"seed": self.seed, "rng": self.rng.bit_generator.state}
+
+    def load_state(self, state:dict):
+        self.seed = state["seed"]
+        self.rng.bit_generator.state = state["rng"]
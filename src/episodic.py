@@ -0,0 +1,182 @@
+from openai import OpenAI
+from src.clients import get_client_provider
+from pathlib import Path
+from typing import List
+import json
+import os
+import re
+import threading
+import zlib
+
+import faiss
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+
+    def __init__(self, dim:int=256):
+        """
+        Local, deterministic bag-of-words embedder using signed feature hashing.
+        Needs no network, so it is the default and what tests/offline runs use.
+        """
+        self.dim = dim
+
+    def embed(self, texts:List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                # crc32 rather than hash() so vectors are stable across processes
+                h = zlib.crc32(token.encode())
+                vectors[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class OpenAIEmbedder:
+
+    def __init__(self, model:str="text-embedding-3-small", dim:int=1536, client:OpenAI=None):
+        self.model = model
+        self.dim = dim
+        self.client = client or get_client_provider().openai
+
+    def embed(self, texts:List[str]) -> np.ndarray:
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        vectors = np.array([d.embedding for d in response.data], dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+
+class EpisodicMemory:
+
+    def __init__(
+            self,
+            embedder=None,
+            path:str=None,
+    ):
+        """
+        Long-term memory of game events, searched by inner product with faiss.knn.
+        Every event is embedded once and appended, the vectors are never rebuilt.
+
+        When a path is given the event texts are appended to events.jsonl and their vectors
+        to vectors.f32 (raw float32 rows) as they arrive. On load the vectors are memory-mapped
+        with np.memmap, so resuming a long game neither re-embeds its history nor reads the
+        vectors into RAM, and any events written without their vectors (a crash between the
+        two appends) are embedded and appended.
+
+        Parameters:
+        embedder: Any object with a dim attribute and an embed(texts) -> np.ndarray method.
+        path (str): Directory to persist the memory to, in-memory only if None.
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.path = Path(path) if path is not None else None
+        self.events: List[str] = []
+        # in memory: rows [0, _count) of _buffer, persisted: rows of vectors.f32, mapped on demand
+        self._buffer = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._mapped = None
+        self._count = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.load()
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def vectors_path(self):
+        return self.path / "vectors.f32"
+
+    @property
+    def events_path(self):
+        return self.path / "events.jsonl"
+
+    def add(self, text:str):
+        self.extend([text])
+
+    def extend(self, texts:List[str]):
+        """Add several events with a single embedding call."""
+        if not texts:
+            return
+        vectors = np.ascontiguousarray(self.embedder.embed(texts), dtype=np.float32)
+        with self._lock:
+            self._append(texts, vectors)
+
+    def _append(self, texts:List[str], vectors:np.ndarray):
+        if self.path is not None:
+            with open(self.events_path, "a") as file:
+                file.write("".join(json.dumps(text) + "\n" for text in texts))
+            with open(self.vectors_path, "ab") as file:
+                file.write(vectors.tobytes())
+        else:
+            if self._count + len(vectors) > len(self._buffer):
+                # doubling keeps appends amortised O(1)
+                grown = np.zeros((max(2 * len(self._buffer), self._count + len(vectors)), self.embedder.dim), dtype=np.float32)
+                grown[:self._count] = self._buffer[:self._count]
+                self._buffer = grown
+            self._buffer[self._count:self._count + len(vectors)] = vectors
+        self.events += texts
+        self._count += len(vectors)
+
+    def _vectors(self) -> np.ndarray:
+        if self.path is None:
+            return self._buffer[:self._count]
+        if self._mapped is None or len(self._mapped) != self._count:
+            # the file only grows, mapping it again is cheap and reads nothing
+            self._mapped = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._count, self.embedder.dim))
+        return self._mapped
+
+    def search(self, query:str, k:int=3, exclude_last:int=0, min_score:float=0.0) -> List[str]:
+        """
+        Return the k events most similar to query, oldest first.
+        The newest exclude_last events are skipped, e.g. because they are already in the prompt verbatim.
+        """
+        with self._lock:
+            searchable = self._count - exclude_last
+            if searchable <= 0 or k <= 0:
+                return []
+            vector = self.embedder.embed([query])
+            scores, ids = faiss.knn(vector, self._vectors()[:searchable], min(k, searchable), faiss.METRIC_INNER_PRODUCT)
+            hits = [int(i) for score, i in zip(scores[0], ids[0]) if i >= 0 and score >= min_score]
+            return [self.events[i] for i in sorted(hits)]
+
+    def truncate(self, count:int):
+        """Forget every event after the first count, e.g. turns a crash kept out of the game save."""
+        with self._lock:
+            if count >= self._count:
+                return
+            self.events = self.events[:count]
+            self._count = count
+            self._mapped = None
+            if self.path is not None:
+                with open(self.events_path, "w") as file:
+                    file.write("".join(json.dumps(text) + "\n" for text in self.events))
+                os.truncate(self.vectors_path, count * self.embedder.dim * 4)
+
+    def sync(self, events:List[str]):
+        """Make the memory hold exactly events, embedding only the ones it is missing."""
+        self.truncate(len(events))
+        self.extend(events[len(self):])
+
+    def load(self):
+        if self.events_path.exists():
+            with open(self.events_path) as file:
+                self.events = [json.loads(line) for line in file if line.strip()]
+        row_bytes = self.embedder.dim * 4
+        rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        # drop vectors whose events never made it to disk and any torn row
+        self._count = min(rows, len(self.events))
+        with open(self.vectors_path, "ab") as file:
+            file.truncate(self._count * row_bytes)
+        self._mapped = None
+        # catch up on events written without their vectors
+        missing = self.events[self._count:]
+        if missing:
+            self.events = self.events[:self._count]
+            vectors = np.ascontiguousarray(self.embedder.embed(missing), dtype=np.float32)
+            with open(self.vectors_path, "ab") as file:
+                file.write(vectors.tobytes())
+            self.events += missing
+            self._count += len(missing)
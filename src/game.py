@@ -1,23 +1,55 @@
-from typing import List, Callable
+from typing import Dict, List, Callable, Literal
+from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import StructuredTool
-from langchain.pydantic_v1 import Field, create_model
-import random
+import numpy as np
 
-from src.sentients import Player, Monster, NPC
+from src.dice import DiceEngine, parse_dice
+from src.sentients import Player, Monster, NPC, BUILTIN_GROUPS, STATUSES
+from src.registry import EntityRegistry
 from src.utils import create_tool
 
+PER_ENTITY_TOOLS = "per_entity"
+PARAMETERIZED_TOOLS = "parameterized"
+TOOL_MODES = (PER_ENTITY_TOOLS, PARAMETERIZED_TOOLS)
+
+
+class StateChange(BaseModel):
+    """One change to one character."""
+    entity: str = Field(description="The name or id of the player, monster or NPC to change.")
+    op: Literal["modify_health", "modify_gold", "add_item", "remove_item"] = Field(
+        description="modify_health and modify_gold add amount (negative to take away), add_item and remove_item change the inventory.")
+    amount: int = Field(1, description="The health or gold to add or take away, or how many of the item.")
+    item: str = Field(None, description="The item to add or remove, for add_item and remove_item.")
+
+
+class DiceCheck(BaseModel):
+    """One dice roll."""
+    label: str = Field(description="What the roll is for, e.g. \"Bob climbs the wall\" or \"Goblin2 damage\".")
+    dice: str = Field("d20", description="Dice notation: 3d6+2, d20 adv (best of two), d20 dis (worst of two), 2d6! (exploding), d%.")
+    difficulty: int = Field(None, description="The total needed to succeed, leave out for rolls like damage that can't fail.")
+
 
 class NerdMaster:
 
-    history: list = []
+    history: list
     player: Player
-    monsters: list = []
-    npcs: list = []
-    tools: dict = {}
+    registry: EntityRegistry
+    tools: dict
+    tools_version: int
 
     def __init__(
             self,
+            tool_mode:str=PER_ENTITY_TOOLS,
+            seed:int=None,
         ):
+        assert tool_mode in TOOL_MODES, f"tool_mode must be one of {TOOL_MODES}"
+        self.tool_mode = tool_mode
+        self.dice = DiceEngine(seed)
+        self.history = []
+        self.registry = EntityRegistry()
+        self.tools_version = 0
+        self._tools_cache = None
+        self._tools_cache_version = None
         self.tools={
             "game_management":{
                 "player_setup": self.create_tool(self.setup_player),
@@ -30,32 +62,16 @@ class NerdMaster:
             }
         }
 
+    @property
+    def monsters(self):
+        return self.registry.of_kind("monster")
+
+    @property
+    def npcs(self):
+        return self.registry.of_kind("npc")
+
     def create_tool(self, callable:Callable):
-        method = callable
-        args = {k:v for k,v in method.__annotations__.items() if k != "self"}
-        name = method.__name__
-        doc = method.__doc__
-        func_desc = doc[doc.find("<desc>") + len("<desc>"):doc.find("</desc>")]
-        arg_desc = dict()
-        for arg in args.keys():
-            desc = doc[doc.find(f"{arg}: ")+len(f"{arg}: "):]
-            desc = desc[:desc.find("\n")]
-            arg_desc[arg] = desc
-        arg_fields = dict()
-        for k,v in args.items():
-            arg_fields[k] = (v, Field(description=arg_desc[k]))
-
-        # Create the new model
-        Model = create_model('Model', **arg_fields)
-
-        tool = StructuredTool.from_function(
-            func=method,
-            name=name,
-            description=func_desc,
-            args_schema=Model,
-            return_direct=False,
-        )
-        return tool
+        return create_tool(callable)
     
     def roll_dice(self:object, difficulty:int):
         """
@@ -68,25 +84,66 @@ class NerdMaster:
         str: A message showing the result of the roll.
         """
         assert 0 <= difficulty <= 100, "difficulty must be between 0 and 100"
-        roll = random.randint(0, 100)
+        roll = self.dice.integers(0, 100)
         if roll >= difficulty:
             return f"NerdMaster: The roll was {roll}. Success!"
         else:
             return f"NerdMaster: The roll was {roll}. Failure."
+
+    def roll_checks(self:object, checks:List[DiceCheck]):
+        """
+        <desc>Use this tool to make every roll a moment needs in one step, e.g. each character's attack and the damage of each hit, instead of rolling one at a time.</desc>
+
+        Args:
+        List[DiceCheck] - checks: The rolls to make, each with its dice and, if it can fail, its difficulty.
+
+        Returns:
+        str: The total of every roll and whether it met its difficulty.
+        """
+        checks = [check if isinstance(check, DiceCheck) else DiceCheck(**check) for check in checks]
+        if not checks:
+            return "NerdMaster Error: no rolls given."
+        errors = []
+        for check in checks:
+            try:
+                parse_dice(check.dice)
+            except ValueError as error:
+                errors.append(f"- {check.label}: {error}")
+        if errors:
+            return "NerdMaster Error: nothing was rolled.\n" + "\n".join(errors)
+        difficulties = [check.difficulty if check.difficulty is not None else np.iinfo(np.int64).min for check in checks]
+        totals, passed = self.dice.check([check.dice for check in checks], difficulties)
+        lines = []
+        for check, total, success in zip(checks, totals, passed):
+            line = f"- {check.label}: {parse_dice(check.dice)} = {total}"
+            if check.difficulty is not None:
+                line += f" against {check.difficulty}, {'success' if success else 'failure'}"
+            lines.append(line)
+        return "NerdMaster: The rolls were:\n" + "\n".join(lines)
     
     def get_sentients(self):
         sentients = "**Current Monsters and NPC's in the game**:"
         sentients += "**Monsters**:"
         for monster in self.monsters:
-            sentients += f"\n- {monster.name}"
+            sentients += f"\n- {monster.name} (id: {monster.id})"
         sentients += "**NPCs**:"
         for npc in self.npcs:
-            sentients += f"\n- {npc.name}"
+            sentients += f"\n- {npc.name} (id: {npc.id})"
         return sentients
     
     def get_tools_and_sentients(self):
-        return (self.get_tools_recursion(tools=self.tools, tools_list=[]),
+        return (self.get_tools(),
                 self.get_sentients())
+
+    def get_tools(self):
+        # the tool tree is only walked again after a tool was added or removed
+        if self._tools_cache_version != self.tools_version:
+            self._tools_cache = self.get_tools_recursion(tools=self.tools, tools_list=[])
+            self._tools_cache_version = self.tools_version
+        return list(self._tools_cache)
+
+    def _mark_tools_changed(self):
+        self.tools_version += 1
     
     def get_tools_recursion(self, tools:dict, tools_list:List[StructuredTool] = []):
         # get all tools
@@ -105,6 +162,7 @@ class NerdMaster:
         for category in tool_categories:
             tools = tools[category]
         tools.pop(tool_name)
+        self._mark_tools_changed()
     
     def _add_tool(self, 
         tool: Callable,
@@ -117,6 +175,7 @@ class NerdMaster:
                 tools[category] = {}
             tools = tools[category]
         tools[tool_name] = create_tool(tool)
+        self._mark_tools_changed()
 
     def _remove_tools(
             self,
@@ -126,6 +185,7 @@ class NerdMaster:
         if tools_names is None:
             for category in tools_categories:
                 self.tools.pop(category)
+            self._mark_tools_changed()
         else:
             for tool_name in tools_names:
                 self._remove_tool(tools_categories, tool_name)
@@ -149,79 +209,472 @@ class NerdMaster:
         Returns:
         str: A message confirming the player's character has been created.
         """
-        self.player = Player(name=name)
+        self._install_player(Player(name=name))
+        return f"NerdMaster: Player created with name {name}."
+
+    def _install_player(self, player:Player, entity_id:str=None):
+        self.player = player
+        self.registry.add(self.player, "player", entity_id)
         # remove the setup player tool
         self._remove_tool(["game_management"], "player_setup")
-        # add player tools
-        self._add_tools(self.player.tools, ["player"], [tool.__name__ for tool in self.player.tools])
+        if self.tool_mode == PARAMETERIZED_TOOLS:
+            # one tool per action for every entity, including the player
+            self._add_tools(self.entity_tools, ["entities"], [tool.__name__ for tool in self.entity_tools])
+        else:
+            # add player tools
+            self._add_tools(self.player.tools, ["player"], [tool.__name__ for tool in self.player.tools])
         self._add_tools([self.create_monster], ["monsters"], [self.create_monster.__name__])
         self._add_tools([self.create_npc], ["npcs"], [self.create_npc.__name__])
-        return f"NerdMaster: Player created with name {name}."
+        self._add_tools([self.transfer_items, self.apply_changes], ["game_management"],
+                        [self.transfer_items.__name__, self.apply_changes.__name__])
+        self._add_tools([self.roll_dice, self.roll_checks], ["dice"], [self.roll_dice.__name__, self.roll_checks.__name__])
+        self._add_tools(self.group_tools, ["groups"], [tool.__name__ for tool in self.group_tools])
     
-    def create_monster(self:object, name:str, equipment:List[str]):
+    def create_monster(self:object, name:str, equipment:List[str], group:str=None):
         """
         <desc>Use this tool to create a monster that the player must engage in battle with.</desc>
 
         Args:
         str - name: The name of the monster.
         List[str] - equipment: The equipment the monster has.
+        str - group: The group the monster fights in, e.g. a warband, so the group tools can affect all of its members at once.
         """
-        monster = Monster(name=name, equipment=equipment)
-        self.monsters.append(monster)
-        self._add_tools(monster.tools, ["monster", monster.name], [tool.__name__ for tool in monster.tools])
-        self._add_tools([self.remove_monster_from_game], ["game_management"], [self.remove_monster_from_game.__name__])
-        return f"NerdMaster: Monster created called {name}, with equipment: {equipment}."
+        if name in self.registry:
+            return f"NerdMaster Error: {name} is already in the game."
+        self._install_monster(Monster(name=name, equipment=equipment, group=group))
+        in_group = f" in group {group}" if group else ""
+        return f"NerdMaster: Monster created called {name}{in_group}, with equipment: {equipment}."
+
+    def _install_monster(self, monster:Monster, entity_id:str=None):
+        self.registry.add(monster, "monster", entity_id)
+        if self.tool_mode == PER_ENTITY_TOOLS:
+            self._add_tools(monster.tools, ["monster", monster.name], [tool.__name__ for tool in monster.tools])
+        if self.remove_monster_from_game.__name__ not in self.tools["game_management"]:
+            self._add_tools([self.remove_monster_from_game], ["game_management"], [self.remove_monster_from_game.__name__])
     
-    def create_npc(self:object, name:str, inventory:List[str]):
+    def create_npc(self:object, name:str, inventory:Dict[str, int], group:str=None):
         """
         <desc>Use this tool to create a non-player character (NPC) that the player can interact with.</desc>
 
         Args:
         str - name: The name of the NPC.
-        List[str] - inventory: The items the NPC has in their inventory.
+        Dict[str, int] - inventory: The items the NPC has in their inventory, mapped to how many of each.
+        str - group: The group the NPC belongs to, "party" if they travel with the player.
 
         Returns:
         str: A message confirming the NPC has been created.
         """
-        npc = NPC(name=name, inventory=inventory)
-        self._add_tools(npc.tools, ["npcs", npc.name], [tool.__name__ for tool in npc.tools])
-        self._add_tools([self.remove_npc_from_game], ["game_management"], [self.remove_npc_from_game.__name__])
-        return f"NerdMaster: NPC created called {name}, with inventory: {inventory}."
+        if name in self.registry:
+            return f"NerdMaster Error: {name} is already in the game."
+        npc = NPC(name=name, inventory=inventory, group=group)
+        self._install_npc(npc)
+        return f"NerdMaster: NPC created called {name}, with inventory:\n{npc.inventory.render()}"
+
+    def _install_npc(self, npc:NPC, entity_id:str=None):
+        self.registry.add(npc, "npc", entity_id)
+        if self.tool_mode == PER_ENTITY_TOOLS:
+            self._add_tools(npc.tools, ["npcs", npc.name], [tool.__name__ for tool in npc.tools])
+        if self.remove_npc_from_game.__name__ not in self.tools["game_management"]:
+            self._add_tools([self.remove_npc_from_game], ["game_management"], [self.remove_npc_from_game.__name__])
     
     def remove_monster_from_game(self:object, name:str):
         """
         <desc>Use this tool to remove a monster from the game.</desc>
 
         Args:
-        str - name: The name of the monster to remove.
+        str - name: The name or id of the monster to remove.
 
         Returns:
         str: A message confirming the monster has been removed from the game.
         """
-        for monster in self.monsters:
-            if monster.name == name:
-                monster_tools = monster.tools 
-                for tool in monster_tools:
-                    self._remove_tool(["monster", monster.name], tool.__name__)
-                self.monsters.remove(monster)
-                return f"NerdMaster: Monster {name} has been removed from the game."
-        return f"NerdMaster Error: Monster {name} is not in the game."
+        monster = self.registry.remove(name, "monster")
+        if monster is None:
+            return f"NerdMaster Error: Monster {name} is not in the game."
+        if self.tool_mode == PER_ENTITY_TOOLS:
+            for tool in monster.tools:
+                self._remove_tool(["monster", monster.name], tool.__name__)
+            self.tools["monster"].pop(monster.name)
+        return f"NerdMaster: Monster {monster.name} has been removed from the game."
     
     def remove_npc_from_game(self:object, name:str):
         """
         <desc>Use this tool to remove an NPC from the game.</desc>
 
         Args:
-        str - name: The name of the NPC to remove.
+        str - name: The name or id of the NPC to remove.
 
         Returns:
         str: A message confirming the NPC has been removed from the game.
         """
-        for npc in self.npcs:
-            if npc.name == name:
-                npc_tools = npc.tools 
-                for tool in npc_tools:
-                    self._remove_tool(["npc", npc.name], tool.__name__)
-                self.npcs.remove(npc)
-                return f"NerdMaster: NPC {name} has been removed from the game."
-        return f"NerdMaster Error: NPC {name} is not in the game."
\ No newline at end of file
+        npc = self.registry.remove(name, "npc")
+        if npc is None:
+            return f"NerdMaster Error: NPC {name} is not in the game."
+        if self.tool_mode == PER_ENTITY_TOOLS:
+            for tool in npc.tools:
+                self._remove_tool(["npcs", npc.name], tool.__name__)
+            self.tools["npcs"].pop(npc.name)
+        return f"NerdMaster: NPC {npc.name} has been removed from the game."
+
+    def _check_changes(self, changes:List[StateChange]) -> List[str]:
+        # replay the inventory changes on counts only, so later changes see the earlier ones
+        errors = []
+        counts = {}
+        for number, change in enumerate(changes, 1):
+            entity = self.registry.get(change.entity)
+            if entity is None:
+                errors.append(f"{number}. {change.entity} is not in the game.")
+            elif change.op != "modify_health" and not hasattr(entity, "inventory"):
+                errors.append(f"{number}. {entity.name} has no gold or inventory.")
+            elif change.op in ("add_item", "remove_item"):
+                if not change.item:
+                    errors.append(f"{number}. {change.op} needs an item.")
+                elif change.amount <= 0:
+                    errors.append(f"{number}. the amount of {change.item} must be at least 1.")
+                else:
+                    key = (entity.id, change.item)
+                    count = counts.get(key, entity.inventory.count(change.item))
+                    count += change.amount if change.op == "add_item" else -change.amount
+                    if count < 0:
+                        errors.append(f"{number}. {entity.name} does not have enough {change.item}.")
+                    counts[key] = count
+        return errors
+
+    def apply_changes(self:object, changes:List[StateChange]):
+        """
+        <desc>Use this tool to make several changes to the player, monsters and NPCs in one step, e.g. a combat round that damages several monsters and hands out loot. Either every change is made or none is.</desc>
+
+        Args:
+        List[StateChange] - changes: The changes to make, in order.
+
+        Returns:
+        str: The new state of every character that changed, or why nothing changed.
+        """
+        changes = [change if isinstance(change, StateChange) else StateChange(**change) for change in changes]
+        if not changes:
+            return "NerdMaster Error: no changes given."
+        errors = self._check_changes(changes)
+        if errors:
+            return "NerdMaster Error: nothing was changed.\n" + "\n".join(errors)
+        # entity id -> (entity, item -> net quantity)
+        changed = {}
+        for change in changes:
+            entity = self.registry.get(change.entity)
+            _, items = changed.setdefault(entity.id, (entity, {}))
+            if change.op == "modify_health":
+                entity.health = max(0, entity.health + change.amount)
+            elif change.op == "modify_gold":
+                entity.gold += change.amount
+            elif change.op == "add_item":
+                entity.inventory.add(change.item, change.amount)
+                items[change.item] = items.get(change.item, 0) + change.amount
+            else:
+                entity.inventory.remove(change.item, change.amount)
+                items[change.item] = items.get(change.item, 0) - change.amount
+        summary = []
+        for entity, items in changed.values():
+            entity._changed()
+            line = f"- {entity.name}: {entity.health} health"
+            if hasattr(entity, "inventory"):
+                line += f", {entity.gold} gold"
+            line += "".join(f", {quantity:+d} {item}" for item, quantity in items.items() if quantity)
+            summary.append(line)
+        return f"NerdMaster: {len(changes)} changes made.\n" + "\n".join(summary)
+
+    def entity_state(self, entity_id:str) -> dict:
+        entity = self.registry.get(entity_id)
+        return {"kind": self.registry.kind_of(entity_id), **entity.to_state()}
+
+    def to_state(self) -> dict:
+        """The whole world as plain data, see load_state."""
+        return {
+            "tool_mode": self.tool_mode,
+            "next_id": self.registry.next_id,
+            "entities": {entity.id: self.entity_state(entity.id) for entity in self.registry},
+            "dice": self.dice.to_state(),
+        }
+
+    def load_state(self, state:dict):
+        """Rebuild the world (and its tools) from to_state() data, on a fresh NerdMaster."""
+        installers = {
+            "player": (Player, self._install_player),
+            "monster": (Monster, self._install_monster),
+            "npc": (NPC, self._install_npc),
+        }
+        # the player first, creating it is what unlocks the other tools
+        ordered = sorted(state["entities"].items(),
+                         key=lambda item: (item[1]["kind"] != "player", int(item[0].rsplit("-", 1)[1])))
+        for entity_id, entity_state in ordered:
+            cls, install = installers[entity_state["kind"]]
+            install(cls.from_state(entity_state), entity_id)
+        self.registry.next_id = state["next_id"]
+        if "dice" in state:
+            self.dice.load_state(state["dice"])
+
+    @property
+    def group_tools(self):
+        return [
+            self.get_group,
+            self.modify_group_health,
+            self.set_group_status,
+        ]
+
+    def _group_slots(self, group:str):
+        slots = self.registry.stats.select(group)
+        if slots is None:
+            named = [name for name in self.registry.stats.group_names if name not in BUILTIN_GROUPS]
+            known = ", ".join(BUILTIN_GROUPS + tuple(named))
+            return None, f"NerdMaster Error: there is no group called {group}, the groups are: {known}."
+        if len(slots) == 0:
+            return None, f"NerdMaster Error: nobody is left in {group}."
+        return slots, None
+
+    def _group_changed(self, slots):
+        owners = self.registry.stats.owners
+        self.registry.mark_dirty_many(owners[slot].id for slot in slots)
+
+    def get_group(self:object, group:str):
+        """
+        <desc>Use this tool to get the health and status of every member of a group, e.g. "monsters", "npcs", "party", "everyone" or a group named when creating monsters or NPCs.</desc>
+
+        Args:
+        str - group: The name of the group.
+
+        Returns:
+        str: The health and status of the group's members, summarized for large groups.
+        """
+        slots, error = self._group_slots(group)
+        if error:
+            return error
+        stats = self.registry.stats
+        health, status = stats.health[slots], stats.status[slots]
+        standing = int((health > 0).sum())
+        summary = f"NerdMaster: {group} has {len(slots)} members, {standing} still standing."
+        if len(slots) <= 10:
+            members = [f"- {stats.owners[slot].name}: {h} health, {STATUSES[c]}" for slot, h, c in zip(slots, health, status)]
+            return summary + "\n" + "\n".join(members)
+        counts = np.bincount(status, minlength=len(STATUSES))
+        statuses = ", ".join(f"{count} {name}" for name, count in zip(STATUSES, counts) if count)
+        return summary + f"\nHealth: lowest {health.min()}, average {health.mean():.0f}, highest {health.max()}.\nStatus: {statuses}."
+
+    def modify_group_health(self:object, group:str, amount:int):
+        """
+        <desc>Use this tool to change the health of every member of a group at once, e.g. a fireball that hits all monsters or a spell that heals the party. Health never drops below 0.</desc>
+
+        Args:
+        str - group: The name of the group, e.g. "monsters", "npcs", "party", "everyone" or a group named when creating monsters or NPCs.
+        int - amount: The amount to add to each member's health, negative for damage.
+
+        Returns:
+        str: A summary of the group's health afterwards.
+        """
+        assert isinstance(amount, int), "amount must be an integer"
+        slots, error = self._group_slots(group)
+        if error:
+            return error
+        stats = self.registry.stats
+        stats.modify_health(slots, amount)
+        self._group_changed(slots)
+        health = stats.health[slots]
+        fallen = int((health == 0).sum())
+        return (f"NerdMaster: {len(slots)} members of {group} changed by {amount:+d} health, "
+                f"{fallen} now at 0 health, lowest {health.min()}, highest {health.max()}.")
+
+    def set_group_status(self:object, group:str, status:str):
+        """
+        <desc>Use this tool to give every member of a group the same status at once, e.g. a sleep spell or poison gas. Use "normal" to clear it.</desc>
+
+        Args:
+        str - group: The name of the group, e.g. "monsters", "npcs", "party", "everyone" or a group named when creating monsters or NPCs.
+        str - status: One of normal, poisoned, stunned, asleep, charmed or fleeing.
+
+        Returns:
+        str: A message confirming the status change.
+        """
+        if status not in STATUSES:
+            return f"NerdMaster Error: {status} is not a status, use one of: {', '.join(STATUSES)}."
+        slots, error = self._group_slots(group)
+        if error:
+            return error
+        self.registry.stats.set_status(slots, status)
+        self._group_changed(slots)
+        return f"NerdMaster: {len(slots)} members of {group} are now {status}."
+
+    @property
+    def entity_tools(self):
+        return [
+            self.get_entity_health,
+            self.modify_entity_health,
+            self.get_entity_inventory,
+            self.add_to_entity_inventory,
+            self.remove_from_entity_inventory,
+            self.add_items_to_entity_inventory,
+            self.remove_items_from_entity_inventory,
+            self.get_entity_gold,
+            self.modify_entity_gold,
+        ]
+
+    def _call_entity(self, entity:str, method:str, *args):
+        target = self.registry.get(entity)
+        if target is None:
+            return f"NerdMaster Error: {entity} is not in the game."
+        if not hasattr(target, method):
+            return f"NerdMaster Error: {entity} does not support {method}."
+        return getattr(target, method)(*args)
+
+    def get_entity_health(self:object, entity:str):
+        """
+        <desc>Use this tool to get the amount of health a character (player, monster or NPC) has remaining.</desc>
+
+        Args:
+        str - entity: The name or id of the player, monster or NPC.
+
+        Returns:
+        str: A message showing the amount of health the character has remaining.
+        """
+        return self._call_entity(entity, "get_health")
+
+    def modify_entity_health(self:object, entity:str, amount:int):
+        """
+        <desc>Use this tool to modify the health of a character (player, monster or NPC) in response to an event that has occurred in the story.</desc>
+
+        Args:
+        str - entity: The name or id of the player, monster or NPC.
+        int - amount: The amount of health to modify the character's health by.
+
+        Returns:
+        str: A message showing the amount of health the character has remaining.
+        """
+        return self._call_entity(entity, "modify_health", amount)
+
+    def get_entity_inventory(self:object, entity:str):
+        """
+        <desc>Use this tool to get the items in the inventory of the player or an NPC.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+
+        Returns:
+        str: A string listing the items in the character's inventory.
+        """
+        return self._call_entity(entity, "get_inventory")
+
+    def add_to_entity_inventory(self:object, entity:str, item:str, quantity:int=1):
+        """
+        <desc>Use this tool to add an item to the inventory of the player or an NPC.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+        str - item: The item to add to the character's inventory.
+        int - quantity: How many of the item to add.
+
+        Returns:
+        str: A message confirming the item has been added to the character's inventory.
+        """
+        return self._call_entity(entity, "add_to_inventory", item, quantity)
+
+    def remove_from_entity_inventory(self:object, entity:str, item:str, quantity:int=1):
+        """
+        <desc>Use this tool to remove an item from the inventory of the player or an NPC.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+        str - item: The item to remove from the character's inventory.
+        int - quantity: How many of the item to remove.
+
+        Returns:
+        str: A message confirming the item has been removed from the character's inventory.
+        """
+        return self._call_entity(entity, "remove_from_inventory", item, quantity)
+
+    def add_items_to_entity_inventory(self:object, entity:str, items:Dict[str, int]):
+        """
+        <desc>Use this tool to add several items to the inventory of the player or an NPC at once.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+        Dict[str, int] - items: The items to add, mapped to how many of each.
+
+        Returns:
+        str: A message confirming the items have been added to the character's inventory.
+        """
+        return self._call_entity(entity, "add_items_to_inventory", items)
+
+    def remove_items_from_entity_inventory(self:object, entity:str, items:Dict[str, int]):
+        """
+        <desc>Use this tool to remove several items from the inventory of the player or an NPC at once.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+        Dict[str, int] - items: The items to remove, mapped to how many of each.
+
+        Returns:
+        str: A message confirming which items have been removed from the character's inventory.
+        """
+        return self._call_entity(entity, "remove_items_from_inventory", items)
+
+    def transfer_items(self:object, from_entity:str, to_entity:str, items:Dict[str, int]=None, gold:int=0):
+        """
+        <desc>Use this tool to move items and gold from one character to another in a single step, e.g. a trade, a purchase, a gift or a theft.</desc>
+
+        Args:
+        str - from_entity: The name or id of the player or NPC giving the items.
+        str - to_entity: The name or id of the player or NPC receiving the items.
+        Dict[str, int] - items: The items to move, mapped to how many of each.
+        int - gold: The amount of gold to move along with the items.
+
+        Returns:
+        str: A message confirming what changed hands, or why nothing did.
+        """
+        items = {item: quantity for item, quantity in (items or {}).items() if quantity > 0}
+        source, target = self.registry.get(from_entity), self.registry.get(to_entity)
+        for name, entity in ((from_entity, source), (to_entity, target)):
+            if entity is None:
+                return f"NerdMaster Error: {name} is not in the game."
+            if not hasattr(entity, "inventory"):
+                return f"NerdMaster Error: {name} has no inventory."
+        if source is target:
+            return f"NerdMaster Error: {source.name} can't trade with themselves."
+        if not items and gold <= 0:
+            return "NerdMaster Error: nothing to transfer."
+        # all or nothing, check everything before changing anything
+        missing = [item for item, quantity in items.items() if source.inventory.count(item) < quantity]
+        if missing:
+            return f"NerdMaster Error: {source.name} does not have enough of: {', '.join(missing)}. Nothing was transferred."
+        if gold > source.gold:
+            return f"NerdMaster Error: {source.name} only has {source.gold} gold. Nothing was transferred."
+        for item, quantity in items.items():
+            source.inventory.remove(item, quantity)
+            target.inventory.add(item, quantity)
+        source.gold -= max(gold, 0)
+        target.gold += max(gold, 0)
+        source._changed()
+        target._changed()
+        moved = [source._listing(items)] if items else []
+        if gold > 0:
+            moved.append(f"{gold} gold")
+        return f"NerdMaster: {' and '.join(moved)} moved from {source.name} to {target.name}."
+
+    def get_entity_gold(self:object, entity:str):
+        """
+        <desc>Use this tool to get the amount of gold the player or an NPC has.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+
+        Returns:
+        str: A string showing the amount of gold the character has.
+        """
+        return self._call_entity(entity, "get_gold")
+
+    def modify_entity_gold(self:object, entity:str, amount:int):
+        """
+        <desc>Use this tool to modify the amount of gold the player or an NPC has.</desc>
+
+        Args:
+        str - entity: The name or id of the player or NPC.
+        int - amount: The amount of gold to add or remove from the character's gold total.
+
+        Returns:
+        str: A message confirming the amount of gold the character now has.
+        """
+        return self._call_entity(entity, "modify_gold", amount)
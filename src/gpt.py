@@ -1,7 +1,12 @@
-from openai import OpenAI
+import logging
 import os
+from src.cache import ResponseCache
+from src.clients import ClientProvider, get_client_provider
+from src.tracing import get_tracer
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 ART_SYSTEM_PROMPT = """You are an Art Director for a video game company. You are tasked with creating concept art for a new game.
@@ -12,9 +17,14 @@ Your output should be a detailed description of what you envisage seeing in the
 IMAGE_TAGS_PROMPT = """Given the game world narrative provided by the user, generate a list of tags that describe the art style that suits the narrative. 
 This should be a comma-separated list of thematic keywords, for example: "fantasy, medieval, dark, gritty"."""
 
+HISTORY_SUMMARY_PROMPT = """You keep the notes for the Games Master of a text-based adventure game.
+The user provides the current summary of the game so far, followed by new events that happened after it.
+Rewrite the summary so that it also covers the new events. Keep every fact that matters for the rest of the game, such as names, places, items, gold, injuries, quests and promises. Be concise."""
+
 SYSTEM_PROMPTS = {
     "art_system_prompt": ART_SYSTEM_PROMPT,
-    "image_tags": IMAGE_TAGS_PROMPT
+    "image_tags": IMAGE_TAGS_PROMPT,
+    "history_summary": HISTORY_SUMMARY_PROMPT
 }
 
 class StandardGPT:
@@ -23,27 +33,59 @@ class StandardGPT:
             self,
             api_key: str = os.environ.get("OPENAI_API_KEY"),
             model: str = "gpt-3.5-turbo",
+            cache: ResponseCache = None,
+            client_provider: ClientProvider = None,
     ):
         self.api_key = api_key
-        self.client = OpenAI()
+        self.client_provider = client_provider or get_client_provider()
         self.model = model
+        self.cache = cache
 
-    def generate(
-            self,
-            prompt: str,
-            max_tokens: int = 200,
-            system_prompt: str = "art_system_prompt"
-    ):
-        print(str({"role": "system", "content": SYSTEM_PROMPTS[system_prompt]}),'\n',
-                str({"role": "user", "content": prompt}))
+    @property
+    def client(self):
+        return self.client_provider.openai
+
+    def _complete(self, system_message: str, prompt: str, max_tokens: int):
         response = self.client.chat.completions.create(
             model=self.model,
             max_tokens=max_tokens,
             messages=[
-                {"role": "system", "content": SYSTEM_PROMPTS[system_prompt]},
+                {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ]
         )
-        response = response.choices[0].message.content
-        print(response)
-        return response
\ No newline at end of file
+        if response.usage is not None:
+            tracer = get_tracer()
+            tracer.count("llm_tokens_total", response.usage.prompt_tokens, model=self.model, kind="prompt")
+            tracer.count("llm_tokens_total", response.usage.completion_tokens, model=self.model, kind="completion")
+        return response.choices[0].message.content
+
+    def generate(
+            self,
+            prompt: str,
+            max_tokens: int = 200,
+            system_prompt: str = "art_system_prompt",
+            use_cache: bool = True,
+    ):
+        tracer = get_tracer()
+        with tracer.span("gpt", labels={"system_prompt": system_prompt}, model=self.model, prompt_chars=len(prompt)) as span:
+            key = None
+            if self.cache is not None and use_cache:
+                key = self.cache.make_key(
+                    model=self.model,
+                    system_prompt=SYSTEM_PROMPTS[system_prompt],
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                )
+                cached = self.cache.get(key)
+                tracer.count("gpt_cache_total", result="hit" if cached is not None else "miss")
+                if cached is not None:
+                    span.set(cache="hit")
+                    return cached
+            # lazy %-formatting, multi-KB prompts are only rendered when debug logging is on
+            logger.debug("gpt request system=%r user=%r", SYSTEM_PROMPTS[system_prompt], prompt)
+            response = self._complete(SYSTEM_PROMPTS[system_prompt], prompt, max_tokens)
+            logger.debug("gpt response %r", response)
+            if key is not None:
+                self.cache.set(key, response)
+            return response
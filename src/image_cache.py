@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+from src.episodic import HashingEmbedder
+
+# USD per image, https://openai.com/pricing
+DALLE_PRICES = {
+    ("dall-e-3", "standard", "1024x1024"): 0.04,
+    ("dall-e-3", "standard", "1792x1024"): 0.08,
+    ("dall-e-3", "standard", "1024x1792"): 0.08,
+    ("dall-e-3", "hd", "1024x1024"): 0.08,
+    ("dall-e-3", "hd", "1792x1024"): 0.12,
+    ("dall-e-3", "hd", "1024x1792"): 0.12,
+    ("dall-e-2", "standard", "1024x1024"): 0.02,
+    ("dall-e-2", "standard", "512x512"): 0.018,
+    ("dall-e-2", "standard", "256x256"): 0.016,
+}
+
+# bump when the stored payload changes, entries of other formats are dropped on load
+# 1: the downloaded image, 2: packed ImageRenditions
+CACHE_FORMAT = 2
+
+
+def image_price(model:str, quality:str, size:str):
+    return DALLE_PRICES.get((model, quality, size), 0.0)
+
+
+class ImageCache:
+
+    def __init__(
+            self,
+            directory:str="./cache/images",
+            max_bytes:int=256*1024*1024,
+            similarity_threshold:float=0.9,
+            embedder=None,
+    ):
+        """
+        Disk cache of generated images in front of ImageGenerator.generate.
+        Requests match exactly on a hash of the art prompt, narrative tags and image settings,
+        or approximately when the embedding of prompt + tags is within similarity_threshold
+        (cosine similarity) of a cached image with the same settings.
+        Images are evicted least recently used first once they take more than max_bytes.
+
+        Parameters:
+        directory (str): Where the images and the index.json metadata are stored.
+        max_bytes (int): Maximum total size of the cached images.
+        similarity_threshold (float): Cosine similarity needed for a near-duplicate hit, above 1 disables it.
+        embedder: Any object with an embed(texts) -> np.ndarray method returning normalised vectors.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder or HashingEmbedder()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "seconds_saved": 0.0, "dollars_saved": 0.0}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def index_path(self):
+        return self.directory / "index.json"
+
+    def _load(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path) as file:
+            entries = json.load(file)
+        stale = False
+        for key, entry in entries:
+            path = self.directory / entry["file"]
+            if entry.get("format", 1) != CACHE_FORMAT:
+                path.unlink(missing_ok=True)
+                stale = True
+            elif path.exists():
+                entry["vector"] = np.array(entry["vector"], dtype=np.float32)
+                self.entries[key] = entry
+                self.total_bytes += entry["bytes"]
+        if stale:
+            self._save_index()
+
+    def _save_index(self):
+        entries = [
+            (key, {**entry, "vector": entry["vector"].tolist()})
+            for key, entry in self.entries.items()
+        ]
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(entries, file)
+        tmp_path.replace(self.index_path)
+
+    @staticmethod
+    def _variant(model:str, size:str, quality:str):
+        return f"{model}|{size}|{quality}"
+
+    @staticmethod
+    def make_key(prompt:str, tags:str, model:str, size:str, quality:str):
+        payload = json.dumps([CACHE_FORMAT, prompt, tags, model, size, quality])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _embed(self, prompt:str, tags:str):
+        return self.embedder.embed([f"{prompt}\n{tags}"])[0]
+
+    def _hit(self, key:str, kind:str):
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        self.stats[kind] += 1
+        self.stats["seconds_saved"] += entry["seconds"]
+        self.stats["dollars_saved"] += entry["cost"]
+        return entry
+
+    def lookup(self, prompt:str, tags:str="", model:str="dall-e-3", size:str="1792x1024", quality:str="standard"):
+        """
+        Returns (image bytes, entry metadata, match kind) for a cached image, or None on a miss.
+        """
+        key = self.make_key(prompt, tags, model, size, quality)
+        with self._lock:
+            if key in self.entries:
+                hit, kind = key, "exact"
+            else:
+                hit, kind = None, None
+                if self.similarity_threshold <= 1.0:
+                    variant = self._variant(model, size, quality)
+                    candidates = [k for k, e in self.entries.items() if e["variant"] == variant]
+                    if candidates:
+                        vector = self._embed(prompt, tags)
+                        matrix = np.stack([self.entries[k]["vector"] for k in candidates])
+                        scores = matrix @ vector
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.similarity_threshold:
+                            hit, kind = candidates[best], "near"
+            if hit is None:
+                self.stats["misses"] += 1
+                return None
+            # read under the lock, a concurrent store may evict the entry and unlink its file
+            try:
+                data = (self.directory / self.entries[hit]["file"]).read_bytes()
+            except OSError:
+                # gone from disk anyway, e.g. removed by hand, forget it and generate again
+                self.total_bytes -= self.entries.pop(hit)["bytes"]
+                self._save_index()
+                self.stats["misses"] += 1
+                return None
+            entry = self._hit(hit, f"{kind}_hits")
+        return data, entry, kind
+
+    def store(self, prompt:str, data:bytes, seconds:float, tags:str="", model:str="dall-e-3", size:str="1792x1024", quality:str="standard"):
+        key = self.make_key(prompt, tags, model, size, quality)
+        file_name = f"{key}.bin"
+        (self.directory / file_name).write_bytes(data)
+        with self._lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)["bytes"]
+            self.entries[key] = {
+                "file": file_name,
+                "format": CACHE_FORMAT,
+                "bytes": len(data),
+                "seconds": seconds,
+                "cost": image_price(model, quality, size),
+                "variant": self._variant(model, size, quality),
+                "prompt": prompt,
+                "vector": self._embed(prompt, tags),
+            }
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted["bytes"]
+                (self.directory / evicted["file"]).unlink(missing_ok=True)
+            self._save_index()
+        return key
+
+    def hit_rate(self):
+        hits = self.stats["exact_hits"] + self.stats["near_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_DEFAULT_IMAGE_CACHE = None
+_DEFAULT_IMAGE_CACHE_LOCK = threading.Lock()
+
+def get_default_image_cache(directory:str="./cache/images") -> ImageCache:
+    global _DEFAULT_IMAGE_CACHE
+    with _DEFAULT_IMAGE_CACHE_LOCK:
+        if _DEFAULT_IMAGE_CACHE is None:
+            _DEFAULT_IMAGE_CACHE = ImageCache(directory=directory)
+        return _DEFAULT_IMAGE_CACHE
@@ -1,21 +1,138 @@
-from openai import OpenAI
-import requests
 from io import BytesIO
-from PIL import Image
-import os 
+from PIL import Image, features
+import base64
+import os
+import struct
+import time
 from dotenv import load_dotenv
+from src.image_cache import ImageCache, image_price
+from src.clients import ClientProvider, get_client_provider
+from src.tracing import get_tracer
 
 load_dotenv()
 
+# name -> scale of the original image, largest first
+RENDITION_SCALES = {
+    "full": 1.0,
+    "display": 0.6,
+    "thumbnail": 0.15,
+}
+RENDITION_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+
+class ImageRenditions:
+
+    def __init__(self, renditions:dict, sizes:dict, format:str=RENDITION_FORMAT):
+        """
+        Pre-encoded versions of one generated image, ready to hand to st.image.
+
+        Parameters:
+        renditions (dict): Rendition name -> encoded image bytes.
+        sizes (dict): Rendition name -> (width, height).
+        format (str): The PIL format the renditions are encoded in.
+        """
+        self.renditions = renditions
+        self.sizes = sizes
+        self.format = format
+
+    def __getitem__(self, name:str) -> bytes:
+        return self.renditions[name]
+
+    @property
+    def full(self):
+        return self.renditions["full"]
+
+    @property
+    def display(self):
+        return self.renditions["display"]
+
+    @property
+    def thumbnail(self):
+        return self.renditions["thumbnail"]
+
+    @property
+    def size(self):
+        return self.sizes["full"]
+
+    def to_image(self, name:str="full"):
+        return Image.open(BytesIO(self.renditions[name]))
+
+    def to_bytes(self) -> bytes:
+        # format, then (name, width, height, length) headers, then the payloads
+        header = [self.format.encode()]
+        for name, data in self.renditions.items():
+            width, height = self.sizes[name]
+            header.append(struct.pack("!16sIII", name.encode(), width, height, len(data)))
+        blob = struct.pack("!8sI", header[0], len(self.renditions)) + b"".join(header[1:])
+        return blob + b"".join(self.renditions.values())
+
+    @classmethod
+    def from_bytes(cls, blob:bytes):
+        format, count = struct.unpack_from("!8sI", blob, 0)
+        offset = struct.calcsize("!8sI")
+        entries = []
+        for _ in range(count):
+            name, width, height, length = struct.unpack_from("!16sIII", blob, offset)
+            offset += struct.calcsize("!16sIII")
+            entries.append((name.rstrip(b"\0").decode(), width, height, length))
+        renditions, sizes = {}, {}
+        for name, width, height, length in entries:
+            renditions[name] = blob[offset:offset + length]
+            sizes[name] = (width, height)
+            offset += length
+        return cls(renditions, sizes, format.rstrip(b"\0").decode())
+
+
+def render_image(data:bytes, scales:dict=RENDITION_SCALES, format:str=RENDITION_FORMAT, quality:int=85) -> ImageRenditions:
+    """
+    Decode an image once and encode every rendition in a single pass.
+    Each rendition is resized from the previous (larger) one, and JPEG sources are
+    decoded straight at reduced size via draft mode.
+    """
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    largest = max(scales.values())
+    if largest < 1:
+        # only JPEG supports draft decoding, it is a no-op for the PNGs DALL-E returns
+        img.draft("RGB", (int(width * largest), int(height * largest)))
+    img = img.convert("RGB")
+    options = {"quality": quality}
+    if format == "WEBP":
+        # fastest encoder setting, the size difference is small at this quality
+        options["method"] = 0
+    renditions, sizes = {}, {}
+    for name, scale in sorted(scales.items(), key=lambda item: -item[1]):
+        target = (max(1, int(width * scale)), max(1, int(height * scale)))
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS, reducing_gap=2.0)
+        buffer = BytesIO()
+        img.save(buffer, format=format, **options)
+        renditions[name] = buffer.getvalue()
+        sizes[name] = target
+    return ImageRenditions(renditions, sizes, format)
+
+
 class ImageGenerator:
     def __init__(
-            self, 
+            self,
             api_key:str=os.environ.get("OPENAI_API_KEY"),
             model:str="dall-e-3",
+            cache:ImageCache=None,
+            scales:dict=RENDITION_SCALES,
+            client_provider:ClientProvider=None,
         ):
         self.api_key = api_key
-        self.client = OpenAI()
+        self.client_provider = client_provider or get_client_provider()
         self.model = model
+        self.cache = cache
+        self.scales = scales
+        # this session's share of the (possibly shared) cache's savings
+        self.stats = {"requests": 0, "hits": 0, "generated": 0, "seconds_spent": 0.0,
+                      "seconds_saved": 0.0, "dollars_spent": 0.0, "dollars_saved": 0.0}
+
+    @property
+    def client(self):
+        return self.client_provider.openai
 
     def crop_height(self, img, pixels):
         width, height = img.size
@@ -25,31 +142,66 @@ class ImageGenerator:
         # crop from bottom
         img = img.crop((0, 0, width, height - half_pixels))
         return img
-    
+
     def scale_image(self, img, percent:float=0.1):
         width, height = img.size
         new_width = int(width * percent)
         new_height = int(height * percent)
-        img = img.resize((new_width, new_height))
+        img = img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=2.0)
         return img
 
+    def hit_rate(self):
+        return self.stats["hits"] / self.stats["requests"] if self.stats["requests"] else 0.0
+
     def generate(
-            self, 
-            prompt:str, 
-            size:str="1792x1024", 
-            quality:str="standard", 
-            n:int=1
-        ):
+            self,
+            prompt:str,
+            size:str="1792x1024",
+            quality:str="standard",
+            n:int=1,
+            tags:str="",
+        ) -> ImageRenditions:
+        self.stats["requests"] += 1
+        tracer = get_tracer()
+        with tracer.span("image", labels={"model": self.model}, size=size, quality=quality) as span:
+            if self.cache is not None:
+                cached = self.cache.lookup(prompt, tags=tags, model=self.model, size=size, quality=quality)
+                tracer.count("image_cache_total", result=cached[2] if cached is not None else "miss")
+                if cached is not None:
+                    data, entry, match = cached
+                    span.set(cache=match)
+                    self.stats["hits"] += 1
+                    self.stats["seconds_saved"] += entry["seconds"]
+                    self.stats["dollars_saved"] += entry["cost"]
+                    return ImageRenditions.from_bytes(data)
+            start = time.perf_counter()
+            with tracer.span("image_api", labels={"model": self.model}):
+                data = self._generate(prompt, size=size, quality=quality, n=n)
+            with tracer.span("image_render"):
+                img = render_image(data, scales=self.scales)
+            seconds = time.perf_counter() - start
+            self.stats["generated"] += 1
+            self.stats["seconds_spent"] += seconds
+            self.stats["dollars_spent"] += image_price(self.model, quality, size)
+            tracer.count("image_dollars_total", image_price(self.model, quality, size), model=self.model)
+            if self.cache is not None:
+                self.cache.store(prompt, img.to_bytes(), seconds, tags=tags, model=self.model, size=size, quality=quality)
+            return img
+
+    def _generate(
+            self,
+            prompt:str,
+            size:str="1792x1024",
+            quality:str="standard",
+            n:int=1,
+        ) -> bytes:
+        # b64_json returns the image inline, saving a second round trip to download it
         response = self.client.images.generate(
             prompt=prompt,
             size=size,
             quality=quality,
             model=self.model,
             n=n,
+            response_format="b64_json",
         )
-        url = response.data[0].url
-        img = requests.get(url)
-        img = Image.open(BytesIO(img.content))
-        # img = self.crop_height(img, 150)
-        img = self.scale_image(img, 0.6)
-        return img
\ No newline at end of file
+        return base64.b64decode(response.data[0].b64_json)
@@ -0,0 +1,94 @@
+from collections import Counter
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+
+class Inventory:
+
+    def __init__(self, items:Union[Iterable[str], Dict[str, int]]=None):
+        """
+        Counted items, item -> quantity.
+        Adding and removing are O(1) and removing something that isn't there is not
+        an error, it just removes nothing. The text shown to the agent is rendered once
+        and reused until the next change.
+
+        Parameters:
+        items: A list of items (repeats are counted) or a dict of item -> quantity.
+        """
+        self._counts = Counter()
+        self._rendered = None
+        if isinstance(items, dict):
+            for item, quantity in items.items():
+                self.add(item, quantity)
+        elif items is not None:
+            for item in items:
+                self.add(item)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, item:str):
+        return item in self._counts
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._counts)
+
+    def __eq__(self, other):
+        if isinstance(other, Inventory):
+            return self._counts == other._counts
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Inventory({dict(self._counts)})"
+
+    def count(self, item:str) -> int:
+        return self._counts.get(item, 0)
+
+    def total(self) -> int:
+        return sum(self._counts.values())
+
+    def items(self) -> Iterable[Tuple[str, int]]:
+        return self._counts.items()
+
+    def add(self, item:str, quantity:int=1) -> int:
+        """Add quantity of item, returns how many there are now."""
+        if quantity <= 0:
+            return self.count(item)
+        self._counts[item] += quantity
+        self._rendered = None
+        return self._counts[item]
+
+    def remove(self, item:str, quantity:int=1) -> int:
+        """Remove up to quantity of item, returns how many were removed."""
+        have = self._counts.get(item, 0)
+        removed = min(have, max(quantity, 0))
+        if removed == 0:
+            return 0
+        if removed == have:
+            del self._counts[item]
+        else:
+            self._counts[item] = have - removed
+        self._rendered = None
+        return removed
+
+    def has(self, items:Dict[str, int]) -> bool:
+        """True if every item is there in at least the given quantity."""
+        return all(self._counts.get(item, 0) >= quantity for item, quantity in items.items())
+
+    def render(self) -> str:
+        if self._rendered is None:
+            if not self._counts:
+                self._rendered = "- nothing"
+            else:
+                self._rendered = "\n".join(
+                    f"- {item}" if quantity == 1 else f"- {item} (x{quantity})"
+                    for item, quantity in self._counts.items()
+                )
+        return self._rendered
+
+    def to_state(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    @classmethod
+    def from_state(cls, state:Union[Iterable[str], Dict[str, int]]):
+        # saves made before quantities were tracked hold a plain list
+        return cls(state)
@@ -0,0 +1,149 @@
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, List
+import threading
+
+from src.tracing import submit
+from src.utils import count_tokens
+
+
+class ConversationMemory:
+
+    def __init__(
+            self,
+            summarizer:Callable[[str, List[str]], str],
+            token_budget:int=2000,
+            keep_last:int=6,
+            summarize_every:int=2,
+            executor:Executor=None,
+            token_counter:Callable[[str], int]=count_tokens,
+    ):
+        """
+        Bounded chat history for the agent.
+        The last keep_last turns are kept verbatim, older turns are folded into a rolling
+        summary. Only the newly evicted turns are sent to the summarizer, together with
+        the previous summary, never the whole history.
+
+        Parameters:
+        summarizer (Callable): Takes the previous summary and a list of evicted turns, returns the new summary.
+        token_budget (int): Maximum tokens for the verbatim turns plus the summary.
+        keep_last (int): Maximum number of turns kept verbatim.
+        summarize_every (int): Number of evicted turns to collect before calling the summarizer.
+        executor (Executor): If given, summaries are updated in the background so turns never wait on them.
+        token_counter (Callable): Counts the tokens in a string.
+        """
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.keep_last = keep_last
+        self.summarize_every = summarize_every
+        self.executor = executor
+        self.token_counter = token_counter
+        self.summary = ""
+        self.summary_tokens = 0
+        # (turn, tokens) pairs
+        self.recent = deque()
+        self.recent_tokens = 0
+        # evicted turns not folded into the summary yet, still sent verbatim
+        self.pending = []
+        self.pending_tokens = 0
+        self.full_tokens = 0
+        self.tokens_saved = []
+        self._lock = threading.Lock()
+        self._summarizing = None
+
+    def __len__(self):
+        return len(self.recent)
+
+    @property
+    def verbatim_turns(self):
+        # turns the agent still sees word for word, recent plus not yet summarized
+        return len(self.recent) + len(self.pending)
+
+    def add(self, turn:str):
+        tokens = self.token_counter(turn)
+        with self._lock:
+            self.full_tokens += tokens
+            self.recent.append((turn, tokens))
+            self.recent_tokens += tokens
+            while len(self.recent) > 1 and (
+                len(self.recent) > self.keep_last
+                or self.recent_tokens + self.summary_tokens > self.token_budget
+            ):
+                evicted, evicted_tokens = self.recent.popleft()
+                self.recent_tokens -= evicted_tokens
+                self.pending.append((evicted, evicted_tokens))
+                self.pending_tokens += evicted_tokens
+            should_summarize = len(self.pending) >= self.summarize_every and self._summarizing is None
+        if should_summarize:
+            self._start_summary()
+        self.tokens_saved.append(self.full_tokens - self.context_tokens())
+
+    def _start_summary(self):
+        with self._lock:
+            batch = list(self.pending)
+            self._summarizing = batch
+        if self.executor is None:
+            self._fold(batch)
+        else:
+            submit(self.executor, self._fold, batch)
+
+    def _fold(self, batch:list):
+        try:
+            summary = self.summarizer(self.summary, [turn for turn, _ in batch])
+        except Exception:
+            # keep the turns pending and try again with the next eviction
+            with self._lock:
+                self._summarizing = None
+            return
+        with self._lock:
+            self.summary = summary
+            self.summary_tokens = self.token_counter(summary)
+            folded = len(batch)
+            self.pending = self.pending[folded:]
+            self.pending_tokens = sum(tokens for _, tokens in self.pending)
+            self._summarizing = None
+
+    def to_state(self) -> dict:
+        # the verbatim turns are the tail of the game history, only their count is saved
+        with self._lock:
+            return {"summary": self.summary, "recent": len(self.recent), "pending": len(self.pending),
+                    "full_tokens": self.full_tokens}
+
+    def load_state(self, state:dict, history:List[str]):
+        """Restore from to_state() data and the game history it was taken with, no summarizer calls."""
+        verbatim = history[len(history) - state["recent"] - state["pending"]:] if state["recent"] + state["pending"] else []
+        turns = [(turn, self.token_counter(turn)) for turn in verbatim]
+        with self._lock:
+            self.summary = state["summary"]
+            self.summary_tokens = self.token_counter(self.summary) if self.summary else 0
+            self.pending = turns[:state["pending"]]
+            self.pending_tokens = sum(tokens for _, tokens in self.pending)
+            self.recent = deque(turns[state["pending"]:])
+            self.recent_tokens = sum(tokens for _, tokens in self.recent)
+            self.full_tokens = state["full_tokens"]
+
+    def get_context(self) -> List[str]:
+        with self._lock:
+            context = []
+            if self.summary:
+                context.append(f"**Summary of earlier events in the game**:\n{self.summary}")
+            context += [turn for turn, _ in self.pending]
+            context += [turn for turn, _ in self.recent]
+        return context
+
+    def context_tokens(self):
+        return self.summary_tokens + self.pending_tokens + self.recent_tokens
+
+    @property
+    def last_tokens_saved(self):
+        return self.tokens_saved[-1] if self.tokens_saved else 0
+
+    def stats(self):
+        return {
+            "turns_verbatim": len(self.recent),
+            "turns_pending": len(self.pending),
+            "context_tokens": self.context_tokens(),
+            "full_history_tokens": self.full_tokens,
+            "last_tokens_saved": self.last_tokens_saved,
+            "total_tokens_saved": sum(self.tokens_saved),
+        }
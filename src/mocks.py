@@ -0,0 +1,266 @@
+"""
+Offline stand-ins for the OpenAI backed components, for benchmarks and load tests
+on a machine with no network. Every fake keeps the real class's code path and only
+replaces the remote call, so caching, chunking, rendering and the agent loop are
+all exercised, and each one waits on a LatencyProfile and can fail at a set rate.
+
+Usage:
+    agent = NerdMasterAgent(**mock_agent_kwargs("realistic", seed=0))
+"""
+from src.gpt import StandardGPT, SYSTEM_PROMPTS
+from src.image_generator import ImageGenerator
+from src.narrator import Narrator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from PIL import Image, ImageDraw
+
+from functools import partial
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Union
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+
+DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal")
+
+# one silent MPEG-1 Layer III frame, 128kbps / 44.1kHz / no padding, ~26ms of audio
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+MP3_FRAMES_PER_CHAR = 2.5  # ~15 characters read per second
+
+
+class MockBackendError(Exception):
+    """Raised by a fake backend to simulate a failed remote call."""
+
+
+class LatencyProfile:
+
+    def __init__(
+            self,
+            mean:float=0.0,
+            jitter:float=0.0,
+            distribution:str="normal",
+            error_rate:float=0.0,
+            seed:int=None,
+    ):
+        """
+        How long a fake remote call takes and how often it fails.
+
+        Parameters:
+        mean (float): Mean latency in seconds.
+        jitter (float): Spread in seconds, the standard deviation for normal and lognormal,
+            the half width for uniform, ignored for constant.
+        distribution (str): One of constant, uniform, normal or lognormal.
+        error_rate (float): Probability that a call raises MockBackendError after waiting.
+        seed (int): Seed for the profile's own random generator, None for a random seed.
+        """
+        assert distribution in DISTRIBUTIONS, f"distribution must be one of {DISTRIBUTIONS}"
+        self.mean = mean
+        self.jitter = jitter
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "seconds": 0.0}
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.distribution == "constant" or self.jitter <= 0:
+                seconds = self.mean
+            elif self.distribution == "uniform":
+                seconds = self._random.uniform(self.mean - self.jitter, self.mean + self.jitter)
+            elif self.distribution == "normal":
+                seconds = self._random.gauss(self.mean, self.jitter)
+            else:
+                # parameters chosen so the samples have the given mean and standard deviation
+                sigma2 = math.log(1 + (self.jitter / self.mean) ** 2) if self.mean > 0 else 0.0
+                mu = math.log(self.mean) - sigma2 / 2 if self.mean > 0 else 0.0
+                seconds = self._random.lognormvariate(mu, math.sqrt(sigma2)) if self.mean > 0 else 0.0
+            return max(0.0, seconds)
+
+    def wait(self, label:str="call"):
+        """Sleep for one sampled latency, then maybe raise MockBackendError."""
+        seconds = self.sample()
+        if seconds:
+            time.sleep(seconds)
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.stats["calls"] += 1
+            self.stats["seconds"] += seconds
+            self.stats["errors"] += failed
+        if failed:
+            raise MockBackendError(f"simulated {label} failure after {seconds:.2f}s")
+
+
+def _profile(profile:Union[LatencyProfile, None]) -> LatencyProfile:
+    return profile if profile is not None else LatencyProfile()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model that plays back a script, one entry per model call.
+
+    An entry is either a string (a plain reply) or a dict with "content" and/or
+    "tool_calls", a list of {"name": ..., "args": {...}} in the OpenAI tools format,
+    so the agent executes the tools and calls the model again for the next entry.
+    Once the script runs out every call answers with default_reply.
+    """
+
+    script: List[Union[str, Dict[str, Any]]] = []
+    default_reply: str = "The Games Master nods. What would you like to do next?"
+    latency: Any = None
+
+    _position: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def reset(self):
+        with self._lock:
+            self._position = 0
+
+    def _next_message(self) -> AIMessage:
+        with self._lock:
+            position = self._position
+            self._position += 1
+        entry = self.script[position] if position < len(self.script) else self.default_reply
+        if isinstance(entry, str):
+            entry = {"content": entry}
+        additional_kwargs = {}
+        if entry.get("tool_calls"):
+            additional_kwargs["tool_calls"] = [
+                {
+                    "index": i,
+                    "id": f"call_{position}_{i}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call.get("args", {}))},
+                }
+                for i, call in enumerate(entry["tool_calls"])
+            ]
+        return AIMessage(content=entry.get("content", ""), additional_kwargs=additional_kwargs)
+
+    def _generate(self, messages:List[BaseMessage], stop=None, run_manager=None, **kwargs):
+        _profile(self.latency).wait("chat")
+        return ChatResult(generations=[ChatGeneration(message=self._next_message())])
+
+    def _stream(self, messages:List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        _profile(self.latency).wait("chat")
+        message = self._next_message()
+        if message.additional_kwargs:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", additional_kwargs=message.additional_kwargs))
+        for token in re.findall(r"\S+\s*", message.content):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeGPT(StandardGPT):
+
+    def __init__(self, latency:LatencyProfile=None, **kwargs):
+        """StandardGPT with canned, deterministic replies per system prompt, the response cache still applies."""
+        super().__init__(**kwargs)
+        self.latency = _profile(latency)
+        self._prompt_names = {text: name for name, text in SYSTEM_PROMPTS.items()}
+
+    def _complete(self, system_message:str, prompt:str, max_tokens:int):
+        self.latency.wait("chat completion")
+        name = self._prompt_names.get(system_message)
+        words = re.findall(r"[A-Za-z']{4,}", prompt)
+        if name == "image_tags":
+            return "fantasy, medieval, " + ", ".join(w.lower() for w in words[:4])
+        if name == "history_summary":
+            return " ".join(prompt.split()[:max_tokens])
+        return (f"A painterly scene showing {' '.join(words[:12])}. "
+                "<fantasy>, <medieval>, <adventure>")
+
+
+class FakeImageGenerator(ImageGenerator):
+
+    def __init__(self, latency:LatencyProfile=None, **kwargs):
+        """ImageGenerator that paints a local PNG at the requested size instead of calling the images API."""
+        super().__init__(**kwargs)
+        self.latency = _profile(latency)
+
+    def _generate(self, prompt:str, size:str="1792x1024", quality:str="standard", n:int=1) -> bytes:
+        self.latency.wait("image")
+        width, height = (int(v) for v in size.split("x"))
+        # colours derived from the prompt so the same prompt always gives the same image
+        seed = zlib.crc32(prompt.encode())
+        colours = [((seed >> s) & 0xFF, (seed >> (s + 8)) & 0xFF, (seed >> (s + 16)) & 0xFF) for s in (0, 4, 8)]
+        img = Image.new("RGB", (width, height), colours[0])
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, height * 2 // 3, width, height), fill=colours[1])
+        draw.ellipse((width // 3, height // 6, width // 3 + height // 3, height // 2), fill=colours[2])
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+class FakeNarrator(Narrator):
+
+    def __init__(self, latency:LatencyProfile=None, **kwargs):
+        """Narrator that returns silent MP3 frames, about as long as the text would take to read."""
+        super().__init__(**kwargs)
+        self.latency = _profile(latency)
+
+    def _synthesize(self, text:str) -> bytes:
+        self.latency.wait("speech")
+        return MP3_FRAME * max(1, int(len(text) * MP3_FRAMES_PER_CHAR))
+
+
+# seconds per call, roughly what the real endpoints take
+LATENCY_PROFILES = {
+    "instant": {
+        "chat": dict(mean=0.0),
+        "gpt": dict(mean=0.0),
+        "image": dict(mean=0.0),
+        "tts": dict(mean=0.0),
+    },
+    "realistic": {
+        "chat": dict(mean=1.5, jitter=0.5, distribution="lognormal"),
+        "gpt": dict(mean=0.8, jitter=0.3, distribution="lognormal"),
+        "image": dict(mean=12.0, jitter=3.0, distribution="lognormal"),
+        "tts": dict(mean=0.6, jitter=0.2, distribution="lognormal"),
+    },
+    "flaky": {
+        "chat": dict(mean=1.5, jitter=1.0, distribution="lognormal", error_rate=0.05),
+        "gpt": dict(mean=0.8, jitter=0.5, distribution="lognormal", error_rate=0.05),
+        "image": dict(mean=12.0, jitter=6.0, distribution="lognormal", error_rate=0.1),
+        "tts": dict(mean=0.6, jitter=0.4, distribution="lognormal", error_rate=0.05),
+    },
+}
+
+
+def latency_profiles(profile:Union[str, Dict[str, dict]]="instant", seed:int=None) -> Dict[str, LatencyProfile]:
+    """Build one LatencyProfile per backend from a preset name or a {backend: kwargs} dict."""
+    spec = LATENCY_PROFILES[profile] if isinstance(profile, str) else profile
+    return {
+        name: LatencyProfile(**kwargs, seed=None if seed is None else seed + i)
+        for i, (name, kwargs) in enumerate(sorted(spec.items()))
+    }
+
+
+def mock_agent_kwargs(
+        profile:Union[str, Dict[str, dict]]="instant",
+        seed:int=None,
+        script:List[Union[str, Dict[str, Any]]]=None,
+        audio_dir:str="./audio",
+) -> dict:
+    """Keyword arguments that make NerdMasterAgent (or bootstrap_game) run fully offline, with speech written under audio_dir."""
+    latency = latency_profiles(profile, seed)
+    return dict(
+        openai_api_key="sk-offline",
+        llm=FakeChatModel(script=script or [], latency=latency["chat"]),
+        art_gpt=partial(FakeGPT, latency=latency["gpt"]),
+        image_generator=partial(FakeImageGenerator, latency=latency["image"]),
+        narrator=partial(FakeNarrator, latency=latency["tts"], audio_dir=audio_dir),
+    )
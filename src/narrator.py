@@ -1,40 +1,206 @@
-from openai import OpenAI
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from pathlib import Path
+from typing import List
 import os
+import re
+import shutil
+import threading
+import uuid
+import warnings
 import pygame
+from src.clients import ClientProvider, get_client_provider
+from src.tracing import get_tracer, submit
 
 load_dotenv()
 
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+def split_sentences(text:str, min_chars:int=40, max_chars:int=400) -> List[str]:
+    """
+    Split text into sentence chunks for synthesis.
+    The first sentence is its own chunk so playback can start early, later
+    short sentences are merged up to min_chars so we don't pay a request per "Yes.".
+    """
+    sentences = [s.strip() for s in SENTENCE_PATTERN.split(text) if s.strip()]
+    chunks = sentences[:1]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and (len(current) >= min_chars or len(current) + len(sentence) > max_chars):
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SpeechStream(Future):
+
+    def __init__(self, chunks:List[Future]):
+        """
+        Audio for one narration, synthesized chunk by chunk.
+        Iterating yields each chunk's mp3 bytes in order as soon as it is ready,
+        and the future itself resolves to the full mp3 once every chunk is done.
+        """
+        super().__init__()
+        self.chunks = chunks
+        self._remaining = len(chunks)
+        self._lock = threading.Lock()
+        if self._remaining == 0:
+            self.set_result(b"")
+        for chunk in chunks:
+            chunk.add_done_callback(self._chunk_done)
+
+    def _chunk_done(self, chunk:Future):
+        with self._lock:
+            self._remaining -= 1
+            if self.done():
+                return
+            if chunk.cancelled():
+                # the narrator was closed before this chunk ran
+                self.cancel()
+            elif chunk.exception() is not None:
+                self.set_exception(chunk.exception())
+            elif self._remaining == 0:
+                self.set_result(b"".join(c.result() for c in self.chunks))
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield chunk.result()
+
+
 class Narrator:
 
     def __init__(
             self,
             api_key:str=os.getenv("OPENAI_API_KEY"),
             model:str="tts-1",
-            speech_file_path:str="./audio/speech.mp3"
-    ):  
-        self.speech_file_path = speech_file_path
+            voice:str="alloy",
+            audio_dir:str="./audio",
+            session_id:str=None,
+            max_workers:int=3,
+            playback:str="local",
+            client_provider:ClientProvider=None,
+            keep_turns:int=10,
+    ):
+        """
+        Text to speech for one game, synthesized in sentence chunks.
+        Each turn's full audio is written to <audio_dir>/<session_id>/turn-NNNN.mp3, only the
+        last keep_turns files are kept and the session's directory is removed on close().
+        """
+        assert playback in ("local", "browser"), "playback must be 'local' or 'browser'"
         self.api_key = api_key
-        self.openai = OpenAI()
+        self.client_provider = client_provider or get_client_provider()
         self.model = model
+        self.voice = voice
+        self.playback = playback
+        self.session_id = session_id or uuid.uuid4().hex
+        self.audio_dir = Path(audio_dir) / self.session_id
+        self.turn = 0
+        self.speech_file_path = None
+        self.last_speech = None
+        self.keep_turns = keep_turns
+        self._saved_files = deque()
+        self._files_lock = threading.Lock()
+        self._closed = False
+        # bounded parallelism for chunk synthesis
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._playback_thread = None
+        self._stop_playback = threading.Event()
+
+    @property
+    def openai(self):
+        return self.client_provider.openai
 
-    def generate_speech(self, text:str):
+    def _synthesize_chunk(self, text:str) -> bytes:
+        tracer = get_tracer()
+        with tracer.span("tts", labels={"model": self.model}, chars=len(text)):
+            tracer.count("tts_characters_total", len(text), model=self.model)
+            return self._synthesize(text)
+
+    def _synthesize(self, text:str) -> bytes:
         response = self.openai.audio.speech.create(
             model=self.model,
-            voice="alloy",
-            input=text
+            voice=self.voice,
+            input=text,
         )
-        response.stream_to_file(self.speech_file_path)
+        return response.content
+
+    def _save_speech(self, speech:SpeechStream, path:Path):
+        if speech.cancelled() or speech.exception() is not None:
+            return
+        with self._files_lock:
+            if self._closed:
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(speech.result())
+            self._saved_files.append(path)
+            while len(self._saved_files) > self.keep_turns:
+                self._saved_files.popleft().unlink(missing_ok=True)
 
+    def generate_speech(self, text:str) -> SpeechStream:
+        """
+        Start synthesizing text sentence by sentence, returns immediately.
+        The full audio is written to a per-session, per-turn file once complete.
+        """
+        self.turn += 1
+        chunks = [submit(self._executor, self._synthesize_chunk, chunk) for chunk in split_sentences(text)]
+        speech = SpeechStream(chunks)
+        self.speech_file_path = self.audio_dir / f"turn-{self.turn:04d}.mp3"
+        path = self.speech_file_path
+        speech.add_done_callback(lambda s: self._save_speech(s, path))
+        self.last_speech = speech
+        return speech
 
-    def play_speech(self):
-        filename = self.speech_file_path
-        pygame.mixer.init()
-        pygame.mixer.music.load(filename)
-        pygame.mixer.music.play()
+    def _play_chunks(self, speech:SpeechStream, stop:threading.Event):
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            clock = pygame.time.Clock()
+            for audio in speech:
+                if stop.is_set():
+                    break
+                pygame.mixer.music.load(BytesIO(audio), "mp3")
+                pygame.mixer.music.play()
+                while pygame.mixer.music.get_busy() and not stop.is_set():
+                    clock.tick(10)
+            if stop.is_set() and pygame.mixer.get_init():
+                pygame.mixer.music.stop()
+        except Exception as e:
+            warnings.warn(f"Narrator playback failed: {e}")
 
-        while pygame.mixer.music.get_busy(): 
-            pygame.time.Clock().tick(10)
-        
+    def close(self):
+        """Stop playback, release the synthesis threads and delete the session's audio files."""
+        self.stop_speech()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._files_lock:
+            self._closed = True
+            self._saved_files.clear()
+            shutil.rmtree(self.audio_dir, ignore_errors=True)
 
+    def stop_speech(self):
+        self._stop_playback.set()
+        if self._playback_thread is not None:
+            self._playback_thread.join()
+        self._playback_thread = None
 
+    def play_speech(self, speech:SpeechStream=None, block:bool=False):
+        """
+        Play speech on a background thread, starting with the first chunk while the
+        rest are still being synthesized. Any narration still playing is stopped first.
+        In "browser" playback mode nothing is played server side.
+        """
+        speech = speech or self.last_speech
+        if speech is None or self.playback != "local":
+            return
+        self.stop_speech()
+        self._stop_playback = threading.Event()
+        self._playback_thread = threading.Thread(
+            target=self._play_chunks, args=(speech, self._stop_playback), daemon=True
+        )
+        self._playback_thread.start()
+        if block:
+            self._playback_thread.join()
@@ -0,0 +1,336 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Tuple
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from src.image_generator import ImageRenditions
+from src.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"NMS1"
+# payload length and crc32 in front of every journal record
+RECORD_HEADER = struct.Struct(">II")
+STATE_VERSION = 1
+
+# compactions read and write whole saves, one at a time for the process keeps their I/O off the turns
+_COMPACTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compact")
+
+
+def encode(state:dict, level:int=6) -> bytes:
+    return zlib.compress(json.dumps(state, separators=(",", ":")).encode(), level)
+
+
+def decode(blob:bytes) -> dict:
+    return json.loads(zlib.decompress(blob))
+
+
+def apply_delta(state:dict, record:dict):
+    """Apply one journal record to snapshot state in place."""
+    world = state["world"]
+    world["entities"].update(record.get("entities", {}))
+    for entity_id in record.get("removed", []):
+        world["entities"].pop(entity_id, None)
+    world["next_id"] = max(world["next_id"], record.get("next_id", 0))
+    if "dice" in record:
+        world["dice"] = record["dice"]
+    state["history"] += record.get("history", [])
+    for key in ("last_response", "image", "memory", "narrative_tags"):
+        if key in record:
+            state[key] = record[key]
+    state["seq"] = record["seq"]
+
+
+class GameSave:
+
+    def __init__(self, directory:str, compact_every:int=100, compact_ratio:float=4.0):
+        """
+        Save / resume for one game, as a compressed snapshot plus an append-only journal.
+
+        Every save appends a record holding only what changed since the previous save:
+        new history turns, the entities flagged by the registry as changed or removed,
+        the memory summary, dice generator state and image reference if they changed, and the
+        narrative tags once they are ready, so no save waits for them. Images are written once
+        to images/<sha1>.bin. Once the journal holds compact_every records, or is compact_ratio
+        times the size of the snapshot, it is folded into a new snapshot on a background thread,
+        from the files alone, so a save only ever costs what changed.
+        Loading reads the snapshot and replays the journal, a torn last record is dropped.
+
+        Parameters:
+        directory (str): Directory holding snapshot.bin, journal.bin and images/.
+        compact_every (int): Journal records between snapshots.
+        compact_ratio (float): Journal size, relative to the snapshot, that triggers a snapshot.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / "images").mkdir(exist_ok=True)
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self.stats = {"snapshots": 0, "compactions": 0, "records": 0, "snapshot_bytes": 0, "journal_bytes": 0}
+        self._lock = threading.Lock()
+        # bumped by every full snapshot and load, a compaction started before one is stale
+        self._generation = 0
+        self._compaction: Future = None
+        self._reset_tracking()
+
+    @property
+    def snapshot_path(self):
+        return self.directory / "snapshot.bin"
+
+    @property
+    def journal_path(self):
+        return self.directory / "journal.bin"
+
+    def exists(self) -> bool:
+        return self.snapshot_path.exists()
+
+    def _reset_tracking(self):
+        self._seq = 0
+        self._records = 0
+        self._journal_size = 0
+        self._snapshot_size = 0
+        self._history_saved = 0
+        self._saved_image = None
+        self._image_ref = None
+        self._memory_state = None
+        self._dice_state = None
+        self._tags_saved = False
+
+    def _image_reference(self, image:ImageRenditions):
+        # the same object as last time means the same image, nothing to hash or write
+        if image is None:
+            return None
+        if image is self._saved_image:
+            return self._image_ref
+        blob = image.to_bytes()
+        ref = hashlib.sha1(blob).hexdigest()
+        path = self.directory / "images" / f"{ref}.bin"
+        if not path.exists():
+            path.write_bytes(blob)
+        self._saved_image, self._image_ref = image, ref
+        return ref
+
+    def load_image(self, ref:str) -> ImageRenditions:
+        if ref is None:
+            return None
+        path = self.directory / "images" / f"{ref}.bin"
+        return ImageRenditions.from_bytes(path.read_bytes()) if path.exists() else None
+
+    def _full_state(self, agent) -> dict:
+        nerdmaster = agent.nerdmaster
+        # the full state supersedes every change tracked so far
+        nerdmaster.registry.drain_changes()
+        return {
+            "version": STATE_VERSION,
+            "seq": self._seq,
+            "narrative": agent.game_world_narrative,
+            # tags still being made go into a later journal record
+            "narrative_tags": agent.ready_narrative_tags(),
+            "world": nerdmaster.to_state(),
+            "history": list(agent.history),
+            "last_response": agent.last_response,
+            "image": self._image_reference(agent.image),
+            "memory": agent.memory.to_state(),
+        }
+
+    def _delta(self, agent) -> dict:
+        nerdmaster = agent.nerdmaster
+        dirty, removed = nerdmaster.registry.drain_changes()
+        record = {}
+        if dirty:
+            record["entities"] = {entity_id: nerdmaster.entity_state(entity_id) for entity_id in dirty
+                                  if entity_id in nerdmaster.registry}
+        if removed:
+            record["removed"] = removed
+        if dirty or removed:
+            record["next_id"] = nerdmaster.registry.next_id
+        history = agent.history[self._history_saved:]
+        if history:
+            record["history"] = history
+            record["last_response"] = agent.last_response
+        if agent.image is not self._saved_image:
+            record["image"] = self._image_reference(agent.image)
+        memory = agent.memory.to_state()
+        if memory != self._memory_state:
+            record["memory"] = memory
+        # replaying the game from the save must continue with the same rolls
+        dice = nerdmaster.dice.to_state()
+        if dice != self._dice_state:
+            record["dice"] = dice
+        if not self._tags_saved:
+            tags = agent.ready_narrative_tags()
+            if tags is not None:
+                record["narrative_tags"] = tags
+        return record
+
+    def save(self, agent):
+        """Append what changed since the last save, or write a snapshot if there is none yet."""
+        with self._lock:
+            if not self.exists() or self._seq == 0:
+                self._snapshot(agent)
+                return
+            with get_tracer().span("save", kind="journal"):
+                record = self._delta(agent)
+                if not record:
+                    return
+                self._seq += 1
+                record["seq"] = self._seq
+                payload = encode(record, level=1)
+                with open(self.journal_path, "ab") as file:
+                    file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                self._after_save(record)
+                self._records += 1
+                self._journal_size += RECORD_HEADER.size + len(payload)
+                self.stats["records"] += 1
+                self.stats["journal_bytes"] += RECORD_HEADER.size + len(payload)
+                get_tracer().count("save_bytes_total", RECORD_HEADER.size + len(payload), kind="journal")
+            if self._compaction is None and (
+                    self._records >= self.compact_every or self._journal_size > self._snapshot_size * self.compact_ratio):
+                self._compaction = _COMPACTOR.submit(self._compact, self._generation, self._journal_size)
+
+    def _after_save(self, record:dict):
+        self._history_saved += len(record.get("history", []))
+        if "memory" in record:
+            self._memory_state = record["memory"]
+        if "dice" in record:
+            self._dice_state = record["dice"]
+        if "narrative_tags" in record:
+            self._tags_saved = True
+
+    def snapshot(self, agent):
+        """Write the whole game as a new snapshot and start an empty journal."""
+        with self._lock:
+            self._snapshot(agent)
+
+    def _snapshot(self, agent):
+        with get_tracer().span("save", kind="snapshot"):
+            self._generation += 1
+            self._seq += 1
+            state = self._full_state(agent)
+            state["seq"] = self._seq
+            blob = SNAPSHOT_MAGIC + encode(state)
+            tmp = self.snapshot_path.with_suffix(".tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, self.snapshot_path)
+            # records up to seq are in the snapshot, a crash before this truncation is harmless
+            open(self.journal_path, "wb").close()
+            self._history_saved = len(state["history"])
+            self._memory_state = state["memory"]
+            self._dice_state = state["world"].get("dice")
+            self._tags_saved = state["narrative_tags"] is not None
+            self._records = 0
+            self._journal_size = 0
+            self._snapshot_size = len(blob)
+            self.stats["snapshots"] += 1
+            self.stats["snapshot_bytes"] = len(blob)
+            get_tracer().count("save_bytes_total", len(blob), kind="snapshot")
+
+    def _compact(self, generation:int, journal_size:int):
+        """Fold the first journal_size bytes of the journal into a new snapshot, records appended meanwhile are kept."""
+        try:
+            with get_tracer().span("save", kind="compact"):
+                state = self._decode_snapshot(self.snapshot_path.read_bytes())
+                with open(self.journal_path, "rb") as file:
+                    journal = file.read(journal_size)
+                compacted = 0
+                for record, _ in self._parse_journal(journal):
+                    if record["seq"] > state["seq"]:
+                        apply_delta(state, record)
+                    compacted += 1
+                blob = SNAPSHOT_MAGIC + encode(state)
+                tmp = self.snapshot_path.with_suffix(".compact")
+                tmp.write_bytes(blob)
+                with self._lock:
+                    if self._generation != generation:
+                        # a full snapshot was written meanwhile, it is newer than this one
+                        tmp.unlink(missing_ok=True)
+                        return
+                    with open(self.journal_path, "rb") as file:
+                        file.seek(journal_size)
+                        tail = file.read()
+                    os.replace(tmp, self.snapshot_path)
+                    # records up to the snapshot's seq are skipped on load, a crash before this is harmless
+                    journal_tmp = self.journal_path.with_suffix(".compact")
+                    journal_tmp.write_bytes(tail)
+                    os.replace(journal_tmp, self.journal_path)
+                    self._records -= compacted
+                    self._journal_size = len(tail)
+                    self._snapshot_size = len(blob)
+                    self.stats["compactions"] += 1
+                    self.stats["snapshot_bytes"] = len(blob)
+                get_tracer().count("save_bytes_total", len(blob), kind="compact")
+        except Exception:
+            logger.exception("compacting %s failed, the journal keeps growing until the next try", self.directory)
+        finally:
+            with self._lock:
+                self._compaction = None
+
+    def wait_for_compaction(self):
+        """Wait for a background compaction, e.g. before another GameSave opens the same directory."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.result()
+
+    @staticmethod
+    def _parse_journal(data:bytes) -> Iterator[Tuple[dict, int]]:
+        # each good record and the offset just past it, up to the first torn one
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, crc = RECORD_HEADER.unpack_from(data, offset)
+            payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset += RECORD_HEADER.size + length
+            yield decode(payload), offset
+
+    def _decode_snapshot(self, blob:bytes) -> dict:
+        if blob[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.snapshot_path} is not a game snapshot")
+        return decode(blob[len(SNAPSHOT_MAGIC):])
+
+    def _read_journal(self) -> Iterator[dict]:
+        if not self.journal_path.exists():
+            return
+        data = self.journal_path.read_bytes()
+        offset = 0
+        for record, offset in self._parse_journal(data):
+            yield record
+        if offset < len(data):
+            # a save was cut short, drop the partial record so new ones are appended after good data
+            logger.warning("dropping torn journal record at byte %d of %s", offset, self.journal_path)
+            with open(self.journal_path, "r+b") as file:
+                file.truncate(offset)
+
+    def load(self) -> dict:
+        """The saved game state, the snapshot with every journal record after it applied."""
+        self.wait_for_compaction()
+        with get_tracer().span("load"), self._lock:
+            blob = self.snapshot_path.read_bytes()
+            state = self._decode_snapshot(blob)
+            records = 0
+            for record in self._read_journal():
+                if record["seq"] > state["seq"]:
+                    apply_delta(state, record)
+                records += 1
+            self._generation += 1
+            self._reset_tracking()
+            self._seq = state["seq"]
+            self._records = records
+            self._snapshot_size = len(blob)
+            self._journal_size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+            self._history_saved = len(state["history"])
+            self._memory_state = state["memory"]
+            self._dice_state = state["world"].get("dice")
+            self._tags_saved = state.get("narrative_tags") is not None
+            return state
+
+    def attach_image(self, image:ImageRenditions, ref:str):
+        """Tell the save that image is already stored as ref, after a resume."""
+        with self._lock:
+            self._saved_image, self._image_ref = image, ref
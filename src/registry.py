@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import threading
+
+from src.sentients import StatStore
+
+
+class EntityRegistry:
+
+    def __init__(self):
+        """
+        Per-game index of the sentients in the world.
+        Entities are stored by a stable id (e.g. "monster-3") and can be looked up
+        or removed in O(1) by either their id or their name. Their health, gold and
+        status live in the registry's StatStore.
+        """
+        self._next_id: int = 0
+        self._by_id: Dict[str, object] = {}
+        self._id_by_name: Dict[str, str] = {}
+        self._by_kind: Dict[str, Dict[str, object]] = {}
+        self._kind_by_id: Dict[str, str] = {}
+        self.stats = StatStore()
+        # ids added / changed and removed since the last drain_changes(), for incremental saves
+        self._dirty: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._changes_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, key:str):
+        return self._resolve_id(key) is not None
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def _resolve_id(self, key:str) -> Optional[str]:
+        if key in self._by_id:
+            return key
+        return self._id_by_name.get(key)
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    @next_id.setter
+    def next_id(self, value:int):
+        self._next_id = max(self._next_id, value)
+
+    def add(self, entity:object, kind:str, entity_id:str=None) -> str:
+        """Add an entity under a new id, or under entity_id when restoring a saved game."""
+        if entity.name in self._id_by_name:
+            raise ValueError(f"An entity called {entity.name} already exists.")
+        if entity_id is None:
+            self._next_id += 1
+            entity_id = f"{kind}-{self._next_id}"
+        else:
+            self.next_id = int(entity_id.rsplit("-", 1)[1])
+        entity.id = entity_id
+        entity._registry = self
+        entity._attach(self.stats)
+        self._by_id[entity_id] = entity
+        self._id_by_name[entity.name] = entity_id
+        self._by_kind.setdefault(kind, {})[entity_id] = entity
+        self._kind_by_id[entity_id] = kind
+        # saves drain the changes from other threads, e.g. when a scene image lands
+        with self._changes_lock:
+            self._dirty.add(entity_id)
+            self._removed.discard(entity_id)
+        return entity_id
+
+    def get(self, key:str, kind:str=None):
+        entity_id = self._resolve_id(key)
+        if entity_id is None:
+            return None
+        if kind is not None and self._kind_by_id[entity_id] != kind:
+            return None
+        return self._by_id[entity_id]
+
+    def remove(self, key:str, kind:str=None):
+        entity = self.get(key, kind)
+        if entity is None:
+            return None
+        entity_id = entity.id
+        self._by_id.pop(entity_id)
+        self._id_by_name.pop(entity.name)
+        self._by_kind[self._kind_by_id.pop(entity_id)].pop(entity_id)
+        entity._registry = None
+        entity._detach()
+        with self._changes_lock:
+            self._dirty.discard(entity_id)
+            self._removed.add(entity_id)
+        return entity
+
+    def mark_dirty(self, entity_id:str):
+        with self._changes_lock:
+            if entity_id in self._by_id:
+                self._dirty.add(entity_id)
+
+    def mark_dirty_many(self, entity_ids:Iterable[str]):
+        with self._changes_lock:
+            self._dirty.update(entity_id for entity_id in entity_ids if entity_id in self._by_id)
+
+    def drain_changes(self) -> Tuple[List[str], List[str]]:
+        """The ids changed and removed since the last call, then start tracking afresh."""
+        with self._changes_lock:
+            dirty, removed = sorted(self._dirty), sorted(self._removed)
+            self._dirty, self._removed = set(), set()
+        return dirty, removed
+
+    def kind_of(self, key:str) -> Optional[str]:
+        entity_id = self._resolve_id(key)
+        return self._kind_by_id.get(entity_id)
+
+    def of_kind(self, kind:str) -> List[object]:
+        return list(self._by_kind.get(kind, {}).values())
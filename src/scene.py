@@ -0,0 +1,117 @@
+from typing import Dict, List
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z']{4,}")
+
+# how strongly a tool firing suggests the visible scene changed, 0 = not at all
+SCENE_TOOL_WEIGHTS = {
+    "setup_player": 1.0,
+    "create_monster": 1.0,
+    "create_npc": 0.8,
+    "remove_monster_from_game": 0.7,
+    "remove_npc_from_game": 0.6,
+    "modify_health": 0.3,
+    "modify_entity_health": 0.3,
+    "add_to_inventory": 0.1,
+    "remove_from_inventory": 0.1,
+    "add_to_entity_inventory": 0.1,
+    "remove_from_entity_inventory": 0.1,
+    "add_items_to_inventory": 0.1,
+    "remove_items_from_inventory": 0.1,
+    "add_items_to_entity_inventory": 0.1,
+    "remove_items_from_entity_inventory": 0.1,
+    "transfer_items": 0.15,
+    "apply_changes": 0.3,
+    "modify_group_health": 0.4,
+    "set_group_status": 0.3,
+    "get_group": 0.0,
+    "modify_gold": 0.05,
+    "modify_entity_gold": 0.05,
+    "roll_dice": 0.1,
+    "roll_checks": 0.1,
+    "get_health": 0.0,
+    "get_inventory": 0.0,
+    "get_gold": 0.0,
+    "get_name": 0.0,
+    "get_entity_health": 0.0,
+    "get_entity_inventory": 0.0,
+    "get_entity_gold": 0.0,
+}
+
+
+def scene_words(turn:str) -> set:
+    return set(WORD_PATTERN.findall(turn.lower()))
+
+
+def text_distance(previous:str, current:str) -> float:
+    """Jaccard distance between the sets of longer words in two turns, 0 = same words, 1 = nothing shared."""
+    a = scene_words(previous)
+    b = scene_words(current)
+    if not a and not b:
+        return 0.0
+    return 1.0 - len(a & b) / len(a | b)
+
+
+class ImageRefreshPolicy:
+
+    def __init__(
+            self,
+            threshold:float=0.6,
+            tool_weights:Dict[str, float]=SCENE_TOOL_WEIGHTS,
+            default_tool_weight:float=0.2,
+            text_weight:float=0.64,
+            min_text_words:int=10,
+    ):
+        """
+        Decides whether a turn changed the visible scene enough to paint a new image.
+        The score is the larger of the strongest tool that fired during the turn and the
+        weighted word distance between the last two turns, the image is regenerated
+        when the score reaches threshold. Turns whose tools only looked things up score 0.
+
+        Two narrated turns in the same place share few words, their Jaccard distance is
+        typically 0.75-0.85, while a move to a new place is 0.9 and up. The defaults need
+        a distance of about 0.94 for the text alone to repaint, see bench_image_policy.py.
+
+        Parameters:
+        threshold (float): Score needed to regenerate the image.
+        tool_weights (dict): Tool name -> scene change weight.
+        default_tool_weight (float): Weight for tools missing from tool_weights.
+        text_weight (float): Multiplier for the text distance between the last two turns.
+        min_text_words (int): Turns with fewer distinct words say too little about the scene, their text scores 0.
+        """
+        self.threshold = threshold
+        self.tool_weights = tool_weights
+        self.default_tool_weight = default_tool_weight
+        self.text_weight = text_weight
+        self.min_text_words = min_text_words
+        self.stats = {"decisions": 0, "refreshes": 0, "images_avoided": 0}
+
+    def score(self, tools_fired:List[str], previous_turn:str, current_turn:str):
+        tool_score = max((self.tool_weights.get(tool, self.default_tool_weight) for tool in tools_fired), default=0.0)
+        if tools_fired and tool_score == 0.0:
+            # a lookup (get_gold, get_inventory...) answers a question, the player stays where they are
+            return 0.0, 0.0, 0.0
+        if len(scene_words(current_turn)) < self.min_text_words:
+            text_score = 0.0
+        else:
+            text_score = self.text_weight * text_distance(previous_turn, current_turn)
+        return max(tool_score, text_score), tool_score, text_score
+
+    def should_refresh(self, tools_fired:List[str], previous_turn:str, current_turn:str, has_image:bool=True) -> bool:
+        self.stats["decisions"] += 1
+        if not has_image:
+            score, tool_score, text_score = 1.0, 0.0, 0.0
+            refresh = True
+        else:
+            score, tool_score, text_score = self.score(tools_fired, previous_turn, current_turn)
+            refresh = score >= self.threshold
+        self.stats["refreshes" if refresh else "images_avoided"] += 1
+        logger.info(
+            "image refresh %s: score=%.2f (tools=%.2f text=%.2f) threshold=%.2f tools_fired=%s images_avoided=%d",
+            "yes" if refresh else "no", score, tool_score, text_score, self.threshold,
+            tools_fired, self.stats["images_avoided"],
+        )
+        return refresh
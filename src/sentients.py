@@ -1,26 +1,234 @@
-from typing import List
+from typing import Dict, List, Optional, Union
 
-class Player:
+import numpy as np
+
+from src.inventory import Inventory
+
+STATUSES = ("normal", "poisoned", "stunned", "asleep", "charmed", "fleeing")
+KINDS = ("player", "npc", "monster")
+# groups every game has, on top of the ones named when monsters and NPCs are created
+BUILTIN_GROUPS = ("everyone", "monsters", "npcs", "party")
+
+
+class StatStore:
+
+    __slots__ = ("health", "gold", "status", "kind", "group", "live", "owners", "group_names", "_group_codes", "_free", "_size")
+
+    def __init__(self, capacity:int=64):
+        """
+        Health, gold, status and group of every entity in a game, one row (slot) per
+        entity in NumPy arrays, so an effect on a whole group is one array operation.
+        Entities read and write their row through properties. Freed slots are reused
+        and the arrays double when full, so adding an entity stays O(1).
+
+        Parameters:
+        capacity (int): Number of slots to start with.
+        """
+        self.health = np.zeros(capacity, dtype=np.int64)
+        self.gold = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.group = np.full(capacity, -1, dtype=np.int32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.owners = [None] * capacity
+        self.group_names = []
+        self._group_codes = {}
+        self._free = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size - len(self._free)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in ("health", "gold", "status", "kind", "group", "live"))
+
+    def _grow(self):
+        for column in ("health", "gold", "status", "kind", "group", "live"):
+            array = getattr(self, column)
+            setattr(self, column, np.concatenate([array, np.zeros_like(array)]))
+        self.owners += [None] * len(self.owners)
+
+    def group_code(self, group:Optional[str]) -> int:
+        if group is None:
+            return -1
+        code = self._group_codes.get(group)
+        if code is None:
+            code = self._group_codes[group] = len(self.group_names)
+            self.group_names.append(group)
+        return code
+
+    def allocate(self, owner, kind:str, health:int, gold:int, status:int=0, group:str=None) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self.health):
+                self._grow()
+            slot = self._size
+            self._size += 1
+        self.health[slot] = health
+        self.gold[slot] = gold
+        self.status[slot] = status
+        self.kind[slot] = KINDS.index(kind)
+        self.group[slot] = self.group_code(group)
+        self.live[slot] = True
+        self.owners[slot] = owner
+        return slot
+
+    def release(self, slot:int):
+        self.live[slot] = False
+        self.owners[slot] = None
+        self._free.append(slot)
+
+    def select(self, group:str) -> Optional[np.ndarray]:
+        """Slots of the live entities in group, None if there is no such group."""
+        size = self._size
+        mask = self.live[:size].copy()
+        if group == "monsters":
+            mask &= self.kind[:size] == KINDS.index("monster")
+        elif group == "npcs":
+            mask &= self.kind[:size] == KINDS.index("npc")
+        elif group == "party":
+            # the player is always in the party, NPCs join it by being created in it
+            mask &= (self.kind[:size] == KINDS.index("player")) | (self.group[:size] == self._group_codes.get("party", -2))
+        elif group != "everyone":
+            code = self._group_codes.get(group)
+            if code is None:
+                return None
+            mask &= self.group[:size] == code
+        return np.flatnonzero(mask)
+
+    def modify_health(self, slots:np.ndarray, amount:int):
+        health = self.health[slots] + amount
+        np.maximum(health, 0, out=health)
+        self.health[slots] = health
+
+    def modify_gold(self, slots:np.ndarray, amount:int):
+        self.gold[slots] += amount
+
+    def set_status(self, slots:np.ndarray, status:str):
+        self.status[slots] = STATUSES.index(status)
+
+
+class _Stat:
+    """An entity attribute kept in a StatStore column once the entity is in a game."""
+
+    def __init__(self, column:str, index:int):
+        self.column = column
+        self.index = index
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        if entity._stats is None:
+            return entity._local[self.index]
+        return int(getattr(entity._stats, self.column)[entity._slot])
+
+    def __set__(self, entity, value:int):
+        if entity._stats is None:
+            entity._local[self.index] = value
+        else:
+            getattr(entity._stats, self.column)[entity._slot] = value
+
+
+class Tracked:
+
+    __slots__ = ("id", "name", "_registry", "_stats", "_slot", "_local")
+    kind = None
+
+    health = _Stat("health", 0)
+    gold = _Stat("gold", 1)
+
+    def __init__(self, name:str, health:int=100, gold:int=0, group:str=None):
+        self.id = None
+        self.name = name
+        # set by the EntityRegistry the entity is added to
+        self._registry = None
+        self._stats = None
+        self._slot = None
+        # health, gold, status code and group until the entity is attached to a StatStore
+        self._local = [health, gold, 0, group]
+
+    @property
+    def status(self) -> str:
+        code = self._local[2] if self._stats is None else self._stats.status[self._slot]
+        return STATUSES[code]
+
+    @status.setter
+    def status(self, status:str):
+        if self._stats is None:
+            self._local[2] = STATUSES.index(status)
+        else:
+            self._stats.set_status(self._slot, status)
+
+    @property
+    def group(self) -> Optional[str]:
+        if self._stats is None:
+            return self._local[3]
+        code = self._stats.group[self._slot]
+        return None if code < 0 else self._stats.group_names[code]
+
+    def _attach(self, stats:StatStore):
+        health, gold, status, group = self._local
+        self._slot = stats.allocate(self, self.kind, health, gold, status, group)
+        self._stats = stats
+
+    def _detach(self):
+        if self._stats is not None:
+            self._local = [self.health, self.gold, int(self._stats.status[self._slot]), self.group]
+            self._stats.release(self._slot)
+            self._stats, self._slot = None, None
+
+    def _changed(self):
+        """Flag the entity as changed since the last save."""
+        if self._registry is not None:
+            self._registry.mark_dirty(self.id)
+
+
+class Player(Tracked):
+
+    __slots__ = ("inventory",)
+    kind = "player"
 
     def __init__(
             self,
-            name:str
+            name:str,
+            group:str=None,
     ):
-        self.name = name
-        self.health = 100
-        self.inventory = []
-        self.gold = 10
-        self.tools = [
+        super().__init__(name=name, health=100, gold=10, group=group)
+        self.inventory = Inventory()
+
+    @property
+    def tools(self):
+        return [
             self.get_health, 
             self.modify_health, 
             self.get_inventory, 
             self.add_to_inventory, 
             self.remove_from_inventory, 
+            self.add_items_to_inventory, 
+            self.remove_items_from_inventory, 
             self.get_gold, 
             self.modify_gold, 
             self.get_name
         ]
 
+    def to_state(self) -> dict:
+        return {"name": self.name, "health": self.health, "inventory": self.inventory.to_state(), "gold": self.gold,
+                "status": self.status, "group": self.group}
+
+    def load_state(self, state:dict):
+        self.health = state["health"]
+        self.inventory = Inventory.from_state(state["inventory"])
+        self.gold = state["gold"]
+        self.status = state.get("status", "normal")
+
+    @classmethod
+    def from_state(cls, state:dict):
+        entity = cls(name=state["name"], group=state.get("group"))
+        entity.load_state(state)
+        return entity
+
     def get_health(self:object):
         """
         <desc>Returns the amount of health the player has remaining.</desc>
@@ -41,6 +249,7 @@ class Player:
         self.health += amount
         if self.health < 0:
             self.health = 0
+        self._changed()
         return f"NerdMaster: {self.name} has {self.health} health remaining."
     
     def get_inventory(self:object):
@@ -50,37 +259,96 @@ class Player:
         Returns:
         str: A string listing the items in the player's inventory.
         """
-        inventory = '- '
-        inventory += '\n- '.join(self.inventory)
-        return f"NerdMaster: {self.name} has these items in their inventory:\n{inventory}"
+        return f"NerdMaster: {self.name} has these items in their inventory:\n{self.inventory.render()}"
     
-    def add_to_inventory(self:object, item:str):
+    def add_to_inventory(self:object, item:str, quantity:int=1):
         """
         <desc>Use this tool to add an item to the player's inventory.</desc>
 
         Args:
         str - item: The item to add to the player's inventory.
+        int - quantity: How many of the item to add.
 
         Returns:
         A message confirming the item has been added to the player's inventory.
         """
         assert isinstance(item, str), "item must be a string"
-        self.inventory.append(item)
-        return f"NerdMaster: {item} has been added to {self.name}'s inventory."
+        assert isinstance(quantity, int), "quantity must be an integer"
+        if quantity <= 0:
+            return "NerdMaster Error: quantity must be at least 1."
+        self.inventory.add(item, quantity)
+        self._changed()
+        return f"NerdMaster: {self._quantity(item, quantity)} has been added to {self.name}'s inventory."
     
-    def remove_from_inventory(self:object, item:str):
+    def remove_from_inventory(self:object, item:str, quantity:int=1):
         """
         <desc>Use this tool to remove an item from the player's inventory.</desc>
 
         Args:
         str - item: The item to remove from the player's inventory.
+        int - quantity: How many of the item to remove.
 
         Returns:
         A message confirming the item has been removed from the player's inventory.
         """
         assert isinstance(item, str), "item must be a string"
-        self.inventory.remove(item)
-        return f"NerdMaster: {item} has been removed from {self.name}'s inventory."
+        assert isinstance(quantity, int), "quantity must be an integer"
+        removed = self.inventory.remove(item, quantity)
+        if removed == 0:
+            return f"NerdMaster Error: {self.name} has no {item} in their inventory."
+        self._changed()
+        if removed < quantity:
+            return f"NerdMaster: {self.name} only had {removed} {item}, all of them have been removed from their inventory."
+        return f"NerdMaster: {self._quantity(item, removed)} has been removed from {self.name}'s inventory."
+
+    def add_items_to_inventory(self:object, items:Dict[str, int]):
+        """
+        <desc>Use this tool to add several items to the player's inventory at once, e.g. loot or a purchase.</desc>
+
+        Args:
+        Dict[str, int] - items: The items to add, mapped to how many of each.
+
+        Returns:
+        str: A message confirming the items have been added to the player's inventory.
+        """
+        added = {item: quantity for item, quantity in items.items() if quantity > 0}
+        if not added:
+            return "NerdMaster Error: no items to add."
+        for item, quantity in added.items():
+            self.inventory.add(item, quantity)
+        self._changed()
+        return f"NerdMaster: {self._listing(added)} added to {self.name}'s inventory."
+
+    def remove_items_from_inventory(self:object, items:Dict[str, int]):
+        """
+        <desc>Use this tool to remove several items from the player's inventory at once, e.g. spent supplies or a sale.</desc>
+
+        Args:
+        Dict[str, int] - items: The items to remove, mapped to how many of each.
+
+        Returns:
+        str: A message confirming which items have been removed from the player's inventory.
+        """
+        removed, missing = {}, []
+        for item, quantity in items.items():
+            count = self.inventory.remove(item, quantity)
+            if count:
+                removed[item] = count
+            if count < quantity:
+                missing.append(item)
+        if removed:
+            self._changed()
+        message = f"NerdMaster: {self._listing(removed) if removed else 'nothing'} removed from {self.name}'s inventory."
+        if missing:
+            message += f" {self.name} did not have enough of: {', '.join(missing)}."
+        return message
+
+    @staticmethod
+    def _quantity(item:str, quantity:int) -> str:
+        return item if quantity == 1 else f"{quantity} x {item}"
+
+    def _listing(self, items:Dict[str, int]) -> str:
+        return ", ".join(self._quantity(item, quantity) for item, quantity in items.items())
     
     def get_gold(self:object):
         """
@@ -103,6 +371,7 @@ class Player:
         """
         assert isinstance(amount, int), "amount must be an integer"
         self.gold += amount
+        self._changed()
         return f"NerdMaster: {self.name} now has {self.gold} gold."
     
     def get_name(self:object):
@@ -116,31 +385,58 @@ class Player:
     
 class NPC(Player):
 
+    __slots__ = ()
+    kind = "npc"
+
     def __init__(
             self,
             name:str,
-            inventory:List[str]
+            inventory:Union[List[str], Dict[str, int]],
+            group:str=None,
     ):
-        super().__init__(name=name)
-        self.inventory = inventory
+        super().__init__(name=name, group=group)
+        self.inventory = Inventory(inventory)
+
+    @classmethod
+    def from_state(cls, state:dict):
+        entity = cls(name=state["name"], inventory=None, group=state.get("group"))
+        entity.load_state(state)
+        return entity
         
     
-class Monster:
+class Monster(Tracked):
+
+    __slots__ = ("equipment",)
+    kind = "monster"
 
     def __init__(
             self,
             name:str,
-            equipment:list
+            equipment:list,
+            group:str=None,
     ):
-        self.name = name
+        super().__init__(name=name, health=100, gold=0, group=group)
         self.equipment = equipment
-        self.health = 100
-        self.tools = [
+
+    @property
+    def tools(self):
+        return [
             self.get_health, 
             self.modify_health, 
             self.get_name
         ]
 
+    def to_state(self) -> dict:
+        return {"name": self.name, "health": self.health, "equipment": list(self.equipment),
+                "status": self.status, "group": self.group}
+
+    @classmethod
+    def from_state(cls, state:dict):
+        entity = cls(name=state["name"], equipment=list(state["equipment"]), group=state.get("group"))
+        entity.health = state["health"]
+        entity.status = state.get("status", "normal")
+        return entity
+
     def get_health(self:object):
         """
         <desc>Use this tool to get the amount of health the monster has remaining.</desc>
@@ -164,6 +460,7 @@ class Monster:
         self.health += amount
         if self.health < 0:
             self.health = 0
+        self._changed()
         return f"NerdMaster: {self.name} has {self.health} health remaining."
     
     def get_name(self:object):
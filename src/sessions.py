@@ -0,0 +1,367 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from src.agent import NerdMasterAgent, DEFAULT_NARRATIVE
+from src.bootstrap import bootstrap_game
+from src.cassette import Cassette, CassetteCallbackHandler, recording_client_provider
+from src.clients import ClientProvider
+from src.game import PER_ENTITY_TOOLS
+from src.persistence import GameSave
+from src.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_LENGTH = 32
+
+
+def resident_set_bytes() -> int:
+    """Current resident set size of this process, the peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return peak if peak > 1 << 32 else peak * 1024
+
+
+class Session:
+
+    __slots__ = ("agent", "last_used", "pins", "recorder")
+
+    def __init__(self, agent:NerdMasterAgent, recorder:Tuple[Cassette, ClientProvider]=None):
+        self.agent = agent
+        self.last_used = time.monotonic()
+        self.pins = 0
+        # (cassette, client provider) when the session is being recorded
+        self.recorder = recorder
+
+    def close(self):
+        self.agent.close()
+        if self.recorder is not None:
+            cassette, provider = self.recorder
+            provider.close()
+            cassette.close()
+
+
+class SessionManager:
+
+    def __init__(
+            self,
+            directory:str="./saves",
+            max_sessions:int=32,
+            max_resident_bytes:int=None,
+            max_idle_seconds:float=None,
+            agent_class:type=NerdMasterAgent,
+            agent_kwargs:dict=None,
+            artifact_timeout:float=60.0,
+            cassette_dir:str=None,
+    ):
+        """
+        Owns every game in the process by session id.
+        Recently used sessions stay in memory, the least recently used are saved and
+        dropped once there are more than max_sessions, the process uses more than
+        max_resident_bytes, or they have been idle for max_idle_seconds. Evictions wait for
+        the session's image and speech and save it, so they run on a background worker and
+        requests only queue a budget check, the budget can be exceeded while it runs.
+        Evicted sessions are restored from their GameSave on their next request, without
+        any API calls. Sessions in use (see session()) are never evicted.
+
+        Parameters:
+        directory (str): Directory for the per-session saves.
+        max_sessions (int): Most sessions held in memory.
+        max_resident_bytes (int): Resident set budget for the process, None for no limit.
+        max_idle_seconds (float): Evict sessions unused for this long, None to keep them.
+        agent_class (type): Agent class to create and restore.
+        agent_kwargs (dict): Extra keyword arguments for every agent, e.g. shared caches.
+        artifact_timeout (float): How long eviction waits for a session's image and speech.
+        cassette_dir (str): Record every session's API traffic to <session id>.cassette here, see src/cassette.py.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_sessions = max_sessions
+        self.max_resident_bytes = max_resident_bytes
+        self.max_idle_seconds = max_idle_seconds
+        self.agent_class = agent_class
+        self.agent_kwargs = agent_kwargs or {}
+        self.artifact_timeout = artifact_timeout
+        self.cassette_dir = Path(cassette_dir) if cassette_dir else None
+        if self.cassette_dir is not None:
+            self.cassette_dir.mkdir(parents=True, exist_ok=True)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._on_disk = {path.name for path in self.directory.iterdir() if (path / "snapshot.bin").exists()}
+        self._lock = threading.Lock()
+        # session id -> event set once its eviction save is complete
+        self._evicting: Dict[str, threading.Event] = {}
+        # session id -> event set once it is back in memory (or failed to load)
+        self._restoring: Dict[str, threading.Event] = {}
+        self.stats = {"created": 0, "hits": 0, "restored": 0, "evicted": 0}
+        self._evictor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evict")
+        # a budget check is queued on the evictor and hasn't started yet
+        self._budget_queued = False
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id:str):
+        return session_id in self._sessions or session_id in self._on_disk
+
+    def _save_for(self, session_id:str) -> GameSave:
+        return GameSave(self.directory / session_id)
+
+    def _recorder(self, session_id:str, meta:dict=None):
+        """Agent kwargs that record the session into its cassette, and the (cassette, provider) to close."""
+        if self.cassette_dir is None:
+            return {}, None
+        cassette = Cassette(self.cassette_dir / f"{session_id}.cassette", meta=meta)
+        provider = recording_client_provider(cassette)
+        callbacks = list(self.agent_kwargs.get("callbacks") or []) + [CassetteCallbackHandler(cassette)]
+        # a response served from the shared caches never reaches the transport, so it would be
+        # missing from the cassette and every later response in the replay would be off by one
+        return {"client_provider": provider, "callbacks": callbacks, "caching": False}, (cassette, provider)
+
+    def _valid(self, session_id:str) -> bool:
+        # ids end up in paths, only accept the ones we hand out
+        return isinstance(session_id, str) and len(session_id) == SESSION_ID_LENGTH and session_id.isalnum()
+
+    def create(
+            self,
+            player_name:str,
+            game_world_narrative:str=DEFAULT_NARRATIVE,
+    ) -> Tuple[str, NerdMasterAgent]:
+        """Start a new game, returns its session id and agent."""
+        session_id = uuid.uuid4().hex
+        kwargs = dict(self.agent_kwargs)
+        if self.cassette_dir is not None:
+            # a known seed, so a replay of the cassette rolls the same dice
+            kwargs.setdefault("seed", random.getrandbits(63))
+        recording, recorder = self._recorder(session_id, meta={
+            "player_name": player_name,
+            "narrative": game_world_narrative,
+            "tool_mode": kwargs.get("tool_mode", PER_ENTITY_TOOLS),
+            "seed": kwargs.get("seed"),
+            "caching": False,
+        })
+        agent = bootstrap_game(
+            player_name,
+            game_world_narrative=game_world_narrative,
+            agent_class=self.agent_class,
+            game_save=self._save_for(session_id),
+            **{**kwargs, **recording},
+        )
+        with self._lock:
+            self._sessions[session_id] = Session(agent, recorder)
+            self._on_disk.add(session_id)
+            self.stats["created"] += 1
+        get_tracer().count("sessions_created_total")
+        self._schedule_budget()
+        return session_id, agent
+
+    def _acquire(self, session_id:str, pin:bool) -> Optional[NerdMasterAgent]:
+        if not self._valid(session_id):
+            return None
+        while True:
+            with self._lock:
+                # still being saved, restoring now would read a stale save, or already being restored
+                waiting = self._evicting.get(session_id) or self._restoring.get(session_id)
+                if waiting is None:
+                    session = self._sessions.get(session_id)
+                    if session is not None:
+                        self._sessions.move_to_end(session_id)
+                        self.stats["hits"] += 1
+                        session.last_used = time.monotonic()
+                        session.pins += pin
+                        break
+                    if session_id not in self._on_disk:
+                        return None
+                    restoring = self._restoring[session_id] = threading.Event()
+            if waiting is not None:
+                waiting.wait()
+                continue
+            # restored outside the lock, other sessions' requests carry on meanwhile
+            try:
+                session = self._restore(session_id)
+            except BaseException:
+                with self._lock:
+                    self._restoring.pop(session_id)
+                restoring.set()
+                raise
+            with self._lock:
+                self._restoring.pop(session_id)
+                deleted = session_id not in self._on_disk
+                if not deleted:
+                    self._sessions[session_id] = session
+                    self.stats["restored"] += 1
+                    session.pins += pin
+            restoring.set()
+            if deleted:
+                session.close()
+                return None
+            get_tracer().count("sessions_restored_total")
+            break
+        self._schedule_budget()
+        return session.agent
+
+    def _restore(self, session_id:str) -> Session:
+        recording, recorder = self._recorder(session_id)
+        try:
+            with get_tracer().span("session_restore"):
+                agent = self.agent_class.restore(self._save_for(session_id), **{**self.agent_kwargs, **recording})
+        except BaseException:
+            if recorder is not None:
+                cassette, provider = recorder
+                provider.close()
+                cassette.close()
+            raise
+        return Session(agent, recorder)
+
+    def get(self, session_id:str) -> Optional[NerdMasterAgent]:
+        """The session's agent, restored from disk if it was evicted, None for unknown ids."""
+        return self._acquire(session_id, pin=False)
+
+    @contextmanager
+    def session(self, session_id:str):
+        """
+        Use a session's agent for the block, it won't be evicted until the block ends.
+        Yields None for unknown ids.
+        """
+        agent = self._acquire(session_id, pin=True)
+        try:
+            yield agent
+        finally:
+            if agent is not None:
+                with self._lock:
+                    session = self._sessions.get(session_id)
+                    if session is not None:
+                        session.pins -= 1
+                        session.last_used = time.monotonic()
+
+    def evict(self, session_id:str) -> bool:
+        """Save the session and drop it from memory, it is restored on its next request."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.pins > 0 or session_id in self._evicting:
+                return False
+            del self._sessions[session_id]
+            done = self._evicting[session_id] = threading.Event()
+        try:
+            agent = session.agent
+            # the image and speech of the last turn belong in the save
+            agent.wait_for_artifacts(timeout=self.artifact_timeout)
+            agent.save()
+            session.close()
+        finally:
+            with self._lock:
+                self._evicting.pop(session_id)
+                self.stats["evicted"] += 1
+            done.set()
+        get_tracer().count("sessions_evicted_total")
+        logger.info("evicted session %s, %d sessions resident", session_id, len(self._sessions))
+        return True
+
+    def delete(self, session_id:str):
+        """Forget a session entirely, including its save."""
+        if not self._valid(session_id):
+            return
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            self._on_disk.discard(session_id)
+        if session is not None:
+            session.close()
+        shutil.rmtree(self.directory / session_id, ignore_errors=True)
+        self._update_gauges()
+
+    def _candidates(self):
+        # least recently used first
+        return [sid for sid, session in self._sessions.items() if session.pins == 0]
+
+    def _enforce_budget(self):
+        with self._lock:
+            evict = []
+            candidates = self._candidates()
+            if self.max_idle_seconds is not None:
+                now = time.monotonic()
+                evict += [sid for sid in candidates if now - self._sessions[sid].last_used > self.max_idle_seconds]
+            over = len(self._sessions) - len(evict) - self.max_sessions
+            remaining = [sid for sid in candidates if sid not in evict]
+            if over > 0:
+                evict += remaining[:over]
+                remaining = remaining[over:]
+            if self.max_resident_bytes is not None and remaining:
+                rss = resident_set_bytes()
+                if rss > self.max_resident_bytes:
+                    # freed memory isn't visible in the RSS straight away, so evict in proportion to the excess
+                    # rather than one at a time until the number drops
+                    share = 1 - self.max_resident_bytes / rss
+                    evict += remaining[:max(1, round(len(self._sessions) * share))]
+        for session_id in evict:
+            self.evict(session_id)
+        self._update_gauges()
+
+    def _schedule_budget(self):
+        # evicting another session's game can take a while, the request only queues the check
+        with self._lock:
+            if self._budget_queued:
+                return
+            self._budget_queued = True
+        self._evictor.submit(self._run_budget)
+
+    def _run_budget(self):
+        with self._lock:
+            self._budget_queued = False
+        try:
+            self._enforce_budget()
+        except Exception:
+            logger.exception("enforcing the session budget failed")
+
+    def evict_idle(self):
+        """Apply the budgets now, e.g. from a periodic job."""
+        self._enforce_budget()
+
+    def _update_gauges(self):
+        tracer = get_tracer()
+        tracer.gauge("sessions_resident", len(self._sessions))
+        tracer.gauge("sessions_on_disk", len(self._on_disk))
+        tracer.gauge("process_resident_bytes", resident_set_bytes())
+
+    def close(self):
+        """Save and drop every resident session."""
+        self._evictor.shutdown(wait=True)
+        for session_id in list(self._sessions):
+            self.evict(session_id)
+
+
+_DEFAULT_MANAGER = None
+_DEFAULT_MANAGER_LOCK = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """
+    The process-wide session manager, created on first use.
+    NERDMASTER_SAVE_DIR, NERDMASTER_MAX_SESSIONS, NERDMASTER_MAX_RSS_MB,
+    NERDMASTER_MAX_IDLE_SECONDS and NERDMASTER_CASSETTE_DIR configure it.
+    """
+    global _DEFAULT_MANAGER
+    with _DEFAULT_MANAGER_LOCK:
+        if _DEFAULT_MANAGER is None:
+            max_rss = os.getenv("NERDMASTER_MAX_RSS_MB")
+            max_idle = os.getenv("NERDMASTER_MAX_IDLE_SECONDS")
+            _DEFAULT_MANAGER = SessionManager(
+                directory=os.getenv("NERDMASTER_SAVE_DIR", "./saves"),
+                max_sessions=int(os.getenv("NERDMASTER_MAX_SESSIONS", "32")),
+                max_resident_bytes=int(max_rss) * 1024 * 1024 if max_rss else None,
+                max_idle_seconds=float(max_idle) if max_idle else None,
+                cassette_dir=os.getenv("NERDMASTER_CASSETTE_DIR"),
+            )
+        return _DEFAULT_MANAGER
@@ -0,0 +1,306 @@
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Tuple
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# seconds, the same spread as the prometheus client defaults plus the slow image calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span: ContextVar = ContextVar("nerdmaster_span", default=None)
+
+
+def _label_key(labels:dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key:Tuple, extra:dict=None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{str(v)}"'.replace("\n", " ") for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Span:
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "labels", "start", "duration", "status", "_clock")
+
+    def __init__(self, name:str, parent:"Span"=None, attributes:dict=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes or {}
+        self.labels = {}
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class JsonlExporter:
+
+    def __init__(self, path:str, flush_every:int=50):
+        """
+        Appends finished spans to a JSONL file, buffered so the hot path only appends to a list.
+        Whatever is still buffered is written at interpreter exit.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+        self._buffer = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def export(self, span:Span):
+        with self._lock:
+            self._buffer.append(span.to_dict())
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(record) + "\n" for record in self._buffer))
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+
+class Tracer:
+
+    def __init__(self, exporter:JsonlExporter=None, buckets:Tuple[float, ...]=DEFAULT_BUCKETS):
+        """
+        Spans around the work of a turn plus counters, gauges and latency histograms.
+        Every finished span is observed in the <name>_seconds histogram, and is written
+        out by the exporter if there is one. The current span is kept in a context variable,
+        so child spans on other threads need the work submitted with submit().
+        """
+        self.exporter = exporter
+        self.buckets = buckets
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.gauges: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, list]] = {}
+        self._lock = threading.Lock()
+
+    def start_span(self, name:str, parent:Span=None, labels:dict=None, **attributes) -> Span:
+        """Start a span without making it current, for work whose start and end arrive as separate events."""
+        span = Span(name, parent if parent is not None else _current_span.get(), {**(labels or {}), **attributes})
+        span.labels = labels or {}
+        return span
+
+    def end_span(self, span:Span, error:BaseException=None):
+        span.duration = time.perf_counter() - span._clock
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = type(error).__name__
+        self.observe(f"{span.name}_seconds", span.duration, status=span.status, **span.labels)
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name:str, labels:dict=None, **attributes):
+        """
+        Time the block as a child of the current span.
+        labels become labels of the <name>_seconds histogram, so keep them low-cardinality,
+        attributes only go to the trace file.
+        """
+        span = self.start_span(name, labels=labels, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _current_span.reset(token)
+            self.end_span(span, e)
+            raise
+        _current_span.reset(token)
+        self.end_span(span)
+
+    @contextmanager
+    def use_span(self, span:Span):
+        """Make an already started span current for the block, without ending it."""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def current_span(self) -> Span:
+        return _current_span.get()
+
+    def count(self, name:str, value:float=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def gauge(self, name:str, value:float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name:str, value:float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            # per bucket counts, then sum and count
+            histogram = series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format, prefixed with nerdmaster_."""
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# TYPE nerdmaster_{name} {kind}")
+                    lines += [f"nerdmaster_{name}{_format_labels(key)} {value}" for key, value in series.items()]
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE nerdmaster_{name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram):
+                        cumulative += count
+                        lines.append(f"nerdmaster_{name}_bucket{_format_labels(key, {'le': str(bound)})} {cumulative}")
+                    lines.append(f"nerdmaster_{name}_bucket{_format_labels(key, {'le': '+Inf'})} {histogram[-1]}")
+                    lines.append(f"nerdmaster_{name}_sum{_format_labels(key)} {histogram[-2]}")
+                    lines.append(f"nerdmaster_{name}_count{_format_labels(key)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port:int=9100, host:str="127.0.0.1") -> ThreadingHTTPServer:
+        """Serve prometheus_text() on http://host:port/metrics from a daemon thread."""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info("serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+        return server
+
+    def flush(self):
+        if self.exporter is not None:
+            self.exporter.flush()
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Spans and token counters for the agent's LLM calls, from langchain callbacks."""
+
+    def __init__(self, tracer:Tracer=None):
+        self.tracer = tracer
+        self._spans = {}
+        # set by the agent for the turn, callbacks may run outside the turn's context
+        self._parent = None
+
+    def _tracer(self):
+        return self.tracer or get_tracer()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = kwargs.get("invocation_params", {}).get("model_name", "unknown")
+        self._spans[run_id] = self._tracer().start_span(
+            "llm", parent=self._parent, labels={"model": model}, messages=sum(len(batch) for batch in messages))
+
+    def _finish(self, run_id, error:BaseException=None):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self._tracer().end_span(span, error)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        model = (response.llm_output or {}).get("model_name", "unknown")
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                self._tracer().count("llm_tokens_total", usage[f"{kind}_tokens"], model=model, kind=kind)
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+
+def submit(executor:Executor, fn, *args, **kwargs) -> Future:
+    """executor.submit that carries the current span over, so work on the pool joins the caller's trace."""
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+
+_DEFAULT_TRACER = None
+_DEFAULT_TRACER_LOCK = threading.Lock()
+
+
+def _tracer_from_env() -> Tracer:
+    port = os.getenv("NERDMASTER_METRICS_PORT")
+    return configure_tracing(os.getenv("NERDMASTER_TRACE_FILE"), int(port) if port else None, install=False)
+
+
+def configure_tracing(trace_path:str=None, metrics_port:int=None, install:bool=True) -> Tracer:
+    """Build a tracer, optionally writing spans to trace_path and serving /metrics, and make it the process-wide one."""
+    global _DEFAULT_TRACER
+    tracer = Tracer(exporter=JsonlExporter(trace_path) if trace_path else None)
+    if metrics_port:
+        tracer.serve_metrics(metrics_port)
+    if install:
+        with _DEFAULT_TRACER_LOCK:
+            if _DEFAULT_TRACER is not None:
+                _DEFAULT_TRACER.flush()
+            _DEFAULT_TRACER = tracer
+    return tracer
+
+
+def get_tracer() -> Tracer:
+    """
+    The process-wide tracer, created on first use.
+    NERDMASTER_TRACE_FILE and NERDMASTER_METRICS_PORT turn on the JSONL export and the /metrics endpoint.
+    """
+    global _DEFAULT_TRACER
+    with _DEFAULT_TRACER_LOCK:
+        if _DEFAULT_TRACER is None:
+            _DEFAULT_TRACER = _tracer_from_env()
+        return _DEFAULT_TRACER
@@ -1,29 +1,82 @@
 from typing import Callable
+from functools import wraps
+from inspect import Parameter, signature
+import re
 from langchain.tools import StructuredTool
 from langchain.pydantic_v1 import Field, create_model
+from src.tracing import get_tracer
 
-def create_tool(callable:Callable):
-    method = callable
-    args = {k:v for k,v in method.__annotations__.items() if k != "self"}
-    name = method.__name__
-    doc = method.__doc__
-    func_desc = doc[doc.find("<desc>") + len("<desc>"):doc.find("</desc>")]
+DESC_PATTERN = re.compile(r"<desc>(.*?)</desc>", re.DOTALL)
+
+# compiled (name, description, args schema) per unbound function, shared by every instance
+_SCHEMA_CACHE = dict()
+_ENCODINGS = dict()
+
+def _get_encoding(encoding_name:str):
+    if encoding_name not in _ENCODINGS:
+        try:
+            import tiktoken
+            _ENCODINGS[encoding_name] = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            # tiktoken missing or its encoding files can't be fetched (offline)
+            _ENCODINGS[encoding_name] = None
+    return _ENCODINGS[encoding_name]
+
+def count_tokens(text:str, encoding_name:str="cl100k_base"):
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        # rough estimate of ~4 characters per token
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def _parse_docstring(doc:str, args:list):
+    match = DESC_PATTERN.search(doc)
+    func_desc = match.group(1) if match else ""
     arg_desc = dict()
-    for arg in args.keys():
-        desc = doc[doc.find(f"{arg}: ")+len(f"{arg}: "):]
-        desc = desc[:desc.find("\n")]
-        arg_desc[arg] = desc
+    for arg in args:
+        match = re.search(rf"\b{re.escape(arg)}: (.*)", doc)
+        arg_desc[arg] = match.group(1) if match else ""
+    return func_desc, arg_desc
+
+def compile_tool_schema(callable:Callable):
+    function = getattr(callable, "__func__", callable)
+    compiled = _SCHEMA_CACHE.get(function)
+    if compiled is not None:
+        return compiled
+    args = {k:v for k,v in function.__annotations__.items() if k not in ("self", "return")}
+    name = function.__name__
+    func_desc, arg_desc = _parse_docstring(function.__doc__, list(args.keys()))
+    parameters = signature(function).parameters
     arg_fields = dict()
     for k,v in args.items():
-        arg_fields[k] = (v, Field(description=arg_desc[k]))
+        # arguments with a default are optional for the model, the rest are required (...)
+        default = parameters[k].default if k in parameters else Parameter.empty
+        arg_fields[k] = (v, Field(... if default is Parameter.empty else default, description=arg_desc[k]))
 
     Model = create_model('Model', **arg_fields)
+    # same description StructuredTool.from_function would build, minus the per-call signature inspection
+    description = f"{name}{signature(callable)} - {func_desc.strip()}"
+    compiled = (name, description, Model)
+    _SCHEMA_CACHE[function] = compiled
+    return compiled
+
+def clear_tool_schema_cache():
+    _SCHEMA_CACHE.clear()
 
-    tool = StructuredTool.from_function(
-        func=method,
+def _traced(name:str, callable:Callable):
+    @wraps(callable)
+    def run(*args, **kwargs):
+        with get_tracer().span("tool", labels={"tool": name}):
+            return callable(*args, **kwargs)
+    return run
+
+def create_tool(callable:Callable):
+    name, description, Model = compile_tool_schema(callable)
+    tool = StructuredTool(
+        func=_traced(name, callable),
         name=name,
-        description=func_desc,
+        description=description,
         args_schema=Model,
         return_direct=False,
     )
-    return tool
\ No newline at end of file
+    return tool
@@ -0,0 +1,25 @@
+import threading
+
+import httpx
+
+from src.clients import ClientProvider
+
+
+def test_close_stops_the_event_loop_thread():
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True}))
+    baseline = threading.active_count()
+    for _ in range(20):
+        provider = ClientProvider(api_key="test", transport=transport, async_transport=transport)
+        response = provider.run_async(provider.async_http_client.get("https://api.test/v1/models")).result()
+        assert response.json() == {"ok": True}
+        loop = provider.loop
+        provider.close()
+        assert loop.is_closed()
+        assert provider.async_http_client.is_closed
+    assert threading.active_count() == baseline
+
+
+def test_close_without_async_use():
+    provider = ClientProvider(api_key="test")
+    provider.close()
+    assert provider.http_client.is_closed
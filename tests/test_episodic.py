@@ -0,0 +1,65 @@
+import numpy as np
+
+from src.episodic import EpisodicMemory, HashingEmbedder
+
+
+class CountingEmbedder(HashingEmbedder):
+
+    def __init__(self):
+        super().__init__()
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+EVENTS = [f"Human: I fight goblin {i}.\nAI: Goblin {i} drops {i % 5} coins by the {['well', 'gate', 'tower'][i % 3]}.\n"
+          for i in range(50)]
+
+
+def test_reload_maps_vectors_without_embedding(tmp_path):
+    memory = EpisodicMemory(path=tmp_path)
+    memory.extend(EVENTS)
+    expected = memory.search("coins by the tower", k=3, exclude_last=4)
+
+    embedder = CountingEmbedder()
+    reloaded = EpisodicMemory(embedder=embedder, path=tmp_path)
+    assert len(reloaded) == len(EVENTS)
+    assert embedder.embedded == 0
+    assert isinstance(reloaded._vectors(), np.memmap)
+    assert reloaded.search("coins by the tower", k=3, exclude_last=4) == expected
+
+
+def test_matches_in_memory_search(tmp_path):
+    persisted, in_memory = EpisodicMemory(path=tmp_path), EpisodicMemory()
+    for event in EVENTS:
+        persisted.add(event)
+        in_memory.add(event)
+    for query in ("goblin 7", "coins by the gate", "well"):
+        assert persisted.search(query, k=4, exclude_last=2) == in_memory.search(query, k=4, exclude_last=2)
+
+
+def test_load_embeds_only_events_missing_vectors(tmp_path):
+    memory = EpisodicMemory(path=tmp_path)
+    memory.extend(EVENTS[:40])
+    # a crash part way through appending the vectors of the last three events
+    with open(memory.vectors_path, "r+b") as file:
+        file.truncate((40 - 3) * memory.embedder.dim * 4 + 7)
+
+    embedder = CountingEmbedder()
+    reloaded = EpisodicMemory(embedder=embedder, path=tmp_path)
+    assert embedder.embedded == 3
+    assert len(reloaded) == 40
+    assert reloaded.search("goblin 38", k=1) == [EVENTS[38]]
+
+
+def test_sync_truncates_and_extends(tmp_path):
+    memory = EpisodicMemory(path=tmp_path)
+    memory.extend(EVENTS[:10])
+    memory.sync(EVENTS[:8])
+    assert memory.events == EVENTS[:8]
+    memory.sync(EVENTS[:12])
+    reloaded = EpisodicMemory(path=tmp_path)
+    assert reloaded.events == EVENTS[:12]
+    assert reloaded.search("goblin 11", k=1) == [EVENTS[11]]
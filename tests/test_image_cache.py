@@ -0,0 +1,44 @@
+import threading
+
+from src.image_cache import ImageCache
+
+
+def test_lookup_while_stores_evict(tmp_path):
+    # room for two images, so every store evicts one another thread may be reading
+    cache = ImageCache(tmp_path, max_bytes=2 * 4096, similarity_threshold=2.0)
+    prompts = [f"a goblin camp at dusk, view {i}" for i in range(8)]
+    errors = []
+    done = threading.Event()
+
+    def look():
+        try:
+            while not done.is_set():
+                for prompt in prompts:
+                    result = cache.lookup(prompt)
+                    if result is not None:
+                        assert len(result[0]) == 4096
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=look) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for _ in range(20):
+            for prompt in prompts:
+                cache.store(prompt, b"x" * 4096, seconds=1.0)
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+    assert errors == []
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = ImageCache(tmp_path)
+    key = cache.store("a dragon over the castle", b"image", seconds=1.0)
+    (tmp_path / f"{key}.bin").unlink()
+    assert cache.lookup("a dragon over the castle") is None
+    assert key not in cache.entries
+    assert cache.total_bytes == 0
+    assert cache.stats["misses"] == 1
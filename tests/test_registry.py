@@ -0,0 +1,34 @@
+import threading
+
+from src.registry import EntityRegistry
+from src.sentients import Monster
+
+
+def test_changes_survive_concurrent_drains():
+    # a save drains on the artifact thread while tools add and remove entities on the request thread
+    registry = EntityRegistry()
+    count = 20000
+    dirty, removed = set(), set()
+    done = threading.Event()
+
+    def drain():
+        while not done.is_set():
+            changed, gone = registry.drain_changes()
+            dirty.update(changed)
+            removed.update(gone)
+
+    drainer = threading.Thread(target=drain)
+    drainer.start()
+    try:
+        ids = [registry.add(Monster(f"Goblin {i}", ["club"]), "monster") for i in range(count)]
+        for entity_id in ids[::2]:
+            registry.remove(entity_id)
+    finally:
+        done.set()
+        drainer.join()
+    changed, gone = registry.drain_changes()
+    dirty.update(changed)
+    removed.update(gone)
+
+    assert dirty | removed == set(ids)
+    assert removed >= set(ids[::2])
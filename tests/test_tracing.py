@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import src.tracing
+from src.agent import NerdMasterAgent
+from src.mocks import mock_agent_kwargs
+from src.tracing import configure_tracing
+
+
+def read_spans(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_agent_close_writes_every_span(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.tracing, "_DEFAULT_TRACER", None)
+    tracer = configure_tracing(str(tmp_path / "trace.jsonl"))
+    agent = NerdMasterAgent(**mock_agent_kwargs(script=["The tavern is quiet."], audio_dir=str(tmp_path / "audio")),
+                            caching=False)
+    try:
+        agent.invoke("I look around.", background=False)
+    finally:
+        agent.close()
+
+    spans = read_spans(tmp_path / "trace.jsonl")
+    finished = sum(histogram[-1] for name, series in tracer.histograms.items() if name.endswith("_seconds")
+                   for histogram in series.values())
+    assert 0 < len(spans) < tracer.exporter.flush_every
+    assert len(spans) == finished
+    assert "turn" in {span["name"] for span in spans}
+
+
+def test_buffered_spans_are_written_at_exit(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    script = textwrap.dedent(f"""
+        from src.tracing import configure_tracing
+        tracer = configure_tracing({str(path)!r})
+        for i in range(3):
+            with tracer.span("step", index=i):
+                pass
+    """)
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert [span["attributes"]["index"] for span in read_spans(path)] == [0, 1, 2]
@@ -3,43 +3,102 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 from webapp.frontend import set_layout
+from src.sessions import get_session_manager
 
 
-def show_history():
-    history = st.session_state["agent"].get_last_response()
+def show_history(agent):
+    history = agent.get_last_response()
     container = st.container(border=True)
     container.subheader("Narrator:")
     container.write(history.replace("AI: ",""))
 
-def player_choice():
+def stream_response(agent, user_input:str):
+    status = st.status("The NerdMaster is thinking...")
+    container = st.container(border=True)
+    container.subheader("Narrator:")
+
+    def tokens():
+        for event in agent.stream(user_input):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "tool_start":
+                status.write(f"Using {event['name']}...")
+        status.update(label="The NerdMaster has spoken.", state="complete")
+
+    container.write_stream(tokens())
+
+def player_choice(agent):
     container = st.container(border=True)
     container.text_area("Player: ", key="player_input")
     if st.button("Send", key="send", use_container_width=True):
-        st.session_state["agent"].invoke(st.session_state["player_input"])
+        stream_response(agent, st.session_state["player_input"])
         st.session_state["new_response"] = True
         st.rerun()
 
-def show_image():
-    img = st.session_state["agent"].get_image()
+def image_placeholder():
     container = st.container(border=True)
-    container.image(img, use_column_width=True)
+    return container.empty()
+
+def show_image(agent, placeholder):
+    img = agent.get_image()
+    if agent.artifact_status("image") == "pending":
+        # show the previous scene (if any) while the new one is being painted
+        if img is not None:
+            placeholder.image(img.display, use_column_width=True)
+        with st.spinner("Painting the scene..."):
+            try:
+                img = agent.wait_for_image()
+            except Exception:
+                # keep showing the previous scene, the next turn paints a new one
+                img = agent.get_image()
+    if img is not None:
+        # already encoded, streamlit sends the bytes as they are
+        placeholder.image(img.display, use_column_width=True)
 
-def play_narration():
-    st.session_state["agent"].narrate_last_response()
+def play_narration(agent, timeout:float=30.0):
+    if agent.narrator.playback == "browser":
+        # a restored game has no speech until its next turn
+        speech = agent.get_artifact("speech")
+        if speech is None:
+            return
+        with st.spinner("Preparing the narration..."):
+            try:
+                # st.audio needs the whole file, bounded so a slow synthesis can't hang the page
+                audio = speech.result(timeout=timeout)
+            except Exception:
+                audio = None
+        if audio:
+            st.audio(audio, format="audio/mp3")
+    elif st.session_state.get("new_response"):
+        # plays on a background thread, the page is not held up
+        agent.narrate_last_response()
     st.session_state["new_response"] = False
         
 
 def page_title():
     st.title("NerdMaster")
 
+def get_session_id():
+    # the id is also in the url, so a reload or a server restart picks the game back up
+    session_id = st.session_state.get("session_id") or st.query_params.get("session")
+    if session_id is not None:
+        st.session_state["session_id"] = session_id
+        st.query_params["session"] = session_id
+    return session_id
+
 def main():
     set_layout()
     page_title()
-    show_image()
-    if st.session_state["new_response"]:
-        play_narration()
-    show_history()
-    player_choice()
+    # the agent lives in the session manager, which may have saved it to disk since the last request
+    with get_session_manager().session(get_session_id()) as agent:
+        if agent is None:
+            st.switch_page("pages/setup_game.py")
+        placeholder = image_placeholder()
+        show_history(agent)
+        player_choice(agent)
+        # the narrative is already on screen, the image and speech arrive as they finish
+        show_image(agent, placeholder)
+        play_narration(agent)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,8 +3,8 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 from webapp.frontend import set_layout
-from src.agent import NerdMasterAgent
 from src.agent import DEFAULT_NARRATIVE
+from src.sessions import get_session_manager
 
 def main():
     set_layout()
@@ -14,13 +14,15 @@ def main():
     st.text_area("Enter the game world narrative:", key="game_world_narrative", value=DEFAULT_NARRATIVE)
     if len(st.session_state["player_name"]) > 0 and len(st.session_state["game_world_narrative"])>0:
         if st.button("Start Game!", use_container_width=True):
+            # only waits for the opening narrative, the world image and narration finish on the game page
             with st.spinner("Setting up game..."):
-                st.session_state["agent"] = NerdMasterAgent(
+                session_id, _ = get_session_manager().create(
+                    player_name = st.session_state["player_name"],
                     game_world_narrative = st.session_state["game_world_narrative"]
                 )
-                st.session_state["agent"].invoke(f"Hi, my character is called {st.session_state['player_name']} and I want to play your game.")
+                st.session_state["session_id"] = session_id
+                st.query_params["session"] = session_id
                 st.session_state["new_response"]=True
-                st.session_state["image"] = st.session_state["agent"].generate_world_image()
                 st.switch_page("pages/game.py")
     else:
         st.warning("Please enter your name and game world narrative to start the game.")